@@ -40,6 +40,8 @@ pyinstaller ^
 
 echo.
 if exist dist\ZGIRC_TimeSync.exe (
+    REM 生成版本清单，客户端据此判断是否需要下载新版本
+    python tools\make_manifest.py dist\ZGIRC_TimeSync.exe
     echo ========================================
     echo    打包完成！
     echo ========================================
@@ -48,8 +50,9 @@ if exist dist\ZGIRC_TimeSync.exe (
     echo 文件大小: %~za
     echo.
     echo 下一步操作:
-    echo 1. 上传到GitHub Releases
-    echo 2. 测试EXE功能
+    echo 1. 如有旧版本，运行 python tools\make_delta.py releases\旧版本.exe 生成差分补丁
+    echo 2. 将 dist\ZGIRC_TimeSync.exe、dist\version.json 和 dist\patches 一起上传
+    echo 3. 测试EXE功能
     echo.
     if exist dist\ZGIRC_TimeSync.exe (
         echo 按任意键打开目录...
@@ -23,7 +23,7 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'zgirc-time-sync=time:main',
+            'zgirc-time-sync=zgirc_timesync.app:main',
         ],
     },
     data_files=[
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+pytest公共配置
+测试与基准脚本共用tools/中的替身服务器和假时钟（harness.py、fake_ntp_server.py）
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+TOOLS_DIR = Path(__file__).resolve().parent.parent / "tools"
+if str(TOOLS_DIR) not in sys.path:
+    sys.path.insert(0, str(TOOLS_DIR))
+
+from harness import load_app_module    # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    return load_app_module()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+LinuxClock：用假的adjtimex检查跳变（纳秒）、平滑调整（微秒）和频率校正（2^-16 ppm）的单位
+"""
+
+import pytest
+
+from harness import FakeAdjtimex
+
+
+class RecordingAdjtimex:
+    """
+    记录每次调用时timex结构体的原始字段
+    """
+    
+    def __init__(self, freq=0):
+        self.calls = []
+        self.freq = freq
+    
+    def __call__(self, timex):
+        if timex.modes == 0:
+            timex.freq = self.freq
+        self.calls.append({name: getattr(timex, name)
+                           for name in ("modes", "offset", "freq", "time_sec", "time_usec")})
+        return 0
+
+
+@pytest.fixture
+def raw(app_module):
+    adjtimex = RecordingAdjtimex()
+    return app_module.LinuxClock(adjtimex=adjtimex), adjtimex
+
+
+def test_step_uses_nanoseconds(app_module, raw):
+    clock, adjtimex = raw
+    clock.step(1.25)
+    cancel, step = adjtimex.calls
+    # 先取消未完成的平滑调整
+    assert cancel["modes"] == app_module.ADJ_OFFSET_SINGLESHOT and cancel["offset"] == 0
+    assert step["modes"] == app_module.ADJ_SETOFFSET | app_module.ADJ_NANO
+    assert (step["time_sec"], step["time_usec"]) == (1, 250_000_000)
+
+
+def test_negative_step_normalizes_nanoseconds(app_module, raw):
+    clock, adjtimex = raw
+    clock.step(-0.3)
+    # 内核要求time_usec在[0, 1e9)之间，负偏差表示为 -1秒 + 7亿纳秒
+    assert (adjtimex.calls[-1]["time_sec"], adjtimex.calls[-1]["time_usec"]) == (-1, 700_000_000)
+
+
+def test_slew_uses_microseconds(app_module, raw):
+    clock, adjtimex = raw
+    duration = clock.slew(-0.0125)
+    assert adjtimex.calls[-1]["modes"] == app_module.ADJ_OFFSET_SINGLESHOT
+    assert adjtimex.calls[-1]["offset"] == -12_500
+    # 内核固定以500ppm的速率调整
+    assert duration == pytest.approx(0.0125 / 0.0005)
+
+
+def test_frequency_scaling(app_module, raw):
+    clock, adjtimex = raw
+    assert clock.set_frequency(12.5) == pytest.approx(12.5)
+    assert adjtimex.calls[-1]["modes"] == app_module.ADJ_FREQUENCY
+    assert adjtimex.calls[-1]["freq"] == 12.5 * 65536
+    
+    adjtimex.freq = -3 * 65536
+    assert clock.frequency() == pytest.approx(-3.0)
+
+
+def test_frequency_is_clamped(raw):
+    clock, adjtimex = raw
+    assert clock.set_frequency(800) == 500
+    assert adjtimex.calls[-1]["freq"] == 500 * 65536
+    assert clock.set_frequency(-800) == -500
+
+
+def test_fake_adjtimex_round_trip(app_module):
+    fake = FakeAdjtimex()
+    clock = app_module.LinuxClock(adjtimex=fake)
+    clock.step(-2.5)
+    clock.slew(0.004)
+    clock.set_frequency(-7.25)
+    assert fake.steps == [pytest.approx(-2.5)]
+    assert fake.slews == [pytest.approx(0.004)]
+    assert clock.frequency() == pytest.approx(-7.25)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+域名解析缓存：地址解析、并发解析、超时、地址去重和过期后的后台刷新
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+
+class FakeResolver:
+    """
+    替代DNSCache._lookup：每个域名解析为给定的地址，可设置解析耗时
+    """
+    
+    def __init__(self, app_module, addresses, delay=0.0, block=()):
+        self.app = app_module
+        self.addresses = addresses      # {server: [IP]}
+        self.delay = delay
+        self.block = set(block)         # 解析一直不返回的域名
+        self.calls = []
+        self.release = threading.Event()
+    
+    def __call__(self, server):
+        self.calls.append(server)
+        if server in self.block:
+            self.release.wait(5)
+            raise OSError("解析失败")
+        time.sleep(self.delay)
+        if server not in self.addresses:
+            raise socket.gaierror("Name or service not known")
+        return [self.app.NTPTarget(f"{server}/{ip}", socket.AF_INET, (ip, 123))
+                for ip in self.addresses[server]]
+
+
+def make_cache(app_module, resolver, **kwargs):
+    cache = app_module.DNSCache(**kwargs)
+    cache._lookup = resolver
+    return cache
+
+
+@pytest.mark.parametrize("server, expected", [
+    ("time1.aliyun.com", ("time1.aliyun.com", 123)),
+    ("127.0.0.1:1123", ("127.0.0.1", 1123)),
+    ("::1", ("::1", 123)),
+    ("[::1]:1123", ("::1", 1123)),
+    ("[fe80::1]", ("fe80::1", 123)),
+])
+def test_parse_server(app_module, server, expected):
+    assert app_module._parse_server(server) == expected
+
+
+def test_literal_address(app_module):
+    targets, failures = app_module.DNSCache().resolve(["127.0.0.1:1123"])
+    assert not failures
+    assert targets == [app_module.NTPTarget("127.0.0.1:1123", socket.AF_INET, ("127.0.0.1", 1123))]
+
+
+def test_concurrent_resolve(app_module):
+    servers = [f"ntp{i}.example" for i in range(6)]
+    resolver = FakeResolver(app_module, {server: [f"10.0.0.{i}"] for i, server in enumerate(servers)}, delay=0.2)
+    cache = make_cache(app_module, resolver)
+    start = time.monotonic()
+    targets, failures = cache.resolve(servers)
+    # 所有域名同时解析，总耗时约等于一次解析
+    assert time.monotonic() - start < 0.6
+    assert not failures
+    assert [target.address[0] for target in targets] == [f"10.0.0.{i}" for i in range(6)]
+
+
+def test_cached_until_ttl(app_module):
+    resolver = FakeResolver(app_module, {"a.example": ["10.0.0.1"]})
+    cache = make_cache(app_module, resolver, ttl=3600)
+    for _ in range(3):
+        targets, _ = cache.resolve(["a.example"])
+        assert [target.address[0] for target in targets] == ["10.0.0.1"]
+    assert resolver.calls == ["a.example"]
+
+
+def test_expired_entry_refreshes_in_background(app_module):
+    resolver = FakeResolver(app_module, {"a.example": ["10.0.0.1"]})
+    cache = make_cache(app_module, resolver, ttl=0)
+    cache.resolve(["a.example"])
+    resolver.addresses["a.example"] = ["10.0.0.2"]
+    resolver.delay = 0.3
+    # 过期后立即返回旧记录，后台刷新
+    start = time.monotonic()
+    targets, _ = cache.resolve(["a.example"])
+    assert time.monotonic() - start < 0.2
+    assert [target.address[0] for target in targets] == ["10.0.0.1"]
+    deadline = time.monotonic() + 5
+    while cache.entries["a.example"][1][0].address[0] != "10.0.0.2":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert resolver.calls == ["a.example", "a.example"]
+
+
+def test_failure_and_timeout(app_module):
+    resolver = FakeResolver(app_module, {"good.example": ["10.0.0.1"]}, block=["slow.example"])
+    cache = make_cache(app_module, resolver)
+    try:
+        targets, failures = cache.resolve(["good.example", "missing.example", "slow.example"], timeout=0.3)
+    finally:
+        resolver.release.set()
+    assert [target.address[0] for target in targets] == ["10.0.0.1"]
+    assert failures["slow.example"] == "域名解析超时"
+    assert isinstance(failures["missing.example"], socket.gaierror)
+    # 失败的域名不缓存，下次重新解析
+    assert "missing.example" not in cache.entries
+
+
+def test_duplicate_addresses(app_module):
+    resolver = FakeResolver(app_module, {"a.example": ["10.0.0.1", "10.0.0.2"], "b.example": ["10.0.0.2"]})
+    targets, _ = make_cache(app_module, resolver).resolve(["a.example", "b.example"])
+    assert [target.name for target in targets] == ["a.example/10.0.0.1", "a.example/10.0.0.2"]
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+更新下载：用本地HTTP替身服务器检查并行分块下载、断点续传和不支持Range时的整体下载
+"""
+
+import os
+import logging
+
+import pytest
+
+from fake_http_server import FakeHTTPServer, HTTPServerConfig
+
+PATH = "/dist/ZGIRC_TimeSync.exe"
+SIZE = 512 * 1024
+CHUNK = 64 * 1024
+
+
+@pytest.fixture(scope="module")
+def body():
+    return os.urandom(SIZE)
+
+
+def downloader(app_module, urls, dest, **kwargs):
+    logger = logging.getLogger("test_download")
+    logger.disabled = True
+    return app_module.UpdateDownloader(urls, dest, workers=4, chunk_size=CHUNK, logger=logger, **kwargs)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("bytes 0-0/1234", (0, 0, 1234)),
+    ("bytes 100-199/200", (100, 199, 200)),
+    ("bytes 0-0/*", None),
+    ("items 0-0/10", None),
+    (None, None),
+])
+def test_parse_content_range(app_module, value, expected):
+    assert app_module._parse_content_range(value) == expected
+
+
+def test_parallel_download(app_module, body, tmp_path):
+    reports = []
+    with FakeHTTPServer({PATH: body}) as mirror_a, FakeHTTPServer({PATH: body}) as mirror_b:
+        dest = tmp_path / "new.exe"
+        size = downloader(app_module, [mirror_a.url(PATH), mirror_b.url(PATH)], dest,
+                          progress=lambda done, total: reports.append((done, total))).download()
+        # 分块轮流分配给两个镜像
+        assert mirror_a.stats["bytes"] > 1 and mirror_b.stats["bytes"] > 1
+    assert size == SIZE
+    assert dest.read_bytes() == body
+    assert reports[-1] == (SIZE, SIZE)
+    assert not (tmp_path / "new.exe.part").exists()
+    assert not (tmp_path / "new.exe.part.json").exists()
+
+
+def test_resume_after_interruption(app_module, body, tmp_path):
+    dest = tmp_path / "new.exe"
+    with FakeHTTPServer({PATH: body}, HTTPServerConfig(budget=SIZE // 4)) as mirror:
+        with pytest.raises(Exception):
+            downloader(app_module, [mirror.url(PATH)], dest).download()
+        assert (tmp_path / "new.exe.part.json").exists()
+        
+        mirror.config.budget = None
+        before = mirror.stats["bytes"]
+        downloader(app_module, [mirror.url(PATH)], dest).download()
+        # 只补传中断后剩余的部分（已写入的分块和分块中已写入的部分不再下载）
+        assert mirror.stats["bytes"] - before < SIZE * 0.9
+    assert dest.read_bytes() == body
+
+
+def test_stream_without_ranges(app_module, body, tmp_path):
+    dest = tmp_path / "new.exe"
+    with FakeHTTPServer({PATH: body}, HTTPServerConfig(ranges=False)) as mirror:
+        assert downloader(app_module, [mirror.url(PATH)], dest).download() == SIZE
+    assert dest.read_bytes() == body
+
+
+def test_all_mirrors_unavailable(app_module, body, tmp_path):
+    with FakeHTTPServer({}) as mirror:
+        with pytest.raises(Exception):
+            downloader(app_module, [mirror.url(PATH)], tmp_path / "new.exe").download()
+    assert not (tmp_path / "new.exe").exists()
+
+
+def release(version, body):
+    """
+    镜像目录中的文件：EXE和版本清单
+    """
+    import json
+    import hashlib
+    
+    manifest = {"version": version, "sha256": hashlib.sha256(body).hexdigest(), "size": len(body)}
+    return {PATH: body, "/dist/version.json": json.dumps(manifest).encode('utf-8')}
+
+
+def test_manifest_up_to_date(app_module, body, tmp_path):
+    from harness import make_app
+    
+    with FakeHTTPServer(release(app_module.VERSION, body)) as mirror:
+        app, _ = make_app({"update_urls": [mirror.url(PATH)]}, tmp_path)
+        assert not app.fetch_update()
+        etag = app.load_update_cache()["manifest_etag"]
+        assert etag
+        # 第二次检查带If-None-Match，清单未变化时服务器返回304，不再传输清单和EXE
+        sent = mirror.stats["bytes"]
+        assert not app.fetch_update()
+        assert mirror.stats["bytes"] == sent
+    assert not (tmp_path / "time_new.exe").exists()
+
+
+def test_manifest_new_version(app_module, body, tmp_path):
+    from harness import make_app
+    
+    with FakeHTTPServer(release("99.0.0", body)) as mirror:
+        app, _ = make_app({"update_urls": [mirror.url(PATH)]}, tmp_path)
+        assert app.fetch_update()
+    assert (tmp_path / "time_new.exe").read_bytes() == body
+
+
+def test_conditional_head_without_manifest(app_module, body, tmp_path):
+    from harness import make_app
+    
+    with FakeHTTPServer({PATH: body}) as mirror:
+        app, _ = make_app({"update_urls": [mirror.url(PATH)]}, tmp_path)
+        assert app.fetch_update()
+        # 程序文件未变化：HEAD请求返回304，不再下载
+        sent = mirror.stats["bytes"]
+        assert not app.fetch_update()
+        assert mirror.stats["bytes"] == sent
+        mirror.set_file(PATH, body[::-1])
+        assert app.fetch_update()
+    assert (tmp_path / "time_new.exe").read_bytes() == body[::-1]
+
+
+def test_slow_mirror_is_not_waited_for(app_module, body, tmp_path):
+    import time
+    
+    dest = tmp_path / "new.exe"
+    with FakeHTTPServer({PATH: body}) as fast, \
+            FakeHTTPServer({PATH: body}, HTTPServerConfig(latency=2.0)) as slow:
+        start = time.monotonic()
+        downloader(app_module, [slow.url(PATH), fast.url(PATH)], dest).download()
+        assert time.monotonic() - start < 1.5
+        assert slow.stats["bytes"] == 0
+    assert dest.read_bytes() == body
+
+
+def test_stalled_mirror_switches(app_module, body, tmp_path, monkeypatch):
+    # 缩短测速窗口并提高速度下限，低速镜像在0.2秒后即被判为卡住
+    monkeypatch.setattr(app_module, "UPDATE_STALL_WINDOW", 0.2)
+    monkeypatch.setattr(app_module, "UPDATE_STALL_RATE", 1024 * 1024)
+    dest = tmp_path / "new.exe"
+    with FakeHTTPServer({PATH: body}) as fast, \
+            FakeHTTPServer({PATH: body}, HTTPServerConfig(rate=128 * 1024)) as stalled:
+        loader = downloader(app_module, [stalled.url(PATH), fast.url(PATH)], dest)
+        loader.download()
+        # 低速镜像的分块在测速窗口后从断点换到正常镜像继续
+        assert loader.mirror_stats[stalled.url(PATH)]["failures"] >= 1
+    assert dest.read_bytes() == body
+
+
+def test_mirror_history(app_module, tmp_path):
+    from harness import make_app
+    
+    app, _ = make_app({}, tmp_path)
+    cache = {"mirrors": {
+        "slow": {"ttfb": 0.5, "throughput": 100e3, "failures": 0},
+        "fast": {"ttfb": 0.05, "throughput": 10e6, "failures": 0},
+    }}
+    # 没有记录的镜像按假定的吞吐量估计，排在已知较快的镜像之后
+    assert app.rank_mirrors(["slow", "new", "fast"], cache) == ["fast", "new", "slow"]
+    
+    app.merge_mirror_stats(cache, {
+        "fast": {"ttfb": 0.15, "bytes": 1000, "seconds": 0.01, "failures": 0},
+        "slow": {"ttfb": None, "bytes": 0, "seconds": 0.0, "failures": 1},
+    })
+    alpha = app_module.UPDATE_HISTORY_SMOOTHING
+    assert cache["mirrors"]["fast"]["ttfb"] == pytest.approx(0.05 + alpha * 0.1)
+    assert cache["mirrors"]["fast"]["throughput"] == pytest.approx(10e6 + alpha * (100e3 - 10e6))
+    assert cache["mirrors"]["slow"]["failures"] == 1
+
+
+def make_patch(old, new, path):
+    from make_delta import write_patch
+    
+    return write_patch(old, new, path)
+
+
+@pytest.fixture
+def versions(body, tmp_path):
+    """
+    旧版本和改动了几处的新版本
+    """
+    new = body[:100000] + os.urandom(3000) + body[100000:300000] + body[310000:] + os.urandom(5000)
+    old_path = tmp_path / "old.exe"
+    old_path.write_bytes(body)
+    return old_path, new
+
+
+def test_apply_delta(app_module, versions, tmp_path):
+    import hashlib
+    
+    old_path, new = versions
+    copied, inserted = make_patch(old_path.read_bytes(), new, tmp_path / "a.patch")
+    assert copied > len(new) * 0.8
+    assert (tmp_path / "a.patch").stat().st_size < len(new) // 4
+    
+    digest = app_module.apply_delta(tmp_path / "a.patch", old_path, tmp_path / "new.exe",
+                                    app_module.file_sha256(old_path))
+    assert (tmp_path / "new.exe").read_bytes() == new
+    assert digest == hashlib.sha256(new).hexdigest()
+
+
+def test_delta_for_other_version(app_module, versions, tmp_path):
+    old_path, new = versions
+    make_patch(old_path.read_bytes(), new, tmp_path / "a.patch")
+    with pytest.raises(Exception, match="不匹配"):
+        app_module.apply_delta(tmp_path / "a.patch", old_path, tmp_path / "new.exe", "0" * 64)
+    assert not (tmp_path / "new.exe").exists()
+
+
+def test_corrupt_delta(app_module, versions, tmp_path):
+    old_path, new = versions
+    make_patch(old_path.read_bytes(), new, tmp_path / "a.patch")
+    # 旧文件与补丁记录的不同时，重建结果校验失败，不留下输出文件
+    changed = bytearray(old_path.read_bytes())
+    changed[1000] ^= 0xFF
+    (tmp_path / "changed.exe").write_bytes(bytes(changed))
+    with pytest.raises(Exception, match="校验失败"):
+        app_module.apply_delta(tmp_path / "a.patch", tmp_path / "changed.exe", tmp_path / "new.exe")
+    assert not (tmp_path / "new.exe").exists()
+    
+    (tmp_path / "bad.patch").write_bytes(b'NOTDELTA' + bytes(80))
+    with pytest.raises(Exception, match="不是有效的差分补丁"):
+        app_module.apply_delta(tmp_path / "bad.patch", old_path, tmp_path / "new.exe")
+    assert not (tmp_path / "new.exe").exists()
+
+
+def test_ordered_hasher(app_module, body, tmp_path):
+    import hashlib
+    
+    path = tmp_path / "file"
+    path.write_bytes(body)
+    blocks = [(offset, body[offset:offset + CHUNK]) for offset in range(0, SIZE, CHUNK)]
+    
+    # 乱序到达的数据暂存，接上后依次计算
+    hasher = app_module.OrderedHasher()
+    for offset, data in reversed(blocks):
+        hasher.feed(offset, data)
+    assert hasher.position == SIZE
+    assert hasher.finish(path, SIZE) == hashlib.sha256(body).hexdigest()
+    
+    # 超出暂存上限的数据在finish时从文件补读
+    hasher = app_module.OrderedHasher(limit=CHUNK)
+    for offset, data in blocks[1:] + blocks[:1]:
+        hasher.feed(offset, data)
+    assert hasher.position < SIZE
+    assert hasher.finish(path, SIZE) == hashlib.sha256(body).hexdigest()
+
+
+def test_download_digest(app_module, body, tmp_path):
+    import hashlib
+    
+    dest = tmp_path / "new.exe"
+    with FakeHTTPServer({PATH: body}) as mirror:
+        loader = downloader(app_module, [mirror.url(PATH)], dest)
+        loader.download(hashlib.sha256(body).hexdigest())
+    assert loader.sha256 == hashlib.sha256(body).hexdigest()
+    assert dest.read_bytes() == body
+
+
+def test_digest_mismatch(app_module, body, tmp_path):
+    dest = tmp_path / "new.exe"
+    with FakeHTTPServer({PATH: body}) as mirror:
+        with pytest.raises(Exception, match="校验失败"):
+            downloader(app_module, [mirror.url(PATH)], dest).download("0" * 64)
+    # 校验失败的数据不保留，下次重新下载
+    assert not dest.exists()
+    assert not (tmp_path / "new.exe.part").exists()
+    assert not (tmp_path / "new.exe.part.json").exists()
+
+
+def test_replace_executable(app_module, tmp_path):
+    target = tmp_path / "ZGIRC_TimeSync.exe"
+    target.write_bytes(b'old')
+    (tmp_path / "ZGIRC_TimeSync.exe.old").write_bytes(b'older')
+    new = tmp_path / "time_new.exe"
+    new.write_bytes(b'new')
+    assert app_module.replace_executable(new, target) == "replaced"
+    assert target.read_bytes() == b'new'
+    assert (tmp_path / "ZGIRC_TimeSync.exe.old").read_bytes() == b'old'
+    assert not new.exists()
+
+
+def test_replace_executable_restores_on_failure(app_module, tmp_path):
+    target = tmp_path / "ZGIRC_TimeSync.exe"
+    target.write_bytes(b'old')
+    with pytest.raises(OSError):
+        app_module.replace_executable(tmp_path / "missing.exe", target)
+    # 新文件移动失败时放回旧程序
+    assert target.read_bytes() == b'old'
+
+
+@pytest.mark.parametrize("argv, expected", [
+    ([], []),
+    (['--post-update', '1234'], []),
+    (['--post-update=1234', '--minimized'], ['--minimized']),
+    (['--post-update', '1234', '--minimized'], ['--minimized']),
+])
+def test_relaunch_arguments(app_module, argv, expected):
+    assert app_module.relaunch_arguments(argv) == expected
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+时钟漂移估计：加权回归、异常间隔剔除和安全同步间隔
+"""
+
+import random
+
+import pytest
+
+from harness import make_app, load_app_module
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture(scope="module")
+def drift_module():
+    return load_app_module("drift")
+
+
+def make_intervals(ppm, count=20, interval=3600.0, noise=0.0005, seed=1):
+    """
+    按固定频率误差生成校正间隔：积累的偏差 = ppm x 间隔 + 测量噪声
+    返回：[(时间戳, 间隔秒, 积累的偏差秒, 测量误差秒)]，最后一个间隔结束于NOW
+    """
+    rng = random.Random(seed)
+    return [(NOW - (count - 1 - i) * interval, interval, ppm * 1e-6 * interval + rng.gauss(0, noise), noise)
+            for i in range(count)]
+
+
+def test_recovers_frequency_error(drift_module):
+    model = drift_module.DriftEstimator().fit(make_intervals(35.0), NOW)
+    assert model.ppm == pytest.approx(35.0, abs=0.5)
+    assert model.stderr < 0.5
+    assert model.points == 20
+    assert model.span == pytest.approx(20 * 3600)
+
+
+def test_negative_drift(drift_module):
+    model = drift_module.DriftEstimator().fit(make_intervals(-60.0, seed=2), NOW)
+    assert model.ppm == pytest.approx(-60.0, abs=0.5)
+
+
+def test_outlier_interval_is_rejected(drift_module):
+    intervals = make_intervals(20.0)
+    # 一个间隔多了5毫秒（如某轮同步的往返路径不对称），超过3倍测量误差
+    ts, interval, accumulated, error = intervals[10]
+    intervals[10] = (ts, interval, accumulated + 0.005, error)
+    model = drift_module.DriftEstimator().fit(intervals, NOW)
+    assert model.points == 19
+    assert model.ppm == pytest.approx(20.0, abs=0.5)
+
+
+def test_manual_time_change_is_ignored(drift_module):
+    # 单个间隔的频率误差超过max_ppm（手动改了时间），不参与估计
+    intervals = make_intervals(10.0) + [(NOW + 3600, 3600.0, 30.0, 0.0005)]
+    model = drift_module.DriftEstimator().fit(intervals, NOW + 3600)
+    assert model.points == 20
+    assert model.ppm == pytest.approx(10.0, abs=0.5)
+
+
+def test_recent_intervals_weigh_more(drift_module):
+    # 5天前20ppm，最近一天40ppm（如温度变化）；半衰期1天时估计接近最近的值
+    old = [(NOW - 5 * 86400 - i * 3600, 3600.0, 20e-6 * 3600, 0.05) for i in range(20)]
+    recent = [(NOW - i * 3600, 3600.0, 40e-6 * 3600, 0.05) for i in range(20)]
+    estimator = drift_module.DriftEstimator(half_life=86400, max_stderr=10)
+    model = estimator.fit(old + recent, NOW)
+    assert model.points == 40
+    assert 38 < model.ppm < 40
+    # 几乎不衰减时两段各占一半
+    flat = drift_module.DriftEstimator(half_life=1e9, max_stderr=10).fit(old + recent, NOW)
+    assert flat.ppm == pytest.approx(30, abs=0.01)
+
+
+def test_not_enough_points(drift_module):
+    estimator = drift_module.DriftEstimator(min_points=3)
+    assert estimator.fit(make_intervals(35.0, count=2), NOW) is None
+    assert estimator.fit([], NOW) is None
+
+
+def test_untrusted_model(drift_module):
+    # 测量误差比漂移大得多时标准误差超过上限，不给出模型
+    intervals = make_intervals(1.0, count=5, interval=600.0, noise=0.01)
+    assert drift_module.DriftEstimator(max_stderr=1.0).fit(intervals, NOW) is None
+
+
+def test_safe_interval(drift_module):
+    model = drift_module.DriftModel(ppm=35.0, stderr=0.5, spread=1.0, points=20, span=72000)
+    # 剩余漂移 |35 - 33| + 2 x 0.5 + 1.0 = 4ppm，积累0.01秒需要2500秒
+    assert drift_module.DriftEstimator.safe_interval(model, 33.0, 0.01) == pytest.approx(2500)
+    perfect = drift_module.DriftModel(ppm=35.0, stderr=0.0, spread=0.0, points=20, span=72000)
+    assert drift_module.DriftEstimator.safe_interval(perfect, 35.0, 0.01) == float('inf')
+
+
+def test_app_corrects_frequency_from_history(app_module):
+    app, fake = make_app({"clock_mode": "step"})
+    for i in range(10):
+        when = NOW + i * 7200
+        estimate = app_module.ClockEstimate(offset=25e-6 * 7200 if i else 0.0, delay=0.02, jitter=0.0005,
+                                            stratum=2, peer="sim", survivors=[], falsetickers=[])
+        app.sync_history.record("step", estimate, when=when, freq=fake.freq)
+    model = app.update_drift(now=NOW + 9 * 7200)
+    app.sync_history.close()
+    assert model.ppm == pytest.approx(25.0, abs=0.5)
+    assert fake.freq == pytest.approx(model.ppm, abs=1e-4)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+批量同步：代理的请求处理和授权、汇总统计，以及对本地代理和替身代理的批量同步
+"""
+
+import asyncio
+import json
+import logging
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from fake_agent import FakeAgentCluster, FakeAgentConfig
+from harness import load_app_module
+
+
+@pytest.fixture(scope="module")
+def fleet_module():
+    return load_app_module("fleet")
+
+
+def make_fake_app(app_module, offset=0.25, clock_action="slew"):
+    """
+    只提供代理用到的接口的TimeSyncApp替身
+    offset为None时查询和同步都失败
+    """
+    estimate = None if offset is None else app_module.ClockEstimate(
+        offset=offset, delay=0.02, jitter=0.001, stratum=2, peer="203.0.113.7:123", survivors=[], falsetickers=[])
+    app = SimpleNamespace(logger=logging.getLogger("test_fleet"), last_clock_action=None, syncs=0)
+    
+    def sync_once():
+        app.syncs += 1
+        app.last_clock_action = clock_action if estimate else None
+        return estimate
+    
+    app.get_ntp_time = lambda: estimate
+    app.sync_once = sync_once
+    return app
+
+
+@pytest.fixture
+def running(fleet_module):
+    """
+    在后台线程中运行SyncAgent，返回启动函数
+    """
+    stops = []
+    
+    def start(app, token=None):
+        agent = fleet_module.SyncAgent(app, '127.0.0.1', 0, token=token)
+        stop, ready = threading.Event(), threading.Event()
+        thread = threading.Thread(target=agent.run, args=(stop, ready), daemon=True)
+        thread.start()
+        assert ready.wait(5)
+        stops.append((stop, thread))
+        return "%s:%d" % agent.address
+    
+    yield start
+    for stop, thread in stops:
+        stop.set()
+        thread.join(5)
+
+
+def orchestrate(fleet_module, hosts, **kwargs):
+    """
+    运行一次批量任务
+    返回：(逐台结果列表, 汇总)
+    """
+    results = []
+    summary = asyncio.run(fleet_module.SyncOrchestrator(hosts, **kwargs).run(results.append))
+    return results, summary
+
+
+def test_handle_without_token(app_module, fleet_module):
+    app = make_fake_app(app_module)
+    agent = fleet_module.SyncAgent(app)
+    assert agent.handle({"action": "ping"}) == {"ok": True, "version": app_module.VERSION}
+    result = agent.handle({"action": "query"})
+    assert result["ok"] and result["offset"] == 0.25 and "clock_action" not in result
+    # 没有设置口令时不允许远程修改时间
+    assert agent.handle({"action": "sync"}) == {"ok": False, "error": "代理未设置agent_token，不接受sync"}
+    assert app.syncs == 0
+    assert agent.handle({"action": "reboot"}) == {"ok": False, "error": "未知操作: reboot"}
+
+
+def test_handle_with_token(app_module, fleet_module):
+    app = make_fake_app(app_module)
+    agent = fleet_module.SyncAgent(app, token="s3cret")
+    assert agent.handle({"action": "query"}) == {"ok": False, "error": "未授权"}
+    assert agent.handle({"action": "sync", "token": "wrong"}) == {"ok": False, "error": "未授权"}
+    result = agent.handle({"action": "sync", "token": "s3cret"})
+    assert result["ok"] and result["clock_action"] == "slew"
+    assert app.syncs == 1
+
+
+def test_handle_failed_sync(app_module, fleet_module):
+    agent = fleet_module.SyncAgent(make_fake_app(app_module, offset=None), token="s3cret")
+    assert agent.handle({"action": "sync", "token": "s3cret"}) == {"ok": False, "error": "同步失败"}
+    assert agent.handle({"action": "query", "token": "s3cret"}) == {"ok": False, "error": "查询失败"}
+
+
+def test_handle_rejects_malformed_requests(app_module, fleet_module):
+    agent = fleet_module.SyncAgent(make_fake_app(app_module), token="s3cret")
+    for request in (None, [], "ping", 1):
+        assert agent.handle(request) == {"ok": False, "error": "请求格式错误"}
+    # 口令按字节比较，含非ASCII字符时也只是不匹配
+    assert agent.handle({"action": "ping", "token": "口令"}) == {"ok": False, "error": "未授权"}
+    assert fleet_module.SyncAgent(make_fake_app(app_module), token="口令").handle(
+        {"action": "ping", "token": "口令"})["ok"]
+
+
+def test_handle_reports_errors(app_module, fleet_module):
+    app = make_fake_app(app_module)
+    app.logger = logging.getLogger("test_fleet.errors")
+    app.logger.disabled = True
+    
+    def broken():
+        raise AttributeError("'NoneType' object has no attribute 'offset'")
+    
+    app.get_ntp_time = broken
+    agent = fleet_module.SyncAgent(app)
+    # 同步流程内部的错误如实返回，不当作请求格式错误
+    assert agent.handle({"action": "query"}) == {"ok": False, "error": "'NoneType' object has no attribute 'offset'"}
+
+
+def test_summarize(fleet_module):
+    results = [{"host": f"h{i}", "ok": True, "offset": (-1) ** i * i / 1000} for i in range(1, 101)]
+    results += [{"host": "x", "ok": False, "error": "超时"}] * 3 + [{"host": "y", "ok": False, "error": "未授权"}]
+    summary = fleet_module.SyncOrchestrator([], action="sync").summarize(results, 1.23456)
+    assert summary == {
+        "action": "sync", "hosts": 104, "ok": 100, "failed": 4,
+        "abs_offset_p50": 0.051, "abs_offset_p99": 0.1, "abs_offset_max": 0.1,
+        "failures": {"超时": 3, "未授权": 1}, "elapsed": 1.235,
+    }
+    empty = fleet_module.SyncOrchestrator([]).summarize([], 0)
+    assert empty["abs_offset_p50"] is None and empty["abs_offset_max"] is None
+
+
+def test_orchestrate_local_agents(app_module, fleet_module, running):
+    good = running(make_fake_app(app_module, offset=0.25), token="s3cret")
+    failing = running(make_fake_app(app_module, offset=None), token="s3cret")
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        closed = "127.0.0.1:%d" % sock.getsockname()[1]
+    results, summary = orchestrate(fleet_module, [good, failing, closed], action="sync", token="s3cret", timeout=5)
+    by_host = {result["host"]: result for result in results}
+    assert by_host[good]["ok"] and by_host[good]["clock_action"] == "slew"
+    assert by_host[failing] == dict(by_host[failing], ok=False, error="同步失败")
+    assert not by_host[closed]["ok"]
+    assert "id" not in by_host[good]
+    assert summary["ok"] == 1 and summary["failed"] == 2
+    assert summary["abs_offset_max"] == 0.25
+    # 连接同一个代理可以连续发送多个请求
+    _, summary = orchestrate(fleet_module, [good] * 3, action="query", token="s3cret")
+    assert summary["ok"] == 3
+
+
+def test_orchestrate_concurrency_and_timeouts(fleet_module):
+    with FakeAgentCluster(12, FakeAgentConfig(latency=0.1, jitter=0.0), seed=1) as fast, \
+            FakeAgentCluster(2, FakeAgentConfig(latency=0.0, silent=1.0), seed=1) as stuck:
+        results, summary = orchestrate(fleet_module, fast.hosts + stuck.hosts, workers=4, timeout=0.5)
+    assert len(results) == 14
+    assert summary["ok"] == 12
+    assert summary["failures"] == {"超时": 2}
+    # 12台x0.1秒，4个并发：约0.3秒，加上卡住的两台的超时
+    assert summary["elapsed"] < 1.5
+
+
+def test_oversized_request_closes_connection(app_module, running, caplog):
+    address = running(make_fake_app(app_module))
+    host, port = address.rsplit(':', 1)
+    with caplog.at_level(logging.ERROR, logger="asyncio"):
+        with socket.create_connection((host, int(port)), timeout=5) as sock:
+            # 超过缓冲区上限的行不处理，直接断开连接（还有未读的数据时对方会发送RST）
+            try:
+                sock.sendall(b'{"action": "' + b'x' * 200_000 + b'"}\n')
+                data = sock.recv(1024)
+            except (ConnectionResetError, BrokenPipeError):
+                data = b''
+            assert data == b''
+        with socket.create_connection((host, int(port)), timeout=5) as sock:
+            sock.sendall(b'{"id": 7, "action": "ping"}\n')
+            assert b'"id": 7' in sock.makefile('rb').readline()
+    assert not caplog.records
+
+
+def test_malformed_line_keeps_connection(app_module, running):
+    address = running(make_fake_app(app_module))
+    host, port = address.rsplit(':', 1)
+    with socket.create_connection((host, int(port)), timeout=5) as sock:
+        sock.sendall(b'not json\n[1, 2]\n"ping"\n{"id": 3, "action": "ping"}\n')
+        reader = sock.makefile('rb')
+        lines = [json.loads(reader.readline()) for _ in range(4)]
+    assert [line["ok"] for line in lines] == [False, False, False, True]
+    assert {line.get("error") for line in lines[:3]} == {"请求格式错误"}
+    assert lines[3]["id"] == 3
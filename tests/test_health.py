@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+服务器健康记录：打分排序、失败退避、过期和保存
+"""
+
+import json
+import time
+
+import pytest
+
+
+@pytest.fixture
+def store(app_module, tmp_path):
+    return app_module.ServerHealthStore(tmp_path / "ntp_health.json")
+
+
+def test_order_by_score(store):
+    now = time.time()
+    store.record_success("slow", rtt=0.080, jitter=0.001, now=now)
+    store.record_success("fast", rtt=0.010, jitter=0.001, now=now)
+    # 延迟低但抖动大的服务器排在后面：得分 = 延迟 + 4倍抖动
+    store.record_success("jittery", rtt=0.005, jitter=0.030, now=now)
+    assert store.order(["slow", "unknown", "jittery", "fast"]) == ["fast", "slow", "jittery", "unknown"]
+
+
+def test_smoothing(store):
+    store.record_success("a", rtt=0.100, jitter=0.0)
+    store.record_success("a", rtt=0.020, jitter=0.004)
+    assert store.entries["a"]["rtt"] == pytest.approx(0.100 + store.SMOOTHING * (0.020 - 0.100))
+    assert store.entries["a"]["jitter"] == pytest.approx(store.SMOOTHING * 0.004)
+
+
+def test_failure_backoff_doubles(app_module, store):
+    now = time.time()
+    backoffs = []
+    for _ in range(12):
+        store.record_failure("bad", now=now)
+        backoffs.append(store.entries["bad"]["backoff_until"] - now)
+    base = app_module.NTP_BACKOFF_BASE
+    assert backoffs[:4] == [base, 2 * base, 4 * base, 8 * base]
+    assert backoffs[-1] == app_module.NTP_BACKOFF_MAX
+    assert store.in_backoff("bad", now + base)
+    assert not store.in_backoff("bad", now + app_module.NTP_BACKOFF_MAX + 1)
+
+
+def test_backoff_skipped_but_keeps_minimum(store):
+    store.record_success("good", rtt=0.010, jitter=0.001)
+    store.record_success("bad", rtt=0.001, jitter=0.0)
+    store.record_failure("bad")
+    assert store.order(["bad", "good"]) == ["good"]
+    # 可用的服务器不够时按得分补回退避中的服务器（各失败一次，罚分相同）
+    store.record_failure("good")
+    assert store.order(["good", "bad"]) == ["bad"]
+    assert store.order(["good", "bad"], keep=2) == ["bad", "good"]
+    # 成功一次后清除退避和失败罚分
+    store.record_success("bad", rtt=0.001, jitter=0.0)
+    assert store.order(["bad", "good"]) == ["bad"]
+
+
+def test_record_round(app_module, store):
+    from test_selector import make_sample
+    
+    samples = [make_sample(app_module, "a", 0.0, delay=delay) for delay in (0.02, 0.01, 0.03)]
+    samples.append(make_sample(app_module, "liar", 3.0))
+    store.record_round(samples, {"silent": "超时"}, falsetickers=["liar"])
+    assert store.entries["a"]["rtt"] == pytest.approx(0.01)
+    assert store.entries["a"]["failures"] == 0
+    assert store.entries["liar"]["failures"] == 1
+    assert store.entries["silent"]["failures"] == 1
+    assert store.order(["silent", "liar", "a"]) == ["a"]
+
+
+def test_save_load_and_expire(app_module, tmp_path):
+    path = tmp_path / "ntp_health.json"
+    store = app_module.ServerHealthStore(path, ttl=3600)
+    store.record_success("fresh", rtt=0.01, jitter=0.0)
+    store.record_success("stale", rtt=0.01, jitter=0.0, now=time.time() - 7200)
+    store.save()
+    assert set(json.loads(path.read_text(encoding='utf-8'))) == {"fresh", "stale"}
+    assert set(app_module.ServerHealthStore(path, ttl=3600).entries) == {"fresh"}
+
+
+def test_corrupt_file_is_ignored(app_module, tmp_path):
+    path = tmp_path / "ntp_health.json"
+    path.write_text("{not json", encoding='utf-8')
+    assert app_module.ServerHealthStore(path).entries == {}
+
+
+def test_app_loads_health_on_first_use(app_module, tmp_path):
+    from harness import make_app
+    
+    path = tmp_path / app_module.NTP_HEALTH_FILE
+    path.write_text(json.dumps({"a": {"rtt": 0.01, "jitter": 0.0, "failures": 0, "updated": time.time()}}),
+                    encoding='utf-8')
+    app, _ = make_app({}, program_dir=tmp_path)
+    # 启动时不读取健康记录，第一次查询排序时才加载
+    assert app._server_health is None
+    assert app.server_health.order(["unknown", "a"]) == ["a", "unknown"]
+    assert app.server_health is app.server_health
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+同步历史：每轮记录、按天汇总的分位数直方图、漂移和过期清理
+"""
+
+import time
+
+import pytest
+
+from test_selector import make_sample
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def history(app_module, tmp_path):
+    history = app_module.SyncHistory(tmp_path / "sync_history.db", retention_days=10 ** 6)
+    yield history
+    history.close()
+
+
+def make_estimate(app_module, offset, falsetickers=()):
+    return app_module.ClockEstimate(offset=offset, delay=0.02, jitter=0.001, stratum=2, peer="a",
+                                    survivors=["a", "b"], falsetickers=list(falsetickers))
+
+
+def test_rounds(app_module, history):
+    history.record("step", make_estimate(app_module, 0.3), when=NOW)
+    history.record("failed", when=NOW + 60)
+    rounds = history.rounds(NOW - 1, NOW + 3600)
+    assert [row["action"] for row in rounds] == ["step", "failed"]
+    assert rounds[0]["offset"] == pytest.approx(0.3)
+    assert rounds[0]["survivors"] == 2
+    assert rounds[1]["offset"] is None
+    assert history.rounds(NOW + 30, NOW + 3600) == rounds[1:]
+
+
+def test_histogram_bins(app_module):
+    bin_ = app_module.SyncHistory.histogram_bin
+    assert bin_(0.0) == 0
+    assert bin_(app_module.HISTORY_BIN_BASE) == 1
+    assert bin_(1e6) == app_module.HISTORY_BINS - 1
+    # 分桶的代表值与原值的相对误差不超过±10%
+    for value in (3e-6, 0.00042, 0.0123, 0.5, 7.0):
+        assert app_module.SyncHistory.bin_value(bin_(value)) == pytest.approx(value, rel=0.1)
+
+
+def test_server_stats(app_module, history):
+    for i in range(100):
+        samples = [make_sample(app_module, "a", (i + 1) * 1e-4, delay=0.010),
+                   make_sample(app_module, "a", 0.5, delay=0.050),
+                   make_sample(app_module, "bad", 2.0)]
+        history.record("slew", make_estimate(app_module, 0.001, falsetickers=["bad"]), samples, when=NOW + i)
+    stats = history.server_stats(NOW, NOW + 100)
+    # 每轮每个服务器只记录往返延迟最小的采样
+    assert stats["a"]["count"] == 100
+    assert stats["a"]["falsetickers"] == 0
+    assert stats["a"]["offset"]["p50"] == pytest.approx(0.005, rel=0.1)
+    assert stats["a"]["offset"]["p99"] == pytest.approx(0.01, rel=0.1)
+    assert stats["a"]["delay"]["p50"] == pytest.approx(0.010, rel=0.1)
+    assert stats["bad"]["falsetickers"] == 100
+    assert history.server_stats(NOW + 10 * 86400) == {}
+
+
+def test_drift(app_module, history):
+    interval = 3600
+    for i in range(5):
+        history.record("step", make_estimate(app_module, 20e-6 * interval if i else 0.0), when=NOW + i * interval)
+    # 间隔短于最短同步间隔的一轮不计入
+    history.record("step", make_estimate(app_module, 0.001), when=NOW + 4 * interval + 1)
+    drift = history.drift(NOW, NOW + 5 * interval)
+    assert len(drift) == 4
+    assert all(ppm == pytest.approx(20.0) for _, ppm in drift)
+
+
+def test_retention(app_module, tmp_path):
+    path = tmp_path / "sync_history.db"
+    history = app_module.SyncHistory(path)
+    now = time.time()
+    history.record("step", make_estimate(app_module, 0.1), when=now - 30 * 86400)
+    history.record("step", make_estimate(app_module, 0.1), when=now)
+    history.close()
+    # 重新打开时删除超过保留天数的记录
+    history = app_module.SyncHistory(path, retention_days=7)
+    assert len(history.rounds(0)) == 1
+    history.close()
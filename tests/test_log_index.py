@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+日志查看的行偏移索引：增量索引、截断重建、按级别和文本查找
+"""
+
+import threading
+
+import pytest
+
+
+LINES = [
+    "2026-02-08 10:00:00,000 - INFO - 程序启动",
+    "2026-02-08 10:00:01,000 - WARNING - 服务器 time1.aliyun.com 超时",
+    "2026-02-08 10:00:02,000 - INFO - 同步成功，偏差 +0.012 秒",
+    "2026-02-08 10:00:03,000 - ERROR - 设置系统时间失败",
+    "2026-02-08 10:00:04,000 - INFO - Sync OK",
+]
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "time_sync_20260208.log"
+    path.write_text("\n".join(LINES) + "\n", encoding='utf-8')
+    return path
+
+
+def test_index_lines(app_module, log_file):
+    index = app_module.LogIndex(log_file)
+    assert index.refresh() == len(LINES)
+    assert len(index) == len(LINES)
+    assert [index.line(i) for i in range(len(index))] == LINES
+    assert index.refresh() == 0
+
+
+def test_incremental_refresh(app_module, log_file):
+    index = app_module.LogIndex(log_file)
+    index.refresh()
+    with open(log_file, 'a', encoding='utf-8') as f:
+        f.write("2026-02-08 10:00:05,000 - INFO - 新的一行\n半行")
+    # 没有换行符的最后一行暂不计入
+    assert index.refresh() == 1
+    assert index.line(len(index) - 1).endswith("新的一行")
+    with open(log_file, 'a', encoding='utf-8') as f:
+        f.write("写完\n")
+    assert index.refresh() == 1
+    assert index.line(len(index) - 1) == "半行写完"
+
+
+def test_truncated_file_resets(app_module, log_file):
+    index = app_module.LogIndex(log_file)
+    index.refresh()
+    log_file.write_text(LINES[0] + "\n", encoding='utf-8')
+    assert index.refresh() == 1
+    assert index.resets == 1
+    assert len(index) == 1
+
+
+@pytest.mark.parametrize("level, text, expected", [
+    ("全部", None, [0, 1, 2, 3, 4]),
+    ("WARNING", None, [1, 3]),
+    ("ERROR", None, [3]),
+    (None, "同步", [2]),
+    (None, "sync ok", [4]),
+    ("INFO", "aliyun", [1]),
+    ("ERROR", "同步", []),
+])
+def test_search(app_module, log_file, level, text, expected):
+    index = app_module.LogIndex(log_file)
+    index.refresh()
+    assert list(index.search(level, text)) == expected
+
+
+def test_search_range_and_cancel(app_module, log_file):
+    index = app_module.LogIndex(log_file)
+    index.refresh()
+    assert list(index.search("INFO", None, start=1, end=3)) == [1, 2]
+    cancel = threading.Event()
+    cancel.set()
+    assert index.search(None, "INFO", cancel=cancel) is None
+
+
+def test_search_empty_file(app_module, tmp_path):
+    path = tmp_path / "time_sync_20260208.log"
+    path.write_bytes(b'')
+    index = app_module.LogIndex(path)
+    assert index.refresh() == 0
+    # 空文件从未映射，查找直接返回空结果
+    assert list(index.search("WARNING", "超时")) == []
+    assert list(index.search(None, None)) == []
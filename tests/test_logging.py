@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+异步日志：队列溢出策略、后台批量写入和丢弃计数
+"""
+
+import io
+import queue
+import logging
+
+
+class ListHandler(logging.Handler):
+    """
+    把收到的日志记录保存在列表中，并统计flush_batch的调用次数
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.batches = 0
+    
+    def emit(self, record):
+        self.records.append(record)
+    
+    def flush_batch(self):
+        self.batches += 1
+
+
+def make_record(message, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 0, message, None, None)
+
+
+def test_queue_overflow_policy(app_module):
+    log_queue = queue.Queue(2)
+    handler = app_module.QueueLogHandler(log_queue)
+    handler.handle(make_record("a"))
+    handler.handle(make_record("b"))
+    # 队列满时丢弃新的INFO日志
+    handler.handle(make_record("c"))
+    assert handler.dropped == 1
+    # WARNING挤掉最旧的一条
+    handler.handle(make_record("d", logging.WARNING))
+    assert handler.dropped == 2
+    assert [log_queue.get_nowait().msg for _ in range(2)] == ["b", "d"]
+
+
+def test_writer_handles_all_records_in_order(app_module):
+    log_queue = queue.Queue()
+    target = ListHandler()
+    writer = app_module.AsyncLogWriter(log_queue, [target])
+    for i in range(1000):
+        log_queue.put(make_record(f"第{i}条"))
+    writer.start()
+    writer.stop()
+    assert [record.msg for record in target.records] == [f"第{i}条" for i in range(1000)]
+    # 每批处理完后才flush，不是每条日志flush一次
+    assert 1 <= target.batches <= 1000 // app_module.LOG_BATCH_SIZE + 2
+
+
+def test_writer_respects_handler_level(app_module):
+    log_queue = queue.Queue()
+    target = ListHandler()
+    target.setLevel(logging.WARNING)
+    writer = app_module.AsyncLogWriter(log_queue, [target])
+    writer.start()
+    log_queue.put(make_record("info"))
+    log_queue.put(make_record("warning", logging.WARNING))
+    writer.stop()
+    assert [record.msg for record in target.records] == ["warning"]
+
+
+def test_writer_reports_dropped(app_module):
+    log_queue = queue.Queue(1)
+    source = app_module.QueueLogHandler(log_queue)
+    for i in range(4):
+        source.handle(make_record(f"第{i}条"))
+    target = ListHandler()
+    writer = app_module.AsyncLogWriter(log_queue, [target], source=source)
+    writer.start()
+    writer.stop()
+    messages = [record.getMessage() for record in target.records]
+    assert messages[0] == "第0条"
+    assert "丢弃了 3 条日志" in messages[1]
+
+
+def test_logger_does_not_block_on_io(app_module):
+    # 格式化和写入都在写入线程中完成，调用线程只放入队列
+    stream = io.StringIO()
+    output = app_module.BatchStreamHandler(stream)
+    output.setFormatter(logging.Formatter(app_module.LOG_FORMAT))
+    log_queue = queue.Queue()
+    source = app_module.QueueLogHandler(log_queue)
+    logger = logging.getLogger("test_logging.async")
+    logger.propagate = False
+    logger.addHandler(source)
+    logger.warning("同步完成")
+    assert stream.getvalue() == ""
+    writer = app_module.AsyncLogWriter(log_queue, [output], source=source)
+    writer.start()
+    writer.stop()
+    logger.removeHandler(source)
+    assert stream.getvalue().endswith(" - WARNING - 同步完成\n")
+
+
+def wait_for(condition, timeout=5):
+    import time
+    
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def today():
+    from datetime import datetime
+    
+    return datetime.now().strftime('%Y%m%d')
+
+
+def test_rotate_by_size(app_module, tmp_path):
+    archive = app_module.LogArchive(tmp_path)
+    handler = app_module.RotatingLogHandler(archive, max_bytes=1000)
+    for i in range(3):
+        for _ in range(20):
+            handler.handle(make_record("x" * 60))
+        handler.flush_batch()
+    handler.close()
+    day = today()
+    # 只切换到新文件，不重命名正在写的文件；换下来的文件在后台压缩
+    assert [entry["name"] for entry in archive.entries] == [
+        f"time_sync_{day}.log", f"time_sync_{day}_1.log", f"time_sync_{day}_2.log"]
+    wait_for(lambda: all(entry["compressed"] for entry in archive.entries))
+    assert (tmp_path / f"time_sync_{day}.log.gz").exists()
+    assert not (tmp_path / f"time_sync_{day}.log").exists()
+    assert handler.baseFilename.endswith(f"time_sync_{day}_3.log")
+
+
+def test_rotate_by_day(app_module, tmp_path):
+    archive = app_module.LogArchive(tmp_path)
+    handler = app_module.RotatingLogHandler(archive)
+    handler.handle(make_record("今天"))
+    record = make_record("明天")
+    record.created = handler.rollover_at + 1
+    handler.handle(record)
+    handler.close()
+    assert [entry["name"] for entry in archive.entries] == [f"time_sync_{today()}.log"]
+    assert handler.day > today()
+    assert handler.baseFilename.endswith(f"time_sync_{handler.day}.log")
+
+
+def test_prune_by_age_and_size(app_module, tmp_path):
+    archive = app_module.LogArchive(tmp_path, days=7)
+    old = tmp_path / "time_sync_20000101.log"
+    old.write_bytes(b'x' * 100)
+    archive.add(old, "20000101")
+    # 超过保留天数的文件在登记时就被删除
+    assert not old.exists()
+    assert not archive.entries
+    
+    day = today()
+    paths = [tmp_path / f"time_sync_{day}_{i}.log" for i in range(1, 5)]
+    for path in paths:
+        path.write_bytes(b'x' * 100)
+        archive.add(path, day)
+    wait_for(lambda: all(entry["compressed"] for entry in archive.entries))
+    # 总大小超过上限时从最旧的一端删除
+    archive.max_total = archive.total // 2
+    assert archive.prune() == 2
+    assert [entry["name"] for entry in archive.entries] == [path.name for path in paths[2:]]
+    assert not (tmp_path / (paths[0].name + '.gz')).exists()
+    assert (tmp_path / (paths[3].name + '.gz')).exists()
+
+
+def test_index_is_loaded_without_scanning(app_module, tmp_path):
+    day = today()
+    archive = app_module.LogArchive(tmp_path)
+    path = tmp_path / f"time_sync_{day}.log"
+    path.write_bytes(b'x' * 10)
+    archive.add(path, day)
+    wait_for(lambda: archive.entries[0]["compressed"])
+    
+    # 有索引时不扫描目录，索引之外的文件不会被登记
+    (tmp_path / f"time_sync_{day}_1.log").write_bytes(b'y')
+    loaded = app_module.LogArchive(tmp_path)
+    assert [entry["name"] for entry in loaded.entries] == [path.name]
+    assert loaded.entries[0]["compressed"]
+    assert path.name in loaded
+
+
+def test_first_run_scan(app_module, tmp_path):
+    day = today()
+    for name in ("time_sync_20260101.log", "time_sync_20260101_9.log", "time_sync_20260101_10.log",
+                 f"time_sync_{day}.log", f"time_sync_{day}_1.log"):
+        (tmp_path / name).write_bytes(b'x')
+    archive = app_module.LogArchive(tmp_path, days=10 ** 5)
+    # 按日期和轮转序号排序，当天最后一个文件是正在写入的日志，不登记也不压缩
+    assert [entry["name"] for entry in archive.entries] == [
+        "time_sync_20260101.log", "time_sync_20260101_9.log", "time_sync_20260101_10.log", f"time_sync_{day}.log"]
+    handler = app_module.RotatingLogHandler(archive)
+    assert handler.baseFilename.endswith(f"time_sync_{day}_1.log")
+    handler.close()
+    wait_for(lambda: all(entry["compressed"] for entry in archive.entries))
+    assert (tmp_path / f"time_sync_{day}_1.log").exists()
+
+
+def test_setup_logging_is_idempotent(app_module, tmp_path):
+    from harness import make_app
+    
+    app, _ = make_app({"save_log": True}, program_dir=tmp_path)
+    first = app.log_writer
+    app.setup_logging()
+    other, _ = make_app({})
+    # 重复设置时替换之前的队列handler，旧的写入线程停止、日志文件关闭
+    handlers = [handler for handler in logging.getLogger(app_module.__name__).handlers
+                if isinstance(handler, app_module.QueueLogHandler)]
+    assert [handler.writer for handler in handlers] == [other.log_writer]
+    assert not first._thread.is_alive() and not app.log_writer._thread.is_alive()
+    assert isinstance(first.handlers[0], app_module.RotatingLogHandler)
+    assert first.handlers[0].stream is None
+    other.log_writer.stop()
+
+
+def test_archive_loads_on_first_record(app_module, tmp_path):
+    day = today()
+    (tmp_path / f"time_sync_{day}.log").write_bytes(b'x')
+    archive = app_module.LogArchive(tmp_path, load=False)
+    handler = app_module.RotatingLogHandler(archive)
+    # 创建时不扫描目录，也不写索引
+    assert not archive.loaded
+    assert not (tmp_path / app_module.LOG_INDEX_FILE).exists()
+    # 写第一条日志时才加载，并继续写入当天的文件
+    handler.handle(make_record("第一条"))
+    handler.close()
+    assert archive.loaded and not archive.entries
+    assert handler.baseFilename.endswith(f"time_sync_{day}.log")
+    assert (tmp_path / app_module.LOG_INDEX_FILE).exists()
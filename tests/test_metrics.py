@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标：Prometheus/OpenMetrics文本格式、JSON快照和/metrics HTTP服务
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from harness import load_app_module
+
+
+@pytest.fixture(scope="module")
+def metrics_module():
+    return load_app_module("metrics")
+
+
+@pytest.fixture
+def registry(metrics_module):
+    registry = metrics_module.MetricsRegistry("9.9.9")
+    registry.syncs = registry.counter("timesync_syncs_total", "同步次数", ("result",))
+    registry.offset = registry.gauge("timesync_offset_seconds", "最近一次的时钟偏差")
+    registry.delay = registry.histogram("timesync_delay_seconds", "往返延迟", (0.01, 0.1), ("server",))
+    registry.enable()
+    return registry
+
+
+def test_disabled_metrics_record_nothing(metrics_module):
+    registry = metrics_module.MetricsRegistry()
+    counter = registry.counter("x_total", "x")
+    histogram = registry.histogram("y", "y", (1.0,))
+    counter.inc()
+    histogram.observe(0.5)
+    assert counter.series == {} and histogram.series == {}
+    # 关闭后保留已有数据，不再记录新数据
+    registry.enable()
+    counter.inc(amount=2)
+    registry.enable(False)
+    counter.inc()
+    assert counter.series == {(): 2}
+    # 启用后注册的指标与注册表的状态一致
+    assert registry.counter("z_total", "z").enabled is False
+
+
+def test_render_prometheus(registry):
+    registry.syncs.inc("ok")
+    registry.syncs.inc("ok")
+    registry.syncs.inc("failed")
+    registry.offset.set(-0.0025)
+    for value in (0.005, 0.01, 0.05, 0.5):
+        registry.delay.observe(value, "a")
+    assert registry.render() == "\n".join([
+        '# HELP timesync_syncs_total 同步次数',
+        '# TYPE timesync_syncs_total counter',
+        'timesync_syncs_total{result="failed"} 1',
+        'timesync_syncs_total{result="ok"} 2',
+        '# HELP timesync_offset_seconds 最近一次的时钟偏差',
+        '# TYPE timesync_offset_seconds gauge',
+        'timesync_offset_seconds -0.0025',
+        '# HELP timesync_delay_seconds 往返延迟',
+        '# TYPE timesync_delay_seconds histogram',
+        # 分桶累计计数，上限等于观测值时落入该桶
+        'timesync_delay_seconds_bucket{server="a",le="0.01"} 2',
+        'timesync_delay_seconds_bucket{server="a",le="0.1"} 3',
+        'timesync_delay_seconds_bucket{server="a",le="+Inf"} 4',
+        'timesync_delay_seconds_sum{server="a"} 0.565',
+        'timesync_delay_seconds_count{server="a"} 4',
+    ]) + "\n"
+
+
+def test_render_openmetrics(registry):
+    registry.syncs.inc("ok")
+    text = registry.render(openmetrics=True)
+    # OpenMetrics中计数器的族名不带_total，样本名不变，最后以# EOF结束
+    assert '# TYPE timesync_syncs counter\n' in text
+    assert 'timesync_syncs_total{result="ok"} 1\n' in text
+    assert text.endswith("# EOF\n")
+
+
+def test_label_escaping(registry):
+    registry.delay.observe(0.02, 'C:\\ntp "x"\nserver')
+    assert 'timesync_delay_seconds_count{server="C:\\\\ntp \\"x\\"\\nserver"} 1' in registry.render()
+
+
+def test_snapshot(registry):
+    registry.syncs.inc("ok", amount=3)
+    registry.delay.observe(0.05, "a")
+    snapshot = registry.snapshot()
+    assert snapshot["version"] == "9.9.9" and snapshot["enabled"] is True
+    metrics = snapshot["metrics"]
+    assert metrics["timesync_syncs_total"]["series"] == [{"value": 3, "labels": {"result": "ok"}}]
+    assert metrics["timesync_offset_seconds"]["series"] == []
+    assert metrics["timesync_delay_seconds"]["series"] == [{
+        "count": 1, "sum": 0.05, "buckets": [["0.01", 0], ["0.1", 1], ["+Inf", 1]], "labels": {"server": "a"},
+    }]
+    json.dumps(snapshot)
+
+
+def test_metrics_server(metrics_module, registry):
+    registry.syncs.inc("ok")
+    server = metrics_module.MetricsServer(registry, '127.0.0.1', 0)
+    server.start()
+    base = "http://%s:%d" % server.address
+    try:
+        with urllib.request.urlopen(base + "/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"] == server.PROMETHEUS_CONTENT_TYPE
+            assert response.read().decode('utf-8') == registry.render()
+        request = urllib.request.Request(base + "/metrics", headers={"Accept": "application/openmetrics-text"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            assert response.headers["Content-Type"] == server.OPENMETRICS_CONTENT_TYPE
+            assert response.read().decode('utf-8').endswith("# EOF\n")
+        with urllib.request.urlopen(base + "/metrics.json", timeout=5) as response:
+            assert json.load(response)["metrics"]["timesync_syncs_total"]["series"][0]["value"] == 1
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(base + "/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.stop()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+NTP查询引擎：用本地替身服务器检查偏差计算、超时、KoD、错误模式和源时间戳校验
+"""
+
+import time
+import threading
+
+import pytest
+
+from fake_ntp_server import FakeNTPCluster, FakeServerConfig
+
+
+def query(app_module, configs, timeout=1.0, quorum=None, burst=1, seed=1):
+    """
+    启动替身服务器并查询一轮
+    返回：(采样列表, 失败原因字典, 服务器地址列表, 耗时秒)
+    """
+    with FakeNTPCluster(configs, seed=seed) as cluster:
+        targets, failures = app_module.DNSCache().resolve(cluster.addresses)
+        assert not failures
+        start = time.monotonic()
+        samples, failures = app_module.query_ntp_servers(
+            targets, timeout=timeout, quorum=quorum or len(targets), burst=burst)
+        return samples, failures, cluster.addresses, time.monotonic() - start
+
+
+def test_offset_and_delay(app_module):
+    samples, failures, addresses, _ = query(app_module, [FakeServerConfig(offset=0.25, latency=0.02)])
+    assert not failures
+    [sample] = samples
+    assert sample.server == addresses[0]
+    assert sample.offset == pytest.approx(0.25, abs=0.005)
+    assert sample.delay == pytest.approx(0.02, abs=0.01)
+    assert sample.stratum == 2
+
+
+def test_asymmetric_path_biases_offset(app_module):
+    # 请求方向占全部延迟时，偏差估计偏大半个往返延迟（NTP无法区分）
+    samples, _, _, _ = query(app_module, [FakeServerConfig(latency=0.04, asymmetry=1.0)])
+    assert samples[0].offset == pytest.approx(0.02, abs=0.005)
+
+
+def test_burst_samples_each_server(app_module):
+    samples, failures, addresses, _ = query(app_module, [FakeServerConfig(offset=-0.1)] * 2, burst=4)
+    assert not failures
+    assert sorted(sample.server for sample in samples) == sorted(addresses * 4)
+
+
+def test_quorum_returns_before_timeout(app_module):
+    samples, failures, _, elapsed = query(
+        app_module, [FakeServerConfig(), FakeServerConfig(), FakeServerConfig(loss=1.0)], timeout=2.0, quorum=2)
+    assert len(samples) == 2
+    assert elapsed < 1.0
+    assert not failures
+
+
+def test_silent_server_times_out(app_module):
+    samples, failures, addresses, elapsed = query(
+        app_module, [FakeServerConfig(offset=0.1), FakeServerConfig(loss=1.0)], timeout=0.3)
+    assert [sample.server for sample in samples] == [addresses[0]]
+    assert failures == {addresses[1]: "超时"}
+    assert 0.3 <= elapsed < 1.0
+
+
+def test_kiss_of_death(app_module):
+    samples, failures, addresses, _ = query(app_module, [FakeServerConfig(kod=1.0)])
+    assert not samples
+    assert "KoD" in failures[addresses[0]] and "RATE" in failures[addresses[0]]
+
+
+def test_wrong_mode(app_module):
+    samples, failures, addresses, _ = query(app_module, [FakeServerConfig(wrong_mode=1.0)])
+    assert not samples
+    assert failures[addresses[0]] == "响应模式错误: 3"
+
+
+def test_unsynchronized_server(app_module):
+    samples, failures, addresses, _ = query(app_module, [FakeServerConfig(leap=3)])
+    assert not samples
+    assert failures[addresses[0]] == "服务器时钟未同步"
+
+
+def test_origin_mismatch_is_ignored(app_module):
+    # 源时间戳不符的响应被丢弃，服务器最终按超时处理，不会产生采样
+    samples, failures, addresses, _ = query(
+        app_module, [FakeServerConfig(offset=5.0, bad_origin=1.0), FakeServerConfig(offset=0.1)], timeout=0.3)
+    assert [sample.server for sample in samples] == [addresses[1]]
+    assert failures == {addresses[0]: "超时"}
+
+
+def test_cancel(app_module):
+    cancel = threading.Event()
+    cancel.set()
+    with FakeNTPCluster([FakeServerConfig(loss=1.0)]) as cluster:
+        targets, _ = app_module.DNSCache().resolve(cluster.addresses)
+        start = time.monotonic()
+        samples, _ = app_module.query_ntp_servers(targets, timeout=5.0, quorum=1, cancel=cancel)
+    assert not samples
+    assert time.monotonic() - start < 1.0
+
+
+def test_timestamp_round_trip(app_module):
+    unix_ns = 1_700_000_000_123_456_789
+    value = app_module._to_ntp_timestamp(unix_ns)
+    assert abs(app_module._from_ntp_timestamp(value) - unix_ns) <= 1
+    assert app_module._build_ntp_request(unix_ns)[40:] == value.to_bytes(8, 'big')
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+自动同步调度：间隔自适应、失败退避和手动触发
+"""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+
+def result(offset):
+    return SimpleNamespace(offset=offset)
+
+
+@pytest.fixture
+def scheduler(app_module):
+    return app_module.AutoSyncScheduler(lambda: None, interval=1024, min_interval=64, max_interval=4096)
+
+
+def test_large_offset_halves_interval(scheduler):
+    assert scheduler.update(result(0.2)) == 512
+    assert scheduler.update(result(-0.2)) == 256
+    for _ in range(5):
+        scheduler.update(result(1.0))
+    assert scheduler.interval == 64
+
+
+def test_stable_rounds_double_interval(app_module, scheduler):
+    for _ in range(app_module.AUTO_SYNC_STABLE_ROUNDS - 1):
+        assert scheduler.update(result(0.001)) == 1024
+    assert scheduler.update(result(0.001)) == 2048
+    for _ in range(3 * app_module.AUTO_SYNC_STABLE_ROUNDS):
+        scheduler.update(result(0.001))
+    assert scheduler.interval == 4096
+
+
+def test_medium_offset_resets_stable_count(app_module, scheduler):
+    for _ in range(app_module.AUTO_SYNC_STABLE_ROUNDS - 1):
+        scheduler.update(result(0.001))
+    # 偏差在"稳定"和"较大"之间：间隔不变，连续稳定的轮数重新计算
+    assert scheduler.update(result(0.02)) == 1024
+    assert scheduler.update(result(0.001)) == 1024
+    assert scheduler.stable_count == 1
+
+
+def test_failure_backoff(scheduler):
+    # 失败后从最小间隔开始加倍重试，不超过当前间隔，也不改变当前间隔
+    assert [scheduler.update(None) for _ in range(6)] == [64, 128, 256, 512, 1024, 1024]
+    assert scheduler.interval == 1024
+    scheduler.update(result(0.01))
+    assert scheduler.failure_count == 0
+    assert scheduler.update(None) == 64
+
+
+def test_initial_interval_is_clamped(app_module):
+    assert app_module.AutoSyncScheduler(lambda: None, interval=1, min_interval=64).interval == 64
+    assert app_module.AutoSyncScheduler(lambda: None, interval=10 ** 6, max_interval=4096).interval == 4096
+
+
+def test_trigger_runs_sync_now(app_module):
+    done = threading.Event()
+    results = []
+    
+    def callback(value):
+        results.append(value)
+        done.set()
+    
+    scheduler = app_module.AutoSyncScheduler(lambda: result(0.001), interval=3600, callback=callback)
+    scheduler.start(delay=3600)
+    try:
+        assert scheduler.running
+        scheduler.trigger()
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert results[0].offset == 0.001
+    assert not scheduler.running
+
+
+def test_sync_exception_counts_as_failure(app_module):
+    done = threading.Event()
+    results = []
+    
+    def sync():
+        raise OSError("网络不可用")
+    
+    def callback(value):
+        results.append(value)
+        done.set()
+    
+    scheduler = app_module.AutoSyncScheduler(sync, interval=3600, min_interval=64, callback=callback)
+    scheduler.start()
+    try:
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert results == [None]
+    assert scheduler.failure_count == 1
+
+
+def test_interval_limit(app_module):
+    limits = [1500]
+    scheduler = app_module.AutoSyncScheduler(lambda: None, interval=1024, min_interval=64, max_interval=4096,
+                                             interval_limit=lambda: limits[-1])
+    
+    def stable():
+        for _ in range(app_module.AUTO_SYNC_STABLE_ROUNDS):
+            scheduler.update(result(0.001))
+        return scheduler.interval
+    
+    # 加倍时不超过漂移模型给出的上限
+    assert stable() == 1500
+    assert stable() == 1500
+    # 上限低于当前间隔时不缩短间隔；没有可信模型（None）时照常加倍
+    limits.append(500)
+    assert stable() == 1500
+    limits.append(None)
+    assert stable() == 3000
+
+
+def test_restart_while_syncing(app_module):
+    # 停止后马上重新启动：旧线程同步结束后看到自己的停止标志退出，不更新间隔也不回调
+    entered = threading.Event()
+    release = threading.Event()
+    results = []
+    
+    def sync():
+        entered.set()
+        release.wait(5)
+        return result(1.0)
+    
+    scheduler = app_module.AutoSyncScheduler(sync, interval=1024, min_interval=64, callback=results.append)
+    scheduler.start()
+    assert entered.wait(5)
+    old = scheduler._thread
+    scheduler.stop()
+    scheduler.start(delay=3600)
+    release.set()
+    old.join(5)
+    try:
+        assert not old.is_alive()
+        assert scheduler.running
+        assert results == []
+        assert scheduler.interval == 1024
+    finally:
+        scheduler.stop()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+时钟过滤与选择：时钟过滤、Marzullo交集算法和错误时钟剔除
+"""
+
+import pytest
+
+
+def make_sample(app_module, server, offset, delay=0.01, precision=-20, stratum=2,
+                root_delay=0.0, root_dispersion=0.0):
+    """
+    构造偏差和往返延迟为给定值的NTPSample（时间戳为纳秒）
+    """
+    t1 = 1_700_000_000_000_000_000
+    t4 = t1 + round(delay * 1e9)
+    t2 = t3 = t1 + round((delay / 2 + offset) * 1e9)
+    return app_module.NTPSample(server, 0, stratum, precision, root_delay, root_dispersion, b'LOCL',
+                                t1, t2, t3, t4)
+
+
+@pytest.fixture
+def selector(app_module):
+    return app_module.ClockSelector(min_dispersion=0.001)
+
+
+def test_sample_arithmetic(app_module):
+    sample = make_sample(app_module, "a", 0.25, delay=0.04)
+    assert sample.offset == pytest.approx(0.25)
+    assert sample.delay == pytest.approx(0.04)
+
+
+def test_filter_keeps_minimum_delay(app_module, selector):
+    samples = [
+        make_sample(app_module, "a", 0.030, delay=0.050),
+        make_sample(app_module, "a", 0.010, delay=0.010),
+        make_sample(app_module, "a", 0.020, delay=0.030),
+        make_sample(app_module, "b", -0.005, delay=0.020),
+    ]
+    peers = dict((best.server, (best, jitter)) for best, jitter in selector.filter(samples))
+    best, jitter = peers["a"]
+    assert best.delay == pytest.approx(0.010)
+    # 抖动：其余采样相对最佳采样的均方根
+    assert jitter == pytest.approx(((0.020 ** 2 + 0.010 ** 2) / 2) ** 0.5)
+    # 只有一个采样时，抖动取服务器的时钟精度
+    assert peers["b"][1] == pytest.approx(2.0 ** -20)
+
+
+def test_intersect_majority(selector):
+    assert selector.intersect([(0.0, 0.01), (0.005, 0.01), (0.008, 0.01)]) == pytest.approx((-0.002, 0.01))
+
+
+def test_intersect_allows_one_falseticker(selector):
+    low, high = selector.intersect([(0.0, 0.01), (0.005, 0.01), (0.008, 0.01), (1.0, 0.01)])
+    assert low <= 0.005 <= high
+    assert high < 0.99
+
+
+def test_intersect_no_majority(selector):
+    assert selector.intersect([(0.0, 0.01), (1.0, 0.01)]) is None
+    assert selector.intersect([(0.0, 0.01), (1.0, 0.01), (2.0, 0.01), (3.0, 0.01)]) is None
+
+
+def test_select_rejects_falseticker(app_module, selector):
+    samples = [make_sample(app_module, server, offset)
+               for server, offset in (("a", 0.100), ("b", 0.102), ("c", 0.098), ("bad", 3.0))]
+    estimate = selector.select(samples)
+    assert estimate.falsetickers == ["bad"]
+    assert sorted(estimate.survivors) == ["a", "b", "c"]
+    assert estimate.offset == pytest.approx(0.100, abs=0.002)
+
+
+def test_select_weights_by_root_distance(app_module, selector):
+    near = make_sample(app_module, "near", 0.1000, delay=0.002)
+    far = make_sample(app_module, "far", 0.1006, delay=0.100)
+    estimate = selector.select([near, far])
+    assert estimate.peer == "near"
+    assert estimate.stratum == near.stratum
+    assert estimate.delay == pytest.approx(0.002)
+    # 根距离越小权重越大，合并结果靠近近处的服务器
+    assert 0.1000 < estimate.offset < 0.1001
+
+
+def test_midpoint_outside_intersection(app_module, selector):
+    # 两个区间相交，但远处服务器的中点落在交集之外，按RFC 5905不能形成多数
+    near = make_sample(app_module, "near", 0.100, delay=0.002)
+    far = make_sample(app_module, "far", 0.110, delay=0.100)
+    assert selector.select([near, far]) is None
+
+
+def test_select_empty_or_split(app_module, selector):
+    assert selector.select([]) is None
+    assert selector.select([make_sample(app_module, "a", 0.0), make_sample(app_module, "b", 1.0)]) is None
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+局域网时间服务：令牌桶限速、KoD响应和同步状态（监听本机随机端口）
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from harness import load_app_module
+
+
+@pytest.fixture(scope="module")
+def server_module():
+    return load_app_module("server")
+
+
+def make_estimate(app_module, stratum=2):
+    return app_module.ClockEstimate(offset=0.001, delay=0.02, jitter=0.001, stratum=stratum, peer="203.0.113.7",
+                                    survivors=["203.0.113.7"], falsetickers=[])
+
+
+@pytest.fixture
+def running(server_module):
+    """
+    在后台线程中运行NTPServer，返回启动函数
+    """
+    stops = []
+    
+    def start(**kwargs):
+        server = server_module.NTPServer('127.0.0.1', 0, **kwargs)
+        stop, ready = threading.Event(), threading.Event()
+        thread = threading.Thread(target=server.run, args=(stop, ready), daemon=True)
+        thread.start()
+        assert ready.wait(5)
+        stops.append((stop, thread))
+        return server
+    
+    yield start
+    for stop, thread in stops:
+        stop.set()
+        thread.join(5)
+
+
+def exchange(app_module, server, count=1, timeout=0.3):
+    """
+    向服务器发送count个请求
+    返回：收到的响应列表
+    """
+    replies = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        for _ in range(count):
+            sock.sendto(app_module._build_ntp_request(time.time_ns()), server.address)
+            try:
+                replies.append(sock.recv(1024))
+            except socket.timeout:
+                pass
+    return replies
+
+
+def test_token_bucket(server_module):
+    server = server_module.NTPServer(rate=1.0, burst=4)
+    assert [server._allow("10.0.0.1", 0.0) for _ in range(4)] == [True] * 4
+    # 令牌耗尽：回复一次KoD，之后直接丢弃
+    assert server._allow("10.0.0.1", 0.0) == "kod"
+    assert server._allow("10.0.0.1", 0.5) is False
+    # 补充出新的令牌后恢复响应，再次耗尽时重新回复KoD
+    assert server._allow("10.0.0.1", 1.0) is True
+    assert server._allow("10.0.0.1", 1.0) == "kod"
+    # 各客户端的令牌桶互不影响
+    assert server._allow("10.0.0.2", 1.0) is True
+    # 长时间没有请求后令牌不超过桶容量
+    assert [server._allow("10.0.0.1", 100.0) for _ in range(5)] == [True] * 4 + ["kod"]
+
+
+def test_unsynchronized_reply(app_module, running):
+    server = running()
+    assert not server.synchronized
+    targets, _ = app_module.DNSCache().resolve([f"127.0.0.1:{server.address[1]}"])
+    samples, failures = app_module.query_ntp_servers(targets, timeout=1.0, quorum=1)
+    # 从未与上游同步时以LI=3响应，客户端会忽略本服务器
+    assert not samples
+    assert list(failures.values()) == ["服务器时钟未同步"]
+
+
+def test_synchronized_reply(app_module, running):
+    server = running(rate=0)
+    server.update(make_estimate(app_module, stratum=2))
+    assert server.synchronized
+    targets, _ = app_module.DNSCache().resolve([f"127.0.0.1:{server.address[1]}"])
+    samples, failures = app_module.query_ntp_servers(targets, timeout=1.0, quorum=1, burst=4)
+    assert not failures
+    assert len(samples) == 4
+    assert all(sample.stratum == 3 for sample in samples)
+    assert all(abs(sample.offset) < 0.01 for sample in samples)
+    assert samples[0].ref_id == bytes([203, 0, 113, 7])
+
+
+def test_kod_when_rate_limited(app_module, running):
+    server = running(rate=0.01, burst=2)
+    server.update(make_estimate(app_module))
+    replies = exchange(app_module, server, count=4)
+    # 两次正常响应、一次KoD RATE，之后不再响应
+    assert len(replies) == 3
+    assert [reply[1] for reply in replies] == [3, 3, 0]
+    assert replies[2][12:16] == b'RATE'
+    assert server.stats["kod"] == 1 and server.stats["limited"] == 1
+
+
+def test_invalid_requests_are_ignored(app_module, running):
+    server = running()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.3)
+        sock.sendto(b'\x1b' + bytes(10), server.address)          # 太短
+        sock.sendto(b'\x1c' + bytes(47), server.address)          # 服务器模式
+        with pytest.raises(socket.timeout):
+            sock.recv(1024)
+    assert server.stats["invalid"] == 2
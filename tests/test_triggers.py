@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+同步触发：时间跳变、睡眠唤醒和网络变化事件源，以及触发的最短间隔（用模拟的时钟和sysfs目录）
+"""
+
+import threading
+
+import pytest
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+
+class FakeSource:
+    """
+    依次返回给定触发原因的事件源
+    """
+    
+    def __init__(self, *reasons):
+        self.reasons = list(reasons)
+        self.resets = 0
+    
+    def poll(self):
+        return self.reasons.pop(0) if self.reasons else None
+    
+    def reset(self):
+        self.resets += 1
+
+
+def test_clock_jump(app_module):
+    wall, monotonic = FakeClock(1_700_000_000.0), FakeClock(500.0)
+    source = app_module.ClockJumpSource(threshold=2.0, wall=wall, monotonic=monotonic)
+    # 两个时钟一起走不算跳变
+    wall.now += 60
+    monotonic.now += 60
+    assert source.poll() is None
+    wall.now += 1.5
+    assert source.poll() is None
+    wall.now -= 30
+    assert source.poll() == "系统时间跳变 -30.0 秒"
+    assert source.poll() is None
+    # 程序自己调整时钟后reset，不当作事件
+    wall.now += 10
+    source.reset()
+    assert source.poll() is None
+
+
+def test_resume(app_module):
+    suspended = FakeClock(12.0)
+    source = app_module.ResumeSource(suspended, threshold=5.0)
+    suspended.now += 3
+    assert source.poll() is None
+    suspended.now += 3600
+    assert source.poll() == "从睡眠中唤醒（挂起约 3600 秒）"
+    assert source.poll() is None
+
+
+@pytest.fixture
+def network(app_module, tmp_path):
+    """
+    模拟的sysfs网卡目录和默认路由
+    返回：(NetworkSource, 设置网卡状态的函数, 路由地址列表)
+    """
+    sysfs = tmp_path / "net"
+    
+    def set_state(name, state):
+        (sysfs / name).mkdir(parents=True, exist_ok=True)
+        (sysfs / name / "operstate").write_text(state + "\n")
+    
+    set_state("lo", "unknown")
+    set_state("eth0", "down")
+    routes = [None]
+    return app_module.NetworkSource(sysfs, route=lambda: routes[-1]), set_state, routes
+
+
+def test_network_connect_triggers_after_stable(network):
+    source, set_state, routes = network
+    assert source.state == ((("eth0", "down"),), None)
+    set_state("eth0", "up")
+    routes.append("192.168.1.5")
+    # 状态变化后等下一次检查仍不变才触发
+    assert source.poll() is None
+    assert source.poll() == "网络已连接或切换（本机地址 192.168.1.5）"
+    assert source.poll() is None
+    # 切换网络（本机地址变化）
+    routes.append("10.0.0.8")
+    assert source.poll() is None
+    assert source.poll() == "网络已连接或切换（本机地址 10.0.0.8）"
+
+
+def test_network_flap_and_disconnect(network):
+    source, set_state, routes = network
+    set_state("eth0", "up")
+    routes.append("192.168.1.5")
+    source.reset()
+    # 只出现一次的状态不触发
+    set_state("eth0", "down")
+    assert source.poll() is None
+    set_state("eth0", "up")
+    assert source.poll() is None
+    assert source.poll() is None
+    # 断网不触发；lo的变化不影响
+    set_state("eth0", "down")
+    set_state("lo", "up")
+    routes.append(None)
+    assert source.poll() is None
+    assert source.poll() is None
+    assert source.state == ((("eth0", "down"),), None)
+
+
+def test_network_unreadable_interface(network, tmp_path):
+    source, _, _ = network
+    (tmp_path / "net" / "wlan0").mkdir()
+    assert source.read_state()[0] == (("eth0", "down"), ("wlan0", "unknown"))
+
+
+def test_watcher_min_gap(app_module):
+    clock = FakeClock(1000.0)
+    triggers = []
+    jump, network = FakeSource(None, "跳变", "跳变", None, "跳变"), FakeSource(None, "网络", None, None, None)
+    watcher = app_module.ResyncWatcher(triggers.append, [jump, network], min_gap=30, monotonic=clock)
+    assert watcher.check() == []
+    assert watcher.check() == ["跳变", "网络"]
+    assert triggers == ["跳变，网络"]
+    # min_gap内的事件不触发
+    clock.now += 10
+    assert watcher.check() == []
+    clock.now += 30
+    assert watcher.check() == []
+    assert watcher.check() == ["跳变"]
+    assert triggers == ["跳变，网络", "跳变"]
+    watcher.reset()
+    assert jump.resets == network.resets == 1
+
+
+def test_watcher_source_error(app_module):
+    class Broken:
+        def poll(self):
+            raise OSError("不可用")
+    
+    triggers = []
+    watcher = app_module.ResyncWatcher(triggers.append, [Broken(), FakeSource("网络")], min_gap=0)
+    assert watcher.check() == ["网络"]
+    assert triggers == ["网络"]
+
+
+def test_watcher_thread(app_module):
+    triggered = threading.Event()
+    watcher = app_module.ResyncWatcher(lambda reason: triggered.set(), [FakeSource(None, "跳变")],
+                                       interval=0.01, min_gap=0)
+    watcher.start()
+    try:
+        assert triggered.wait(5)
+    finally:
+        watcher.stop()
+    assert not watcher.running
+
+
+def test_watcher_restart_stops_old_thread(app_module):
+    polling, release = threading.Event(), threading.Event()
+    
+    class SlowSource(FakeSource):
+        def poll(self):
+            # 第一次检查时停住，在旧线程检查期间停止并重新启动
+            if not polling.is_set():
+                polling.set()
+                release.wait(5)
+            return None
+    
+    watcher = app_module.ResyncWatcher(lambda reason: None, [SlowSource()], interval=0.01, min_gap=0)
+    watcher.start()
+    old = watcher._thread
+    assert polling.wait(5)
+    watcher.stop()
+    watcher.start()
+    release.set()
+    try:
+        # 旧线程检查完后必须退出，不能与新线程同时检查
+        old.join(1)
+        assert not old.is_alive()
+        assert watcher.running
+    finally:
+        watcher.stop()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+界面事件：工作线程到界面线程的事件队列和下载进度回调（用模拟的主窗口和时钟，不需要Tk）
+"""
+
+import threading
+
+import pytest
+
+
+class FakeRoot:
+    """
+    模拟Tk主窗口的after/after_cancel：只记录定时任务，由测试调用run_next执行
+    """
+    
+    def __init__(self):
+        self.scheduled = []
+        self.cancelled = []
+    
+    def after(self, ms, func):
+        self.scheduled.append((ms, func))
+        return len(self.scheduled)
+    
+    def after_cancel(self, after_id):
+        self.cancelled.append(after_id)
+    
+    def run_next(self):
+        ms, func = self.scheduled[-1]
+        func()
+        return ms
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+    
+    def monotonic(self):
+        return self.now
+    
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def events(app_module):
+    root = FakeRoot()
+    events = app_module.UIEventQueue(root, coalesce=("progress",))
+    events.start()
+    return root, events
+
+
+def test_dispatch_in_order(app_module, events):
+    root, queue = events
+    seen = []
+    queue.on("status", lambda text: seen.append(("status", text)))
+    queue.on("done", lambda ok, value: seen.append(("done", ok, value)))
+    worker = threading.Thread(target=lambda: (queue.post("status", "同步中"), queue.callback("done")(True, 0.01)))
+    worker.start()
+    worker.join()
+    assert seen == []
+    # 事件只在界面线程的定时任务中分发；有事件时下一帧间隔较短
+    assert root.run_next() == app_module.UI_IDLE_MS
+    assert seen == [("status", "同步中"), ("done", True, 0.01)]
+    assert root.scheduled[-1][0] == app_module.UI_FRAME_MS
+    root.run_next()
+    assert root.scheduled[-1][0] == app_module.UI_IDLE_MS
+
+
+def test_coalesce_keeps_latest(events):
+    root, queue = events
+    seen = []
+    queue.on("progress", lambda done, total: seen.append(("progress", done)))
+    queue.on("status", lambda text: seen.append(("status", text)))
+    for done in range(5):
+        queue.post("progress", done, 10)
+    queue.post("status", "下载中")
+    queue.post("progress", 9, 10)
+    queue.post("progress", 10, 10)
+    root.run_next()
+    # 合并的事件只分发最新一条，并保持与其他事件的先后顺序
+    assert seen == [("progress", 4), ("status", "下载中"), ("progress", 10)]
+
+
+def test_frame_budget(app_module, events, monkeypatch):
+    root, queue = events
+    clock = FakeClock(0.0)
+    monkeypatch.setattr(app_module, "time", clock)
+    seen = []
+    
+    def slow(value):
+        seen.append(value)
+        clock.now += app_module.UI_FRAME_BUDGET * 0.6
+    
+    queue.on("item", slow)
+    for i in range(5):
+        queue.post("item", i)
+    # 超出每帧的时间上限后，其余事件留到下一帧
+    assert root.run_next() == app_module.UI_IDLE_MS
+    assert seen == [0, 1]
+    assert root.run_next() == app_module.UI_FRAME_MS
+    assert seen == [0, 1, 2, 3]
+
+
+def test_handler_error_does_not_stop_queue(events):
+    root, queue = events
+    seen = []
+    queue.on("bad", lambda: 1 / 0)
+    queue.on("good", lambda: seen.append("good"))
+    queue.post("bad")
+    queue.post("unknown")
+    queue.post("good")
+    root.run_next()
+    assert seen == ["good"]
+
+
+def test_stop(events):
+    root, queue = events
+    queue.stop()
+    assert root.cancelled == [1]
+
+
+def test_transfer_meter(app_module, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(app_module, "time", clock)
+    reports = []
+    meter = app_module.TransferMeter(lambda *args: reports.append(args), interval=0.1, window=2.0)
+    meter(0, 1000)
+    assert reports == [(0, 1000, 0.0)]
+    # 距上次回调不到interval的进度被跳过
+    clock.now += 0.05
+    meter(100, 1000)
+    assert len(reports) == 1
+    clock.now += 0.15
+    meter(200, 1000)
+    assert reports[-1] == (200, 1000, pytest.approx(1000))
+    # 速度只按最近window秒的数据计算
+    for _ in range(30):
+        clock.now += 0.2
+        meter(reports[-1][0] + 10, 1000)
+    assert reports[-1][2] == pytest.approx(50)
+    # 下载完成时总会回调
+    meter(1000, 1000)
+    assert reports[-1][0] == 1000
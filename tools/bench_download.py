@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+更新下载基准测试
+用本地HTTP替身服务器（tools/fake_http_server.py）模拟两个单连接限速的镜像，
+对比旧的逐镜像整体下载（8KB分块）和UpdateDownloader（连接池 + Range并行 + 多镜像），
+并测试链路中断后的断点续传，以及混入高延迟镜像、中途变慢镜像时的镜像竞速和切换。
+
+用法：
+  python tools/bench_download.py
+  python tools/bench_download.py --size 16777216 --rate 1048576 --workers 8
+  python tools/bench_download.py --check      # 超出阈值时返回非0退出码
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+from fake_http_server import FakeHTTPServer, HTTPServerConfig
+from harness import load_app_module
+
+PATH = "/dist/ZGIRC_TimeSync.exe"
+
+# 回归阈值
+MIN_SPEEDUP = 2.0               # UpdateDownloader相对旧实现（单连接）的最低加速倍数
+MAX_RESUME_FETCHED = 0.6        # 中断后续传时补传的数据占文件大小的上限（中断时已下载约一半）
+MAX_RACE_SLOWDOWN = 2.0         # 混入高延迟镜像（3秒）时的耗时上限，相对两个正常镜像时的耗时倍数
+MAX_STALL_SLOWDOWN = 3.0        # 混入变慢镜像时的耗时上限，相对旧实现的耗时倍数
+
+
+def baseline_download(url, dest):
+    """
+    旧实现：单连接整体下载，8KB分块写入
+    """
+    import requests
+    
+    response = requests.get(url, timeout=30, verify=False, stream=True)
+    with open(dest, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            if chunk:
+                f.write(chunk)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="更新下载基准测试")
+    parser.add_argument('--size', type=int, default=8 * 1024 * 1024, help='文件大小（字节），默认8MB')
+    parser.add_argument('--rate', type=int, default=2 * 1024 * 1024,
+                        help='每个连接的限速（字节/秒），默认2MB/s')
+    parser.add_argument('--workers', type=int, default=4, help='并行连接数，默认4')
+    parser.add_argument('--check', action='store_true', help='超出回归阈值时返回非0退出码')
+    args = parser.parse_args()
+    
+    app = load_app_module()
+    logger = logging.getLogger("bench_download")
+    logger.disabled = True
+    body = os.urandom(args.size)
+    workdir = Path(tempfile.mkdtemp(prefix="zgirc_dl_"))
+    config = HTTPServerConfig(rate=args.rate)
+    failed = []
+    
+    with FakeHTTPServer({PATH: body}, config) as mirror_a, \
+            FakeHTTPServer({PATH: body}, HTTPServerConfig(rate=args.rate)) as mirror_b:
+        urls = [mirror_a.url(PATH), mirror_b.url(PATH)]
+        size_mb = args.size / 1024 / 1024
+        
+        old = timed(lambda: baseline_download(urls[0], workdir / "old.exe"))
+        print(f"旧实现（单连接）:       {old:6.2f}s  {size_mb / old:6.2f} MB/s")
+        
+        dest = workdir / "new.exe"
+        new = timed(lambda: app.UpdateDownloader(urls, dest, workers=args.workers, logger=logger).download())
+        assert dest.read_bytes() == body, "下载内容不一致"
+        print(f"UpdateDownloader:       {new:6.2f}s  {size_mb / new:6.2f} MB/s  "
+              f"（{old / new:.1f}倍）")
+        if old / new < MIN_SPEEDUP:
+            failed.append(f"加速 {old / new:.1f}倍 < {MIN_SPEEDUP}倍")
+        
+        # 断点续传：传输一半后链路中断，再次下载只需补齐剩余部分
+        dest.unlink()
+        for server in (mirror_a, mirror_b):
+            server.config.budget = args.size // 4
+        try:
+            app.UpdateDownloader(urls, dest, workers=args.workers, logger=logger).download()
+        except Exception:
+            pass
+        for server in (mirror_a, mirror_b):
+            server.config.budget = None
+        
+        before = mirror_a.stats["bytes"] + mirror_b.stats["bytes"]
+        resumed = timed(lambda: app.UpdateDownloader(urls, dest, workers=args.workers, logger=logger).download())
+        fetched = mirror_a.stats["bytes"] + mirror_b.stats["bytes"] - before
+        assert dest.read_bytes() == body, "续传内容不一致"
+        print(f"中断后续传:             {resumed:6.2f}s  补传 {fetched / args.size:.0%} 的数据")
+        if fetched / args.size > MAX_RESUME_FETCHED:
+            failed.append(f"续传补传 {fetched / args.size:.0%} > {MAX_RESUME_FETCHED:.0%}")
+    
+    # 镜像竞速：高延迟镜像不等它探测完成，也不分配分块
+    with FakeHTTPServer({PATH: body}, HTTPServerConfig(rate=args.rate)) as fast, \
+            FakeHTTPServer({PATH: body}, HTTPServerConfig(rate=args.rate, latency=3.0)) as slow:
+        dest = workdir / "race.exe"
+        elapsed = timed(lambda: app.UpdateDownloader([slow.url(PATH), fast.url(PATH)], dest,
+                                                     workers=args.workers, logger=logger).download())
+        assert dest.read_bytes() == body, "下载内容不一致"
+        print(f"混入高延迟镜像(3s):     {elapsed:6.2f}s  {size_mb / elapsed:6.2f} MB/s")
+        if elapsed > new * MAX_RACE_SLOWDOWN:
+            failed.append(f"混入高延迟镜像耗时 {elapsed:.2f}s > {new * MAX_RACE_SLOWDOWN:.2f}s")
+    
+    # 中途变慢：低速镜像的分块在测速窗口后切换到正常镜像继续
+    app.UPDATE_STALL_WINDOW = 1
+    with FakeHTTPServer({PATH: body}, HTTPServerConfig(rate=args.rate)) as fast, \
+            FakeHTTPServer({PATH: body}, HTTPServerConfig(rate=4 * 1024)) as stalled:
+        dest = workdir / "stall.exe"
+        downloader = app.UpdateDownloader([stalled.url(PATH), fast.url(PATH)], dest,
+                                          workers=args.workers, logger=logger)
+        elapsed = timed(downloader.download)
+        assert dest.read_bytes() == body, "下载内容不一致"
+        switched = downloader.mirror_stats[stalled.url(PATH)]["failures"]
+        print(f"混入变慢镜像(4KB/s):    {elapsed:6.2f}s  {size_mb / elapsed:6.2f} MB/s  "
+              f"切换 {switched} 个分块")
+        if not switched or elapsed > old * MAX_STALL_SLOWDOWN:
+            failed.append(f"变慢镜像: 切换 {switched} 个分块，耗时 {elapsed:.2f}s "
+                          f"（上限 {old * MAX_STALL_SLOWDOWN:.2f}s）")
+    
+    if args.check and failed:
+        print("\n超出回归阈值:")
+        for line in failed:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+时钟漂移估计基准测试
+用模拟时间驱动自动同步：本机时钟有固定的频率误差，并随"温度"按天缓慢变化，每次测量带噪声；
+每轮同步写入真实的SyncHistory，由TimeSyncApp.update_drift估计频率误差并通过假的adjtimex校正频率，
+间隔由AutoSyncScheduler决定。分别统计关闭和开启频率校正时一周内的同步次数、每轮测得的偏差，
+以及最后断网一天后积累的偏差（偏差分位数不含第一天，模型尚在收敛）。模拟时间不需要真的等待，几秒内完成。
+
+用法：
+  python tools/bench_drift.py
+  python tools/bench_drift.py --ppm -60 --wander 2 --days 14
+  python tools/bench_drift.py --check         # 超出阈值时返回非0退出码
+"""
+
+import sys
+import math
+import random
+import argparse
+
+from harness import make_app, load_app_module
+
+# 回归阈值
+MIN_POLL_REDUCTION = 4      # 开启频率校正后同步次数至少减少到1/4
+MAX_OFFSET_P95_MS = 10.0    # 开启频率校正后每轮测得偏差（第一天之后）的p95上限（毫秒）
+MAX_OUTAGE_RATIO = 0.2      # 开启频率校正后断网积累的偏差不超过关闭时的该比例
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))] if ordered else float('nan')
+
+
+def simulate(correct, ppm, wander, noise, days, outage, seed=1):
+    """
+    模拟days天的自动同步，最后outage秒不同步
+    correct: 是否校正频率（配置drift_correction）
+    ppm: 本机时钟的频率误差（正数表示偏慢）
+    wander: 频率误差按天变化的幅度（ppm）
+    noise: 单次测量误差（秒，标准差）
+    返回：统计结果字典
+    """
+    module = load_app_module()
+    app, fake = make_app({"drift_correction": correct, "clock_mode": "step"})
+    rng = random.Random(seed)
+    scheduler = module.AutoSyncScheduler(lambda: None, interval_limit=app.drift_interval_limit, logger=app.logger)
+    
+    def true_ppm(t):
+        return ppm + wander * math.sin(2 * math.pi * t / 86400)
+    
+    start = now = 1_700_000_000.0
+    end = start + days * 86400
+    error = 0.0         # 真实时间 - 本机时间（秒）
+    polls = 0
+    offsets = []
+    step = 60.0         # 积分步长（秒）
+    next_poll = now
+    while True:
+        if now >= next_poll:
+            if now >= end:
+                break
+            measured = error + rng.gauss(0, noise)
+            estimate = module.ClockEstimate(offset=measured, delay=0.02, jitter=noise, stratum=2,
+                                            peer="sim", survivors=[], falsetickers=[])
+            app.clock_backend.step(measured)
+            error -= measured
+            app.sync_history.record("step", estimate, when=now, freq=fake.freq)
+            app.update_drift(now=now)
+            polls += 1
+            if now >= start + 86400:
+                offsets.append(abs(measured))
+            next_poll = now + scheduler.update(estimate)
+        # 两次同步之间，按（频率误差 - 频率校正）积累偏差
+        dt = min(step, max(next_poll - now, 1e-3))
+        error += (true_ppm(now) - fake.freq) * 1e-6 * dt
+        now += dt
+    
+    # 断网：outage秒内不同步
+    outage_end = now + outage
+    while now < outage_end:
+        dt = min(step, outage_end - now)
+        error += (true_ppm(now) - fake.freq) * 1e-6 * dt
+        now += dt
+    
+    app.sync_history.close()
+    model = app.drift_model
+    return {
+        "polls_per_day": polls / days,
+        "offset_p50": percentile(offsets, 50),
+        "offset_p95": percentile(offsets, 95),
+        "outage_error": abs(error),
+        "interval": scheduler.interval,
+        "model": model,
+        "freq": fake.freq,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="时钟漂移估计基准测试")
+    parser.add_argument('--ppm', type=float, default=35.0, help='本机时钟的频率误差（ppm），默认35')
+    parser.add_argument('--wander', type=float, default=0.5, help='频率误差按天变化的幅度（ppm），默认0.5')
+    parser.add_argument('--noise', type=float, default=0.0005, help='单次测量误差（秒），默认0.0005')
+    parser.add_argument('--days', type=float, default=7, help='模拟天数，默认7')
+    parser.add_argument('--outage', type=float, default=86400, help='最后断网的时间（秒），默认86400')
+    parser.add_argument('--check', action='store_true', help='超出回归阈值时返回非0退出码')
+    args = parser.parse_args()
+    
+    results = {}
+    for correct in (False, True):
+        r = results[correct] = simulate(correct, args.ppm, args.wander, args.noise, args.days, args.outage)
+        model = r["model"]
+        print(f"{'开启' if correct else '关闭'}频率校正: 每天同步 {r['polls_per_day']:6.1f} 次，"
+              f"最终间隔 {r['interval']:6.0f}s，偏差p50 {r['offset_p50'] * 1000:6.2f}ms  p95 {r['offset_p95'] * 1000:6.2f}ms，"
+              f"断网 {args.outage / 3600:.0f} 小时后偏差 {r['outage_error'] * 1000:8.2f}ms；"
+              f"估计 {model.ppm if model else float('nan'):+.3f}ppm，频率校正 {r['freq']:+.3f}ppm")
+    
+    off, on = results[False], results[True]
+    failed = []
+    if on["polls_per_day"] * MIN_POLL_REDUCTION > off["polls_per_day"]:
+        failed.append(f"同步次数 {on['polls_per_day']:.1f}/天，未减少到关闭时（{off['polls_per_day']:.1f}/天）的1/{MIN_POLL_REDUCTION}")
+    if on["offset_p95"] * 1000 > MAX_OFFSET_P95_MS:
+        failed.append(f"偏差p95 {on['offset_p95'] * 1000:.2f}ms > {MAX_OFFSET_P95_MS}ms")
+    if on["outage_error"] > off["outage_error"] * MAX_OUTAGE_RATIO:
+        failed.append(f"断网后偏差 {on['outage_error'] * 1000:.2f}ms > 关闭时的{MAX_OUTAGE_RATIO:.0%}")
+    if on["model"] is None or abs(on["model"].ppm - args.ppm) > args.wander + 1:
+        failed.append("频率误差估计不准确")
+    
+    if args.check and failed:
+        print("\n超出回归阈值:")
+        for line in failed:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
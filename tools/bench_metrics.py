@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标基准测试
+测量指标记录操作在关闭和启用时的单次开销，并用NTP替身服务器跑几轮完整同步，
+从/metrics和/metrics.json抓取结果，检查格式和计数是否正确。
+
+用法：
+  python tools/bench_metrics.py
+  python tools/bench_metrics.py --calls 1000000
+  python tools/bench_metrics.py --check        # 超出阈值时返回非0退出码
+"""
+
+import re
+import sys
+import json
+import timeit
+import argparse
+import urllib.request
+
+from fake_ntp_server import FakeNTPCluster, FakeServerConfig
+from harness import make_app, load_app_module
+
+# 回归阈值
+MAX_DISABLED_NS = 300       # 关闭时单次记录的开销上限（纳秒）
+MAX_ENABLED_NS = 3000       # 启用时单次记录的开销上限（纳秒）
+
+# Prometheus文本格式的一行样本：名称{标签} 数值
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[^}]*\})? (\+Inf|-?[0-9.e+-]+)$')
+
+
+def measure_overhead(app, calls):
+    """
+    返回：{"disabled"/"enabled": {"counter"/"histogram": 每次纳秒}}
+    """
+    registry = app.MetricsRegistry()
+    counter = registry.counter("bench_total", "bench", ("kind",))
+    histogram = registry.histogram("bench_seconds", "bench", app.METRICS_TIME_BUCKETS, ("server",))
+    
+    result = {}
+    for state in ("disabled", "enabled"):
+        registry.enable(state == "enabled")
+        result[state] = {
+            "counter": timeit.timeit(lambda: counter.inc("ntp"), number=calls) / calls * 1e9,
+            "histogram": timeit.timeit(lambda: histogram.observe(0.0123, "time1"), number=calls) / calls * 1e9,
+        }
+    # 减去lambda调用本身的开销
+    baseline = timeit.timeit(lambda: None, number=calls) / calls * 1e9
+    for values in result.values():
+        for kind in values:
+            values[kind] = max(0.0, values[kind] - baseline)
+    return result
+
+
+def fetch(url, accept=None):
+    request = urllib.request.Request(url, headers={"Accept": accept} if accept else {})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.headers.get("Content-Type"), response.read().decode('utf-8')
+
+
+def check_endpoint(rounds):
+    """
+    跑rounds轮同步后抓取指标
+    返回：(失败原因列表, JSON快照)
+    """
+    failed = []
+    configs = [FakeServerConfig(offset=0.25, latency=0.01) for _ in range(3)] + [FakeServerConfig(loss=1.0)]
+    with FakeNTPCluster(configs, seed=1) as cluster:
+        app, _ = make_app({"ntp_servers": cluster.addresses, "ntp_timeout": 0.5, "ntp_quorum": 4,
+                             "clock_mode": "step"})
+        server = app.start_metrics(port=0)
+        for _ in range(rounds):
+            app.sync_once()
+        base = "http://%s:%d" % server.address
+        
+        content_type, text = fetch(base + "/metrics")
+        if not content_type.startswith("text/plain"):
+            failed.append(f"/metrics的Content-Type为 {content_type}")
+        for line in text.splitlines():
+            if not line.startswith("#") and not SAMPLE_LINE.match(line):
+                failed.append(f"无法解析的行: {line}")
+                break
+        
+        _, openmetrics = fetch(base + "/metrics", accept="application/openmetrics-text")
+        if not openmetrics.endswith("# EOF\n") or "# TYPE zgirc_timeouts counter" not in openmetrics:
+            failed.append("OpenMetrics格式不正确")
+        
+        _, body = fetch(base + "/metrics.json")
+        snapshot = json.loads(body)
+        server.stop()
+    
+    metrics = snapshot["metrics"]
+    durations = metrics["zgirc_sync_duration_seconds"]["series"]
+    if sum(item["count"] for item in durations) != rounds:
+        failed.append(f"同步耗时的记录次数 {sum(item['count'] for item in durations)} != {rounds}")
+    rtt = metrics["zgirc_ntp_rtt_seconds"]["series"]
+    if len(rtt) != 3:
+        failed.append(f"往返延迟的服务器数 {len(rtt)} != 3")
+    timeouts = {item["labels"]["kind"]: item["value"] for item in metrics["zgirc_timeouts_total"]["series"]}
+    if timeouts.get("ntp") != rounds:
+        failed.append(f"NTP超时次数 {timeouts.get('ntp')} != {rounds}")
+    return failed, snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行指标基准测试")
+    parser.add_argument('--calls', type=int, default=200000, help='测量开销时的调用次数，默认200000')
+    parser.add_argument('--rounds', type=int, default=5, help='抓取前的同步轮数，默认5')
+    parser.add_argument('--check', action='store_true', help='超出回归阈值时返回非0退出码')
+    args = parser.parse_args()
+    
+    app = load_app_module()
+    failed = []
+    
+    overhead = measure_overhead(app, args.calls)
+    for state, limit in (("disabled", MAX_DISABLED_NS), ("enabled", MAX_ENABLED_NS)):
+        values = overhead[state]
+        print(f"{'关闭' if state == 'disabled' else '启用'}时单次开销: 计数器 {values['counter']:.0f}ns，"
+              f"直方图 {values['histogram']:.0f}ns")
+        if max(values.values()) > limit:
+            failed.append(f"{state} 单次开销 {max(values.values()):.0f}ns > {limit}ns")
+    
+    endpoint_failed, snapshot = check_endpoint(args.rounds)
+    durations = snapshot["metrics"]["zgirc_sync_duration_seconds"]["series"]
+    print(f"/metrics: {args.rounds} 轮同步，"
+          + "，".join(f"{item['labels']['result']} {item['count']} 次（平均 {item['sum'] / item['count'] * 1000:.1f}ms）"
+                     for item in durations))
+    failed += endpoint_failed
+    
+    if args.check and failed:
+        print("\n超出回归阈值:")
+        for line in failed:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
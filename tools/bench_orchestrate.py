@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+批量同步（orchestrate子命令）基准测试
+用替身代理（tools/fake_agent.py）模拟几百台电脑，其中一部分同步失败或不响应，
+统计SyncOrchestrator完成全部主机的耗时；另外启动一个真实的SyncAgent
+（NTP替身服务器 + 假时钟）检查协议、口令和结果格式。
+
+用法：
+  python tools/bench_orchestrate.py
+  python tools/bench_orchestrate.py --hosts 1000 --workers 128
+  python tools/bench_orchestrate.py --check       # 超出阈值时返回非0退出码
+"""
+
+import sys
+import asyncio
+import argparse
+import threading
+
+from fake_agent import FakeAgentCluster, FakeAgentConfig
+from fake_ntp_server import FakeNTPCluster, FakeServerConfig
+from harness import make_app, load_app_module
+
+# 回归阈值
+MAX_ELAPSED = 10.0      # 500台主机（每台0.2秒，1%不响应，超时2秒）的总耗时上限（秒）
+
+
+def run_orchestrator(fleet, hosts, action="query", workers=64, timeout=2.0, token=None):
+    """
+    运行一次批量任务
+    返回：(结果列表, 汇总)
+    """
+    results = []
+    orchestrator = fleet.SyncOrchestrator(hosts, action, workers=workers, timeout=timeout, token=token)
+    summary = asyncio.run(orchestrator.run(results.append))
+    return results, summary
+
+
+def bench_fleet(fleet, count, workers, latency):
+    config = FakeAgentConfig(latency=latency, failure=0.05, silent=0.01)
+    with FakeAgentCluster(count, config, seed=1) as cluster:
+        results, summary = run_orchestrator(fleet, cluster.hosts, "sync", workers=workers)
+    sequential = count * (latency + config.jitter / 2)
+    print(f"{count} 台主机（{workers} 并发）: 耗时 {summary['elapsed']:.2f}s，"
+          f"逐台执行约 {sequential:.0f}s；成功 {summary['ok']}，失败 {summary['failed']} {summary['failures']}")
+    return summary
+
+
+def check_real_agent(fleet):
+    """
+    真实的SyncAgent：无口令时拒绝sync，带口令时query/sync都成功
+    """
+    with FakeNTPCluster([FakeServerConfig(offset=0.25, latency=0.01) for _ in range(3)], seed=1) as ntp:
+        app, fake = make_app({"ntp_servers": ntp.addresses, "ntp_timeout": 1, "clock_mode": "step"})
+        failed = []
+        for token in (None, "secret"):
+            agent = fleet.SyncAgent(app, '127.0.0.1', 0, token=token)
+            stop, ready = threading.Event(), threading.Event()
+            threading.Thread(target=agent.run, args=(stop, ready), daemon=True).start()
+            ready.wait()
+            host = "%s:%d" % agent.address
+            
+            query, _ = run_orchestrator(fleet, [host], "query", token=token)
+            sync, _ = run_orchestrator(fleet, [host], "sync", token=token)
+            stop.set()
+            print(f"真实代理（口令 {token}）: query {query[0]['ok']} "
+                  f"{query[0].get('offset', 0) * 1000:+.1f}ms，sync {sync[0]['ok']} "
+                  f"{sync[0].get('clock_action') or sync[0].get('error')}")
+            if not query[0]["ok"] or abs(query[0]["offset"] - 0.25) > 0.01:
+                failed.append(f"口令 {token}: query结果异常")
+            if sync[0]["ok"] != bool(token):
+                failed.append(f"口令 {token}: sync结果异常")
+        if len(fake.steps) != 1:
+            failed.append(f"时钟调整次数 {len(fake.steps)} != 1")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量同步基准测试")
+    parser.add_argument('--hosts', type=int, default=500, help='模拟的主机数，默认500')
+    parser.add_argument('--workers', type=int, default=64, help='并发任务数，默认64')
+    parser.add_argument('--latency', type=float, default=0.2, help='每台主机的同步耗时（秒），默认0.2')
+    parser.add_argument('--check', action='store_true', help='超出回归阈值时返回非0退出码')
+    args = parser.parse_args()
+    
+    fleet = load_app_module("fleet")
+    failed = []
+    
+    summary = bench_fleet(fleet, args.hosts, args.workers, args.latency)
+    if summary["hosts"] != args.hosts:
+        failed.append(f"结果数 {summary['hosts']} != {args.hosts}")
+    if summary["elapsed"] > MAX_ELAPSED:
+        failed.append(f"耗时 {summary['elapsed']:.2f}s > {MAX_ELAPSED}s")
+    
+    failed += check_real_agent(fleet)
+    
+    if args.check and failed:
+        print("\n超出回归阈值:")
+        for line in failed:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
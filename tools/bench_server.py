@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+局域网NTP服务（serve子命令）基准测试
+在本机启动NTPServer，用多个进程并发发送请求（每个进程保持一定数量的在途请求），
+统计每秒响应数和往返延迟；另外验证单个客户端超出限速时收到KoD、多余的请求被丢弃，
+以及程序自己的NTP客户端能从该服务器正常取时间。
+
+用法：
+  python tools/bench_server.py
+  python tools/bench_server.py --clients 8 --window 128 --seconds 5
+  python tools/bench_server.py --check        # 低于阈值时返回非0退出码
+"""
+
+import sys
+import time
+import struct
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from harness import load_app_module
+
+# 回归阈值
+MIN_REPLIES_PER_SECOND = 5000
+
+
+def load_client(address, seconds, window, results):
+    """
+    负载进程：保持window个在途请求，持续seconds秒
+    请求的发送时间戳写入transmit字段，服务器原样放回origin字段，据此计算往返延迟
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(address)
+    sock.settimeout(0.2)
+    header = b'\x23' + 39 * b'\0'
+    
+    sent = received = lost = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    outstanding = 0
+    while time.perf_counter() < deadline:
+        while outstanding < window:
+            sock.send(header + struct.pack('!Q', time.perf_counter_ns()))
+            sent += 1
+            outstanding += 1
+        try:
+            data = sock.recv(1024)
+        except socket.timeout:
+            # 丢包：放弃所有在途请求，重新填满窗口
+            lost += outstanding
+            outstanding = 0
+            continue
+        outstanding -= 1
+        received += 1
+        if received % 16 == 0:
+            latencies.append(time.perf_counter_ns() - struct.unpack('!Q', data[24:32])[0])
+    sock.close()
+    results.put((sent, received, lost, latencies))
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))] if ordered else float('nan')
+
+
+def start_server(app, **kwargs):
+    """
+    在后台线程中启动NTPServer，返回(server, stop)
+    """
+    logger = logging.getLogger("bench_server")
+    logger.disabled = True
+    server = load_app_module("server").NTPServer('127.0.0.1', 0, logger=logger, **kwargs)
+    stop = threading.Event()
+    ready = threading.Event()
+    threading.Thread(target=server.run, args=(stop, ready), daemon=True).start()
+    ready.wait()
+    return server, stop
+
+
+def fake_upstream(app):
+    """
+    模拟一次成功的上游同步结果
+    """
+    return app.ClockEstimate(offset=0.0, delay=0.004, jitter=0.0005, stratum=2,
+                             peer="time1.aliyun.com/203.107.6.88", survivors=[], falsetickers=[])
+
+
+def bench_throughput(app, clients, window, seconds):
+    server, stop = start_server(app, rate=0)
+    server.update(fake_upstream(app))
+    
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=load_client, args=(server.address, seconds, window, results))
+               for _ in range(clients)]
+    for worker in workers:
+        worker.start()
+    totals = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    stop.set()
+    
+    received = sum(item[1] for item in totals)
+    lost = sum(item[2] for item in totals)
+    latencies = [value / 1e6 for item in totals for value in item[3]]
+    return {
+        "rps": received / seconds,
+        "lost": lost,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "stats": dict(server.stats),
+    }
+
+
+def bench_rate_limit(app, rate, burst):
+    """
+    单个客户端以100次/秒请求3秒：应得到约burst + 3*rate次响应，
+    每次令牌耗尽时收到一个KoD（最多1 + 3*rate个），其余被丢弃
+    """
+    server, stop = start_server(app, rate=rate, burst=burst)
+    server.update(fake_upstream(app))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(server.address)
+    sock.settimeout(0.005)
+    
+    replies = kods = 0
+    for _ in range(300):
+        sock.send(b'\x23' + 47 * b'\0')
+        try:
+            data = sock.recv(1024)
+            if data[1] == 0:
+                kods += 1
+            else:
+                replies += 1
+        except socket.timeout:
+            pass
+        time.sleep(0.005)
+    sock.close()
+    stop.set()
+    return replies, kods
+
+
+def check_client(app):
+    """
+    程序自己的NTP客户端从该服务器取时间：同步前被拒绝（未同步），同步后层级为上游+1
+    """
+    server, stop = start_server(app, rate=0)
+    target = [app.NTPTarget(f"127.0.0.1:{server.address[1]}", socket.AF_INET, server.address)]
+    _, before = app.query_ntp_servers(target, timeout=1)
+    server.update(fake_upstream(app))
+    samples, _ = app.query_ntp_servers(target, timeout=1, burst=4)
+    stop.set()
+    return list(before.values()), samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="局域网NTP服务基准测试")
+    parser.add_argument('--clients', type=int, default=4, help='负载进程数，默认4')
+    parser.add_argument('--window', type=int, default=64, help='每个进程的在途请求数，默认64')
+    parser.add_argument('--seconds', type=float, default=3, help='每个场景的持续时间（秒），默认3')
+    parser.add_argument('--check', action='store_true', help='低于回归阈值时返回非0退出码')
+    args = parser.parse_args()
+    
+    app = load_app_module()
+    failed = []
+    
+    r = bench_throughput(app, args.clients, args.window, args.seconds)
+    print(f"吞吐量:   {r['rps']:>9.0f} 响应/秒  延迟p50 {r['latency_p50']:.3f}ms  p99 {r['latency_p99']:.3f}ms  "
+          f"丢失 {r['lost']}（{args.clients} 个进程 x {args.window} 个在途请求）")
+    if r['rps'] < MIN_REPLIES_PER_SECOND:
+        failed.append(f"吞吐量 {r['rps']:.0f}/s < {MIN_REPLIES_PER_SECOND}/s")
+    
+    replies, kods = bench_rate_limit(app, rate=1.0, burst=16)
+    print(f"限速:     300个请求中响应 {replies} 个，KoD {kods} 个（rate=1/s，burst=16）")
+    if not 16 <= replies <= 22 or not 1 <= kods <= 4:
+        failed.append(f"限速结果异常: 响应 {replies}，KoD {kods}")
+    
+    before, samples = check_client(app)
+    offsets = [sample.offset * 1000 for sample in samples]
+    print(f"客户端:   同步前 {before}；同步后 {len(samples)} 个采样，层级 "
+          f"{samples[0].stratum if samples else '-'}，偏差 {max(map(abs, offsets), default=float('nan')):.3f}ms 以内")
+    if before != ["服务器时钟未同步"] or len(samples) != 4 or samples[0].stratum != 3:
+        failed.append("客户端取时间结果异常")
+    
+    if args.check and failed:
+        print("\n超出回归阈值:")
+        for line in failed:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
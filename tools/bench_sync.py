@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+同步流程基准测试
+用本地NTP替身服务器（tools/fake_ntp_server.py）驱动完整的同步流程
+（DNS缓存 -> 并发查询 -> 时钟过滤与选择 -> 时钟调整），
+统计每个场景的同步耗时和校正误差，可离线在Linux CI中运行。
+
+用法：
+  python tools/bench_sync.py                  # 运行全部场景
+  python tools/bench_sync.py --rounds 50 --scenario lossy
+  python tools/bench_sync.py --check          # 超出阈值时返回非0退出码
+"""
+
+import sys
+import time
+import argparse
+import statistics
+
+from fake_ntp_server import FakeNTPCluster, FakeServerConfig
+from harness import make_app
+
+TRUE_OFFSET = 0.25      # 替身服务器相对本机的偏差（秒）
+
+# 回归阈值
+MAX_ERROR_P95_MS = 5.0
+MAX_LATENCY_P95_MS = 1500.0
+MIN_SUCCESS_RATE = 0.9
+
+
+def healthy(n=4, latency=0.02, jitter=0.002):
+    return [FakeServerConfig(offset=TRUE_OFFSET, latency=latency, jitter=jitter) for _ in range(n)]
+
+
+SCENARIOS = {
+    # 全部正常
+    "healthy": lambda: healthy(),
+    # 前5个服务器不响应（模拟被屏蔽的阿里云服务器）
+    "blackholed": lambda: [FakeServerConfig(loss=1.0) for _ in range(5)] + healthy(3),
+    # 30%丢包
+    "lossy": lambda: [FakeServerConfig(offset=TRUE_OFFSET, latency=0.02, loss=0.3) for _ in range(5)],
+    # 一个服务器时间错误2秒
+    "falseticker": lambda: healthy(3) + [FakeServerConfig(offset=TRUE_OFFSET + 2.0, latency=0.01)],
+    # 一个服务器限流(KoD)，一个返回错误模式，一个时钟未同步
+    "misbehaving": lambda: healthy(3) + [
+        FakeServerConfig(offset=TRUE_OFFSET, kod=1.0),
+        FakeServerConfig(offset=TRUE_OFFSET, wrong_mode=1.0),
+        FakeServerConfig(offset=TRUE_OFFSET, leap=3),
+    ],
+    # 高延迟、高抖动
+    "jittery": lambda: [FakeServerConfig(offset=TRUE_OFFSET, latency=0.05, jitter=0.02)
+                        for _ in range(5)],
+}
+
+
+def percentile(values, q):
+    """
+    计算分位数（q: 0~100）
+    """
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(name, rounds, timeout, verbose):
+    """
+    运行一个场景
+    返回：统计结果字典
+    """
+    with FakeNTPCluster(SCENARIOS[name](), seed=1) as cluster:
+        app, fake = make_app({
+            "ntp_servers": cluster.addresses,
+            "ntp_timeout": timeout,
+            "clock_mode": "step",
+        }, verbose=verbose)
+        
+        latencies = []
+        errors = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            estimate = app.sync_once()
+            latencies.append((time.perf_counter() - start) * 1000)
+            if estimate:
+                errors.append(abs(fake.steps[-1] - TRUE_OFFSET) * 1000)
+    
+    return {
+        "name": name,
+        "success": len(errors) / rounds,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "error_p50": percentile(errors, 50),
+        "error_p95": percentile(errors, 95),
+        "error_max": max(errors) if errors else float('nan'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步流程基准测试")
+    parser.add_argument('--rounds', type=int, default=20, help='每个场景的同步次数，默认20')
+    parser.add_argument('--timeout', type=float, default=1.0, help='每轮查询的总超时（秒），默认1')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), action='append',
+                        help='只运行指定场景（可重复）')
+    parser.add_argument('--check', action='store_true', help='超出回归阈值时返回非0退出码')
+    parser.add_argument('--verbose', action='store_true', help='输出程序日志')
+    args = parser.parse_args()
+    
+    print(f"{'场景':<12}{'成功率':>8}{'耗时p50':>10}{'耗时p95':>10}"
+          f"{'误差p50':>10}{'误差p95':>10}{'误差max':>10}  (ms)")
+    
+    failed = []
+    for name in args.scenario or SCENARIOS:
+        r = run_scenario(name, args.rounds, args.timeout, args.verbose)
+        print(f"{name:<12}{r['success']:>9.0%}{r['latency_p50']:>10.1f}{r['latency_p95']:>10.1f}"
+              f"{r['error_p50']:>10.3f}{r['error_p95']:>10.3f}{r['error_max']:>10.3f}")
+        
+        if r['success'] < MIN_SUCCESS_RATE:
+            failed.append(f"{name}: 成功率 {r['success']:.0%} < {MIN_SUCCESS_RATE:.0%}")
+        if r['error_p95'] > MAX_ERROR_P95_MS:
+            failed.append(f"{name}: 误差p95 {r['error_p95']:.3f}ms > {MAX_ERROR_P95_MS}ms")
+        if r['latency_p95'] > MAX_LATENCY_P95_MS:
+            failed.append(f"{name}: 耗时p95 {r['latency_p95']:.1f}ms > {MAX_LATENCY_P95_MS}ms")
+    
+    if args.check and failed:
+        print("\n超出回归阈值:")
+        for line in failed:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
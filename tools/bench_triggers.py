@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+同步触发基准测试
+用模拟的时钟和临时的sysfs目录（/sys/class/net的替身）产生系统时间跳变、睡眠唤醒和网络变化，
+检查ResyncWatcher只在需要时触发、程序自己调整时钟不触发、连续事件只触发一次；
+再用NTP替身服务器和假时钟跑一个真实的自动同步，测量从事件发生到时钟被调整的延迟，
+以及默认事件源在本机上每次检查的开销。
+
+用法：
+  python tools/bench_triggers.py
+  python tools/bench_triggers.py --check       # 超出阈值时返回非0退出码
+"""
+
+import sys
+import time
+import timeit
+import argparse
+import tempfile
+from pathlib import Path
+
+from fake_ntp_server import FakeNTPCluster, FakeServerConfig
+from harness import make_app, load_app_module
+
+# 回归阈值
+MAX_LATENCY = 1.0       # 事件发生到时钟被调整的延迟上限（秒，检查间隔0.05秒）
+MAX_CHECK_US = 2000     # 默认事件源每次检查的开销上限（微秒）
+
+
+class FakeClocks:
+    """
+    模拟的时钟：wall为系统时间，monotonic为单调时钟，suspended为累计挂起时间
+    """
+    
+    def __init__(self):
+        self.mono = 1000.0
+        self.offset = 1_700_000_000.0
+        self.asleep = 0.0
+    
+    def wall(self):
+        return self.mono + self.offset
+    
+    def monotonic(self):
+        return self.mono
+    
+    def suspended(self):
+        return self.asleep
+    
+    def sleep(self, seconds):
+        """
+        模拟挂起：单调时钟停止，系统时间和含挂起时间的时钟继续走
+        """
+        self.offset += seconds
+        self.asleep += seconds
+
+
+class FakeSysfs:
+    """
+    模拟的/sys/class/net：每个网卡一个目录，operstate文件为连接状态
+    """
+    
+    def __init__(self):
+        self.path = Path(tempfile.mkdtemp(prefix="zgirc_net_"))
+        self.address = None     # 默认路由的本机地址，None表示没有路由
+        self.set("lo", "unknown")
+    
+    def set(self, name, state):
+        (self.path / name).mkdir(exist_ok=True)
+        (self.path / name / "operstate").write_text(state + "\n")
+    
+    def route(self):
+        return self.address
+
+
+def check_scenarios(app):
+    """
+    用check()同步驱动模拟事件源，每个场景为一组步骤，检查是否触发
+    返回：失败原因列表
+    """
+    clocks, sysfs = FakeClocks(), FakeSysfs()
+    sysfs.set("eth0", "down")
+    sources = [
+        app.ClockJumpSource(wall=clocks.wall, monotonic=clocks.monotonic),
+        app.ResumeSource(clocks.suspended),
+        app.NetworkSource(sysfs.path, route=sysfs.route),
+    ]
+    watcher = app.ResyncWatcher(lambda reason: None, sources=sources, min_gap=10, monotonic=clocks.monotonic)
+    
+    def tick(seconds=2):
+        clocks.mono += seconds
+        return watcher.check()
+    
+    def jump(seconds):
+        clocks.offset += seconds
+        return tick()
+    
+    def own_step():
+        clocks.offset += 5
+        watcher.reset()
+        return tick()
+    
+    def network(name, state, address):
+        sysfs.set(name, state)
+        sysfs.address = address
+        return tick()
+    
+    def resume(seconds):
+        clocks.sleep(seconds)
+        return tick()
+    
+    # (名称, 是否应触发, 步骤, 开始前等待的时间)，场景之间默认等待超过min_gap
+    scenarios = [
+        ("平稳运行（含平滑调整的微小变化）", False, [lambda: jump(0.001)] * 10, 10),
+        ("系统时间被修改 -30 秒", True, [lambda: jump(-30)], 10),
+        ("程序自己跳变 +5 秒后reset()", False, [own_step], 10),
+        ("睡眠 10 分钟后唤醒", True, [lambda: resume(600)], 10),
+        ("唤醒后紧接着再次跳变（min_gap内）", False, [lambda: jump(30)], 0),
+        ("网线插上并获得地址（等一轮稳定）", True, [lambda: network("eth0", "up", "192.168.1.20"), tick], 10),
+        ("网线拔掉", False, [lambda: network("eth0", "down", None), tick, tick], 10),
+        ("切换到无线网络", True, [lambda: network("wlan0", "up", "10.0.0.7"), tick], 10),
+        ("网络状态抖动后恢复原状", False, [lambda: network("wlan0", "dormant", "10.0.0.7"),
+                                     lambda: network("wlan0", "up", "10.0.0.7"), tick], 10),
+    ]
+    
+    failed = []
+    print("模拟事件:")
+    for name, expected, steps, gap in scenarios:
+        clocks.mono += gap
+        fired = [reasons for reasons in (step() for step in steps) if reasons]
+        ok = bool(fired) == expected
+        print(f"  {'通过' if ok else '失败'}  {name}: "
+              + ("触发 " + "；".join("，".join(reasons) for reasons in fired) if fired else "未触发"))
+        if not ok:
+            failed.append(f"{name}: {'应触发' if expected else '不应触发'}")
+    return failed
+
+
+def measure_latency(app_module, rounds):
+    """
+    真实的自动同步（间隔1小时）+ 模拟的系统时间跳变，测量事件到时钟被调整的延迟
+    返回：延迟列表（秒）
+    """
+    latencies = []
+    with FakeNTPCluster([FakeServerConfig(offset=0.25, latency=0.01) for _ in range(3)], seed=1) as cluster:
+        app, fake = make_app({"ntp_servers": cluster.addresses, "ntp_timeout": 1, "clock_mode": "step",
+                              "interval": 3600, "drift_correction": False})
+        clocks = FakeClocks()
+        jump = app_module.ClockJumpSource(wall=clocks.wall, monotonic=clocks.monotonic)
+        app.resync_watcher = app_module.ResyncWatcher(app.on_resync, sources=[jump], interval=0.05,
+                                                      min_gap=0, logger=app.logger)
+        app.resync_watcher.start()
+        app.start_auto_sync()
+        deadline = time.monotonic() + 5
+        while not fake.steps and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        for _ in range(rounds):
+            count = len(fake.steps)
+            start = time.monotonic()
+            clocks.offset += 60
+            while len(fake.steps) == count and time.monotonic() - start < 5:
+                time.sleep(0.001)
+            latencies.append(time.monotonic() - start)
+        app.stop_auto_sync()
+        app.stop_resync_watcher()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步触发基准测试")
+    parser.add_argument('--rounds', type=int, default=5, help='测量延迟的事件次数，默认5')
+    parser.add_argument('--calls', type=int, default=2000, help='测量检查开销的次数，默认2000')
+    parser.add_argument('--check', action='store_true', help='超出回归阈值时返回非0退出码')
+    args = parser.parse_args()
+    
+    app = load_app_module()
+    failed = check_scenarios(app)
+    
+    latencies = measure_latency(app, args.rounds)
+    print(f"事件到时钟调整的延迟: 平均 {sum(latencies) / len(latencies) * 1000:.0f}ms，"
+          f"最大 {max(latencies) * 1000:.0f}ms（检查间隔 50ms，自动同步间隔 3600s）")
+    if max(latencies) > MAX_LATENCY:
+        failed.append(f"延迟 {max(latencies):.2f}s > {MAX_LATENCY}s")
+    
+    watcher = app.ResyncWatcher(lambda reason: None)
+    names = ", ".join(type(source).__name__ for source in watcher.sources)
+    cost = timeit.timeit(watcher.check, number=args.calls) / args.calls * 1e6
+    print(f"默认事件源（{names}）每次检查: {cost:.0f}us，"
+          f"每 {app.TRIGGER_POLL_INTERVAL} 秒一次约占 {cost / 1e6 / app.TRIGGER_POLL_INTERVAL:.4%} CPU")
+    if cost > MAX_CHECK_US:
+        failed.append(f"检查开销 {cost:.0f}us > {MAX_CHECK_US}us")
+    
+    if args.check and failed:
+        print("\n超出回归阈值:")
+        for line in failed:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+同步代理替身（agent子命令的本地替身）
+在一个后台事件循环中启动多个代理，按配置的耗时、失败率和无响应率返回合成的同步结果，
+用于离线测试和基准测试orchestrate子命令，不需要真的有几百台电脑。
+
+单独运行：
+  python tools/fake_agent.py --count 100 --latency 0.2 > hosts.txt
+  python time.py orchestrate hosts.txt
+
+在脚本中使用：
+  with FakeAgentCluster(500, FakeAgentConfig(latency=0.2, failure=0.05)) as cluster:
+      cluster.hosts    # ["127.0.0.1:端口", ...]
+"""
+
+import sys
+import json
+import random
+import asyncio
+import argparse
+import threading
+from dataclasses import dataclass
+
+
+@dataclass
+class FakeAgentConfig:
+    """
+    替身代理的行为配置
+    latency: 每次同步/查询的耗时（秒）
+    jitter: 耗时的随机增量上限（秒）
+    failure: 返回同步失败的概率
+    silent: 收到请求后不响应的概率（模拟卡死的电脑）
+    offset: 合成偏差的范围（秒），在[-offset, offset]内均匀分布
+    token: 要求的共享口令，None表示不检查
+    """
+    latency: float = 0.2
+    jitter: float = 0.05
+    failure: float = 0.0
+    silent: float = 0.0
+    offset: float = 0.05
+    token: str = None
+
+
+class FakeAgentCluster:
+    """
+    在后台线程的事件循环中运行一组替身代理
+    """
+    
+    def __init__(self, count, config=None, host='127.0.0.1', seed=None):
+        """
+        count: 代理数量（每个代理监听一个随机端口）
+        config: FakeAgentConfig
+        host: 监听地址
+        seed: 随机数种子，便于复现
+        """
+        self.count = count
+        self.config = config or FakeAgentConfig()
+        self.host = host
+        self.rng = random.Random(seed)
+        self.hosts = []
+        self.requests = 0
+        self._loop = None
+        self._servers = []
+        self._thread = None
+        self._ready = threading.Event()
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    async def _handle(self, reader, writer):
+        config = self.config
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.requests += 1
+                request = json.loads(line)
+                await asyncio.sleep(config.latency + self.rng.uniform(0, config.jitter))
+                if self.rng.random() < config.silent:
+                    # 不响应，等客户端超时断开
+                    await reader.read()
+                    break
+                if config.token is not None and request.get("token") != config.token:
+                    response = {"ok": False, "error": "未授权"}
+                elif self.rng.random() < config.failure:
+                    response = {"ok": False, "error": "同步失败"}
+                else:
+                    response = {"ok": True, "offset": self.rng.uniform(-config.offset, config.offset),
+                                "delay": 0.02, "jitter": 0.001, "stratum": 2, "peer": "fake"}
+                    if request.get("action") == "sync":
+                        response["clock_action"] = "slew"
+                response["id"] = request.get("id")
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            # 退出时被取消的连接不再向外抛出，避免事件循环打印告警
+            pass
+        finally:
+            writer.close()
+    
+    async def _start_servers(self):
+        for _ in range(self.count):
+            server = await asyncio.start_server(self._handle, self.host, 0)
+            self._servers.append(server)
+            self.hosts.append("%s:%d" % server.sockets[0].getsockname()[:2])
+    
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start_servers())
+        self._ready.set()
+        self._loop.run_forever()
+        for server in self._servers:
+            server.close()
+        # 取消仍在等待的连接（不响应的代理），再关闭事件循环
+        pending = asyncio.all_tasks(self._loop)
+        for task in pending:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self._loop.close()
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+    
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步代理替身")
+    parser.add_argument('--count', type=int, default=10, help='代理数量，默认10')
+    parser.add_argument('--latency', type=float, default=0.2, help='每次同步的耗时（秒）')
+    parser.add_argument('--failure', type=float, default=0.0, help='同步失败的概率')
+    parser.add_argument('--silent', type=float, default=0.0, help='不响应的概率')
+    args = parser.parse_args()
+    
+    config = FakeAgentConfig(latency=args.latency, failure=args.failure, silent=args.silent)
+    with FakeAgentCluster(args.count, config) as cluster:
+        # 标准输出为主机清单，可直接交给orchestrate
+        print("\n".join(cluster.hosts), flush=True)
+        print(f"已启动 {args.count} 个替身代理，按Ctrl+C退出", file=sys.stderr)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
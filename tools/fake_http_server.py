@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+本地HTTP替身服务器（更新镜像）
+用于离线测试和基准测试更新下载，支持Range、HEAD、ETag/Last-Modified条件请求，
+可模拟首字节延迟、单连接限速和链路中断。
+
+单独运行：
+  python tools/fake_http_server.py --port 18080 --size 8388608 --rate 1048576
+  # 文件地址：http://127.0.0.1:18080/dist/ZGIRC_TimeSync.exe
+
+在脚本中使用：
+  with FakeHTTPServer({"/dist/a.exe": data}, HTTPServerConfig(rate=1 << 20)) as server:
+      server.url("/dist/a.exe")
+"""
+
+import sys
+import time
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+@dataclass
+class HTTPServerConfig:
+    """
+    替身服务器的行为配置
+    latency: 每个请求的首字节延迟（秒）
+    rate: 每个连接的限速（字节/秒），0表示不限速
+    ranges: 是否支持Range请求
+    budget: 剩余可发送的总字节数，用完后连接被中断，None表示不限
+    """
+    latency: float = 0.0
+    rate: int = 0
+    ranges: bool = True
+    budget: int = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _lookup(self):
+        body = self.server.files.get(self.path.split('?')[0])
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        return body
+    
+    def _not_modified(self, etag):
+        inm = self.headers.get('If-None-Match')
+        if inm is not None:
+            return etag in [tag.strip() for tag in inm.split(',')]
+        return self.headers.get('If-Modified-Since') == self.server.last_modified
+    
+    def _send_headers(self, body, with_body):
+        config = self.server.config
+        self.server.stats["requests"] += 1
+        if config.latency:
+            time.sleep(config.latency)
+        
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self._not_modified(etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+        
+        start, end = 0, len(body) - 1
+        status = 200
+        range_header = self.headers.get('Range')
+        if config.ranges and range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start = int(first)
+            end = min(int(last), len(body) - 1) if last else len(body) - 1
+            status = 206
+        
+        self.send_response(status)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.server.last_modified)
+        if config.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        self.end_headers()
+        return (start, end) if with_body else None
+    
+    def _send_body(self, body, start, end):
+        config = self.server.config
+        block = 16 * 1024
+        began = time.perf_counter()
+        sent = 0
+        position = start
+        while position <= end:
+            data = body[position:min(position + block, end + 1)]
+            with self.server.lock:
+                if config.budget is not None:
+                    if config.budget <= 0:
+                        # 模拟链路中断
+                        self.close_connection = True
+                        return
+                    data = data[:config.budget]
+                    config.budget -= len(data)
+            self.wfile.write(data)
+            sent += len(data)
+            position += len(data)
+            self.server.stats["bytes"] += len(data)
+            if config.rate:
+                # 按限速补足等待时间
+                wait = sent / config.rate - (time.perf_counter() - began)
+                if wait > 0:
+                    time.sleep(wait)
+    
+    def do_HEAD(self):
+        body = self._lookup()
+        if body is not None:
+            self._send_headers(body, with_body=False)
+    
+    def do_GET(self):
+        body = self._lookup()
+        if body is None:
+            return
+        span = self._send_headers(body, with_body=True)
+        if span:
+            try:
+                self._send_body(body, *span)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        # 客户端提前断开连接属于正常情况，不打印异常
+        pass
+
+
+class FakeHTTPServer:
+    """
+    在后台线程中运行的HTTP替身服务器
+    """
+    
+    def __init__(self, files, config=None, host='127.0.0.1', port=0):
+        """
+        files: {路径: 内容}
+        config: HTTPServerConfig
+        host/port: 监听地址，端口为0时随机分配
+        """
+        self.httpd = _QuietHTTPServer((host, port), _Handler)
+        self.httpd.files = dict(files)
+        self.httpd.config = config or HTTPServerConfig()
+        self.httpd.lock = threading.Lock()
+        self.httpd.stats = {"requests": 0, "bytes": 0}
+        self.httpd.last_modified = formatdate(time.time() - 3600, usegmt=True)
+        self._thread = None
+    
+    @property
+    def config(self):
+        return self.httpd.config
+    
+    @property
+    def stats(self):
+        return self.httpd.stats
+    
+    def url(self, path):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{path}"
+    
+    def set_file(self, path, body):
+        self.httpd.files[path] = body
+        self.httpd.last_modified = formatdate(time.time(), usegmt=True)
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    import os
+    
+    parser = argparse.ArgumentParser(description="本地HTTP替身服务器（更新镜像）")
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080, help='监听端口，默认18080')
+    parser.add_argument('--size', type=int, default=8 * 1024 * 1024, help='随机文件大小（字节）')
+    parser.add_argument('--file', help='提供指定文件的内容，代替随机文件')
+    parser.add_argument('--path', default='/dist/ZGIRC_TimeSync.exe', help='文件的URL路径')
+    parser.add_argument('--latency', type=float, default=0.0, help='首字节延迟（秒）')
+    parser.add_argument('--rate', type=int, default=0, help='单连接限速（字节/秒）')
+    parser.add_argument('--no-ranges', action='store_true', help='不支持Range请求')
+    args = parser.parse_args()
+    
+    if args.file:
+        with open(args.file, 'rb') as f:
+            body = f.read()
+    else:
+        body = os.urandom(args.size)
+    
+    config = HTTPServerConfig(latency=args.latency, rate=args.rate, ranges=not args.no_ranges)
+    server = FakeHTTPServer({args.path: body}, config, args.host, args.port)
+    print(f"HTTP替身服务器已启动: {server.url(args.path)}（{len(body)} bytes）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+本地NTP替身服务器（asyncio UDP）
+用于离线测试和基准测试，可注入往返延迟、抖动、丢包、Kiss-o'-Death、
+错误的响应模式、错误的源时间戳和时钟偏差，不依赖真实的阿里云服务器。
+
+单独运行：
+  python tools/fake_ntp_server.py --port 12300 --offset 0.25 --latency 0.02 --loss 0.1
+
+在脚本中使用：
+  with FakeNTPCluster([FakeServerConfig(offset=0.25), FakeServerConfig(loss=1.0)]) as cluster:
+      cluster.addresses  # ["127.0.0.1:xxxxx", ...]
+"""
+
+import sys
+import time
+import struct
+import random
+import asyncio
+import argparse
+import threading
+from dataclasses import dataclass
+
+NTP_EPOCH_OFFSET = 2208988800
+
+
+@dataclass
+class FakeServerConfig:
+    """
+    替身服务器的行为配置
+    offset: 服务器时间相对本机的偏差（秒）
+    latency: 往返延迟（秒），默认对称地分配到请求和响应两个方向
+    jitter: 每个方向额外的随机延迟上限（秒）
+    asymmetry: 请求方向占往返延迟的比例，0.5为对称
+    loss: 丢包概率（0~1）
+    kod: 以Kiss-o'-Death(RATE)响应的概率（0~1）
+    wrong_mode: 以错误的模式(3=客户端)响应的概率（0~1）
+    bad_origin: 源时间戳与请求不符（迟到或伪造的响应）的概率（0~1）
+    stratum: 层级
+    leap: 闰秒指示，3表示时钟未同步
+    """
+    offset: float = 0.0
+    latency: float = 0.0
+    jitter: float = 0.0
+    asymmetry: float = 0.5
+    loss: float = 0.0
+    kod: float = 0.0
+    wrong_mode: float = 0.0
+    bad_origin: float = 0.0
+    stratum: int = 2
+    leap: int = 0
+
+
+def _ntp_timestamp(unix_time):
+    """
+    Unix时间（秒）-> NTP 64位时间戳
+    """
+    return int((unix_time + NTP_EPOCH_OFFSET) * 2 ** 32) & 0xFFFFFFFFFFFFFFFF
+
+
+class FakeNTPProtocol(asyncio.DatagramProtocol):
+    """
+    替身服务器协议实现
+    """
+    
+    def __init__(self, config, seed=None):
+        self.config = config
+        self.rng = random.Random(seed)
+        self.transport = None
+        self.requests = 0
+        self.replies = 0
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def _leg_delay(self, share):
+        delay = self.config.latency * share
+        if self.config.jitter:
+            delay += self.rng.uniform(0, self.config.jitter)
+        return delay
+    
+    def datagram_received(self, data, addr):
+        self.requests += 1
+        if len(data) < 48 or self.rng.random() < self.config.loss:
+            return
+        
+        loop = asyncio.get_running_loop()
+        # 请求方向的延迟过后服务器才"收到"请求
+        loop.call_later(self._leg_delay(self.config.asymmetry), self._reply, data, addr)
+    
+    def _reply(self, request, addr):
+        config = self.config
+        now = time.time() + config.offset
+        
+        mode = 3 if self.rng.random() < config.wrong_mode else 4
+        origin = request[40:48]
+        if self.rng.random() < config.bad_origin:
+            origin = bytes(b ^ 0xFF for b in origin)
+        stratum = config.stratum
+        ref_id = b'LOCL'
+        if self.rng.random() < config.kod:
+            stratum = 0
+            ref_id = b'RATE'
+        
+        packet = struct.pack(
+            '!BBbbII4sQ8s8sQ',
+            (config.leap << 6) | (4 << 3) | mode,
+            stratum,
+            6,              # poll
+            -20,            # precision，约1微秒
+            0,              # root delay
+            0,              # root dispersion
+            ref_id,
+            _ntp_timestamp(now - 16),   # reference timestamp
+            origin,                     # origin = 客户端的transmit
+            struct.pack('!Q', _ntp_timestamp(now)),   # receive
+            _ntp_timestamp(now),        # transmit
+        )
+        
+        loop = asyncio.get_running_loop()
+        loop.call_later(self._leg_delay(1 - config.asymmetry), self._send, packet, addr)
+    
+    def _send(self, packet, addr):
+        if self.transport and not self.transport.is_closing():
+            self.transport.sendto(packet, addr)
+            self.replies += 1
+
+
+class FakeNTPCluster:
+    """
+    在后台线程的事件循环中运行一组替身服务器
+    """
+    
+    def __init__(self, configs, host='127.0.0.1', seed=None):
+        """
+        configs: FakeServerConfig列表，每个配置启动一个服务器（端口随机分配）
+        host: 监听地址
+        seed: 随机数种子，便于复现
+        """
+        self.configs = list(configs)
+        self.host = host
+        self.seed = seed
+        self.protocols = []
+        self.addresses = []
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+    
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+    
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        transports = []
+        for i, config in enumerate(self.configs):
+            seed = None if self.seed is None else self.seed + i
+            transport, protocol = self._loop.run_until_complete(
+                self._loop.create_datagram_endpoint(
+                    lambda config=config, seed=seed: FakeNTPProtocol(config, seed),
+                    local_addr=(self.host, 0),
+                )
+            )
+            transports.append(transport)
+            self.protocols.append(protocol)
+            host, port = transport.get_extra_info('sockname')[:2]
+            self.addresses.append(f"[{host}]:{port}" if ':' in host else f"{host}:{port}")
+        
+        self._ready.set()
+        self._loop.run_forever()
+        for transport in transports:
+            transport.close()
+        self._loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地NTP替身服务器")
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=12300, help='监听端口，默认12300')
+    parser.add_argument('--offset', type=float, default=0.0, help='时钟偏差（秒）')
+    parser.add_argument('--latency', type=float, default=0.0, help='往返延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='每个方向的随机延迟上限（秒）')
+    parser.add_argument('--asymmetry', type=float, default=0.5, help='请求方向占往返延迟的比例')
+    parser.add_argument('--loss', type=float, default=0.0, help='丢包概率')
+    parser.add_argument('--kod', type=float, default=0.0, help="Kiss-o'-Death响应概率")
+    parser.add_argument('--wrong-mode', type=float, default=0.0, help='错误模式响应概率')
+    parser.add_argument('--bad-origin', type=float, default=0.0, help='错误源时间戳响应概率')
+    parser.add_argument('--stratum', type=int, default=2, help='层级')
+    parser.add_argument('--leap', type=int, default=0, help='闰秒指示（3=未同步）')
+    args = parser.parse_args()
+    
+    config = FakeServerConfig(
+        offset=args.offset, latency=args.latency, jitter=args.jitter,
+        asymmetry=args.asymmetry, loss=args.loss, kod=args.kod,
+        wrong_mode=args.wrong_mode, bad_origin=args.bad_origin, stratum=args.stratum, leap=args.leap,
+    )
+    
+    async def serve():
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: FakeNTPProtocol(config),
+                                            local_addr=(args.host, args.port))
+        print(f"NTP替身服务器已启动: {args.host}:{args.port} {config}")
+        await asyncio.Event().wait()
+    
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
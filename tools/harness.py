@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+测试和基准脚本的公共工具
+入口time.py与标准库time模块同名，无法直接import；程序主体在zgirc_timesync包中，把仓库根目录加入sys.path后导入。
+"""
+
+import sys
+import json
+import logging
+import tempfile
+import importlib
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PACKAGE = "zgirc_timesync"
+
+
+def load_app_module(name="app"):
+    """
+    导入zgirc_timesync包中的模块
+    name: 模块名，默认为程序主体app
+    返回：模块对象
+    """
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    return importlib.import_module(f"{APP_PACKAGE}.{name}")
+
+
+class FakeAdjtimex:
+    """
+    假的adjtimex：记录LinuxClock发出的调整，不修改真实时钟
+    可传给 LinuxClock(adjtimex=...)，在容器中无需CAP_SYS_TIME即可测试
+    """
+    
+    def __init__(self):
+        self.app = load_app_module()
+        self.steps = []     # 每次跳变的偏差（秒）
+        self.slews = []     # 每次平滑调整的偏差（秒）
+        self.freq = 0.0     # 当前的频率校正（ppm）
+        self.frequencies = []   # 每次设置的频率校正（ppm）
+        self.calls = 0
+    
+    def __call__(self, timex):
+        app = self.app
+        self.calls += 1
+        if timex.modes & app.ADJ_SETOFFSET:
+            # ADJ_NANO时time_usec字段为纳秒
+            self.steps.append(timex.time_sec + timex.time_usec / 1e9)
+        elif timex.modes == app.ADJ_OFFSET_SINGLESHOT and timex.offset:
+            self.slews.append(timex.offset / 1e6)
+        elif timex.modes & app.ADJ_FREQUENCY:
+            self.freq = timex.freq / app.LinuxClock.FREQ_SCALE
+            self.frequencies.append(self.freq)
+        elif timex.modes == 0:
+            # 只读：返回当前状态
+            timex.freq = round(self.freq * app.LinuxClock.FREQ_SCALE)
+        return 0    # TIME_OK
+    
+    @property
+    def corrections(self):
+        """
+        按顺序返回所有调整（秒）
+        """
+        return self.steps + self.slews
+
+
+def make_app(config, program_dir=None, verbose=False):
+    """
+    创建使用假时钟的TimeSyncApp
+    config: 写入临时config.json的配置
+    program_dir: 存放配置和健康记录的目录，默认新建临时目录
+    verbose: 是否输出程序日志
+    返回：(app, FakeAdjtimex)
+    """
+    module = load_app_module()
+    program_dir = Path(program_dir or tempfile.mkdtemp(prefix="zgirc_"))
+    config = dict({"save_log": False}, **config)
+    with open(program_dir / "config.json", 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    
+    logging.getLogger(module.__name__).disabled = not verbose
+    
+    app = module.TimeSyncApp(program_dir=program_dir)
+    
+    fake = FakeAdjtimex()
+    app.clock_backend = module.LinuxClock(adjtimex=fake)
+    return app, fake
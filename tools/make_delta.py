@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+生成差分补丁，并登记到版本清单 dist/version.json
+按内容切分数据块（Gear滚动哈希，平均8KB），新版本中与旧版本相同的块记为"复制"，
+其余数据zlib压缩后记为"插入"。onefile EXE中未改动的依赖库和资源在各版本间保持不变，
+只改几行代码时补丁通常只有完整EXE的一小部分。
+生成后用程序中的apply_delta重建一遍并校验，确保补丁可用。
+
+用法（先运行tools/make_manifest.py生成清单）：
+  python tools/make_delta.py releases/0.0.1-beta.0.exe releases/0.0.2-beta.0.exe   # 旧版本 -> dist/ZGIRC_TimeSync.exe
+  python tools/make_delta.py old.exe --new build/app.exe --manifest build/version.json
+补丁写入清单目录下的patches/，与EXE和version.json一起上传。
+"""
+
+import sys
+import json
+import zlib
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+
+from harness import ROOT, load_app_module
+
+CHUNK_MIN = 2 * 1024            # 最小块（字节）
+CHUNK_MAX = 64 * 1024           # 最大块（字节）
+CHUNK_MASK = (1 << 13) - 1      # 平均块大小约8KB
+INSERT_MAX = 1024 * 1024        # 单个插入操作的最大原始长度，限制应用补丁时的内存占用
+MASK64 = (1 << 64) - 1
+
+# Gear哈希表：固定种子生成，保证每次切分结果一致
+GEAR = [int.from_bytes(hashlib.sha256(b'zgirc-gear-%d' % i).digest()[:8], 'big') for i in range(256)]
+
+
+def chunk_spans(data):
+    """
+    按内容切分数据块，插入或删除数据只影响附近的块边界
+    返回：[(start, end)]
+    """
+    spans = []
+    start = 0
+    size = len(data)
+    while start < size:
+        end = min(start + CHUNK_MAX, size)
+        i = start + CHUNK_MIN
+        if i < end:
+            h = 0
+            while i < end:
+                h = ((h << 1) + GEAR[data[i]]) & MASK64
+                i += 1
+                if not h & CHUNK_MASK:
+                    break
+            end = i
+        spans.append((start, end))
+        start = end
+    return spans
+
+
+def make_ops(old, new):
+    """
+    计算从旧数据得到新数据的操作序列
+    返回：[("C", 偏移, 长度) 或 ("I", 数据)]，相邻的同类操作已合并
+    """
+    index = {}
+    for start, end in chunk_spans(old):
+        index.setdefault(hashlib.sha1(old[start:end]).digest(), start)
+    
+    ops = []
+    for start, end in chunk_spans(new):
+        block = new[start:end]
+        offset = index.get(hashlib.sha1(block).digest())
+        if offset is not None:
+            last = ops[-1] if ops else None
+            if last and last[0] == "C" and last[1] + last[2] == offset:
+                ops[-1] = ("C", last[1], last[2] + len(block))
+            else:
+                ops.append(("C", offset, len(block)))
+        else:
+            last = ops[-1] if ops else None
+            if last and last[0] == "I" and len(last[1]) + len(block) <= INSERT_MAX:
+                ops[-1] = ("I", last[1] + block)
+            else:
+                ops.append(("I", block))
+    return ops
+
+
+def write_patch(old, new, output):
+    """
+    生成补丁文件
+    返回：(复制的字节数, 插入的字节数)
+    """
+    app = load_app_module()
+    copied = inserted = 0
+    with open(output, 'wb') as f:
+        f.write(app.DELTA_HEADER.pack(app.DELTA_MAGIC, hashlib.sha256(old).digest(),
+                                      hashlib.sha256(new).digest(), len(new)))
+        for op in make_ops(old, new):
+            if op[0] == "C":
+                f.write(b'C' + app.DELTA_COPY.pack(op[1], op[2]))
+                copied += op[2]
+            else:
+                packed = zlib.compress(op[1], 9)
+                f.write(b'I' + app.DELTA_INSERT.pack(len(op[1]), len(packed)) + packed)
+                inserted += len(op[1])
+        f.write(b'E')
+    return copied, inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成差分补丁")
+    parser.add_argument('old', nargs='+', help='旧版本EXE（可以有多个，每个生成一个补丁）')
+    parser.add_argument('--new', default=str(ROOT / "dist" / "ZGIRC_TimeSync.exe"),
+                        help='新版本EXE，默认dist/ZGIRC_TimeSync.exe')
+    parser.add_argument('--manifest', help='要登记补丁的版本清单，默认与新版本EXE同目录的version.json')
+    args = parser.parse_args()
+    
+    app = load_app_module()
+    new_path = Path(args.new)
+    new = new_path.read_bytes()
+    manifest_path = Path(args.manifest) if args.manifest else new_path.with_name(app.UPDATE_MANIFEST_NAME)
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    if manifest.get("sha256") != hashlib.sha256(new).hexdigest():
+        print(f"版本清单与 {new_path} 不一致，请先运行 tools/make_manifest.py")
+        return 1
+    
+    patch_dir = manifest_path.parent / "patches"
+    patch_dir.mkdir(exist_ok=True)
+    patches = {}
+    
+    for old_path in map(Path, args.old):
+        old = old_path.read_bytes()
+        base = hashlib.sha256(old).hexdigest()
+        if base == manifest["sha256"]:
+            continue
+        
+        output = patch_dir / f"{base[:16]}-{manifest['sha256'][:16]}.patch"
+        copied, inserted = write_patch(old, new, output)
+        
+        # 用客户端的实现重建一遍，确保补丁可用
+        with tempfile.TemporaryDirectory() as tmp:
+            rebuilt = app.apply_delta(output, old_path, Path(tmp) / "rebuilt.exe", base)
+        if rebuilt != manifest["sha256"]:
+            print(f"补丁校验失败: {output}")
+            return 1
+        
+        patches[base] = {
+            "path": output.relative_to(manifest_path.parent).as_posix(),
+            "sha256": app.file_sha256(output),
+            "size": output.stat().st_size,
+        }
+        print(f"{old_path.name} -> {new_path.name}: 补丁 {output.stat().st_size} bytes "
+              f"（{output.stat().st_size / len(new):.1%}），复制 {copied} bytes，插入 {inserted} bytes")
+    
+    # 只保留指向当前版本的补丁
+    manifest["patches"] = patches
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"已登记 {len(patches)} 个补丁到 {manifest_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+生成版本清单 dist/version.json
+打包完成后运行，与EXE一起上传到dist目录。客户端检查更新时只下载这个几百字节的清单，
+版本号或摘要与本地不同时才下载EXE。
+
+用法：
+  python tools/make_manifest.py                       # 默认处理 dist/ZGIRC_TimeSync.exe
+  python tools/make_manifest.py path/to/app.exe --version 0.0.3
+"""
+
+import re
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def read_version():
+    """
+    从zgirc_timesync/app.py中读取VERSION（不导入模块）
+    """
+    source = (ROOT / "zgirc_timesync" / "app.py").read_text(encoding='utf-8')
+    match = re.search(r'^VERSION\s*=\s*"([^"]+)"', source, re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成版本清单")
+    parser.add_argument('exe', nargs='?', default=str(ROOT / "dist" / "ZGIRC_TimeSync.exe"),
+                        help='EXE路径，默认dist/ZGIRC_TimeSync.exe')
+    parser.add_argument('--version', help='版本号，默认读取zgirc_timesync/app.py中的VERSION')
+    parser.add_argument('--output', help='输出路径，默认与EXE同目录的version.json')
+    args = parser.parse_args()
+    
+    exe = Path(args.exe)
+    digest = hashlib.sha256()
+    with open(exe, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    
+    manifest = {
+        "version": args.version or read_version(),
+        "sha256": digest.hexdigest(),
+        "size": exe.stat().st_size,
+    }
+    
+    output = Path(args.output) if args.output else exe.with_name("version.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"已生成 {output}: {manifest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
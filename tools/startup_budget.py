@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时预算检查
+测量 time.py（或打包后的EXE）的冷启动耗时，并给出 -X importtime 导入耗时排行，
+超出预算时返回非0退出码，可在打包前或CI中运行。
+除了只导入程序的 --version 外，还完整启动一次 query：创建TimeSyncApp（读取配置、设置日志），
+向本地NTP替身服务器（tools/fake_ntp_server.py）查询一轮，分别统计导入、初始化和查询的耗时。
+
+用法：
+  python tools/startup_budget.py                     # 检查源码启动耗时
+  python tools/startup_budget.py --runs 20 --top 15  # 多次测量，显示前15个导入
+  python tools/startup_budget.py --exe dist/ZGIRC_TimeSync.exe
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+from fake_ntp_server import FakeNTPCluster, FakeServerConfig
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = ROOT / "time.py"
+
+# 模块自身的启动开销预算（毫秒，不含解释器本身的启动时间）
+STARTUP_BUDGET_MS = 60          # 只导入程序（--version）
+INIT_BUDGET_MS = 10             # 创建TimeSyncApp（配置、日志、时钟接口等）
+QUERY_BUDGET_MS = 150           # 完整的query：导入、初始化、查询一轮替身服务器并退出
+
+# 完整启动一次query（在子进程中运行，与cmd_query的步骤相同），输出各阶段耗时（秒）的JSON
+QUERY_DRIVER = """
+import sys
+import json
+import time
+start = time.perf_counter()
+from pathlib import Path
+from zgirc_timesync import app
+imported = time.perf_counter()
+# 源码运行时配置和日志在time.py旁边，改为准备好的临时目录
+app.SOURCE_DIR = Path(sys.argv[1])
+instance = app.TimeSyncApp()
+instance.short_lived = True
+created = time.perf_counter()
+estimate = instance.get_ntp_time()
+queried = time.perf_counter()
+print(json.dumps({"import": imported - start, "init": created - imported, "query": queried - created,
+                  "ok": estimate is not None}))
+"""
+
+
+def measure(cmd, runs, prepare=None):
+    """
+    多次运行命令，返回每次的耗时（毫秒）和最后一次的标准输出
+    prepare: 每次运行前调用的函数（不计入耗时）
+    """
+    samples = []
+    output = None
+    for _ in range(runs):
+        if prepare:
+            prepare()
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+        output = result.stdout
+    return samples, output
+
+
+def import_report(cmd, top, prepare=None):
+    """
+    用 -X importtime 运行一次，返回累计耗时最多的导入[(累计微秒, 模块名)]
+    """
+    if prepare:
+        prepare()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *cmd[1:]],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # 只统计顶层导入，避免子模块重复计入
+        if not name.startswith("  "):
+            rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def make_program_dir(template, addresses):
+    """
+    准备程序目录的模板：指向替身服务器的配置、服务器健康记录，以及7天的旧日志（没有日志索引，
+    即升级后第一次运行的情况）
+    """
+    template.mkdir()
+    (template / "config.json").write_text(json.dumps({"ntp_servers": addresses, "save_log": True}),
+                                          encoding='utf-8')
+    now = time.time()
+    health = {address: {"rtt": 0.001, "jitter": 0.0, "failures": 0, "backoff_until": 0,
+                        "last_success": now, "updated": now} for address in addresses}
+    (template / "ntp_health.json").write_text(json.dumps(health), encoding='utf-8')
+    log_dir = template / "log"
+    log_dir.mkdir()
+    for day in range(7):
+        stamp = time.strftime('%Y%m%d', time.localtime(now - (day + 1) * 86400))
+        for part in range(4):
+            name = f"time_sync_{stamp}_{part}.log" if part else f"time_sync_{stamp}.log"
+            (log_dir / name).write_bytes(b'x' * 64 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查冷启动耗时是否超出预算")
+    parser.add_argument("--runs", type=int, default=10, help="测量次数，默认10")
+    parser.add_argument("--top", type=int, default=10, help="显示耗时最多的N个导入，默认10")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                        help=f"只导入程序的启动开销预算（毫秒），默认{STARTUP_BUDGET_MS}")
+    parser.add_argument("--query-budget-ms", type=float, default=QUERY_BUDGET_MS,
+                        help=f"完整query的启动开销预算（毫秒），默认{QUERY_BUDGET_MS}")
+    parser.add_argument("--exe", help="测量打包后的EXE（onefile解包耗时也计入；EXE的程序目录无法替换，只测--version）")
+    args = parser.parse_args()
+    
+    if args.exe:
+        samples, _ = measure([args.exe, "--version"], args.runs)
+        median = statistics.median(samples)
+        print(f"EXE启动耗时: 中位数 {median:.1f}ms，最小 {min(samples):.1f}ms，最大 {max(samples):.1f}ms")
+        return 0
+    
+    failed = []
+    baseline = statistics.median(measure([sys.executable, "-c", "pass"], args.runs)[0])
+    samples, _ = measure([sys.executable, str(SCRIPT), "--version"], args.runs)
+    median = statistics.median(samples)
+    overhead = median - baseline
+    print(f"解释器启动: {baseline:.1f}ms")
+    print(f"time.py --version: 中位数 {median:.1f}ms，最小 {min(samples):.1f}ms，最大 {max(samples):.1f}ms，"
+          f"启动开销 {overhead:.1f}ms（预算 {args.budget_ms:.0f}ms）")
+    if overhead > args.budget_ms:
+        failed.append(f"--version 超出启动预算 {overhead - args.budget_ms:.1f}ms")
+    
+    workdir = Path(tempfile.mkdtemp(prefix="zgirc_startup_"))
+    with FakeNTPCluster([FakeServerConfig() for _ in range(3)], seed=1) as cluster:
+        template = workdir / "template"
+        program_dir = workdir / "program"
+        make_program_dir(template, cluster.addresses)
+        
+        def prepare():
+            # 每次都从模板开始：没有日志索引，和升级后第一次运行相同
+            shutil.rmtree(program_dir, ignore_errors=True)
+            shutil.copytree(template, program_dir)
+        
+        command = [sys.executable, "-c", QUERY_DRIVER, str(program_dir)]
+        phases = []
+        samples = []
+        for _ in range(args.runs):
+            elapsed, output = measure(command, 1, prepare)
+            samples.extend(elapsed)
+            phases.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+        report = import_report(command, args.top, prepare)
+    shutil.rmtree(workdir, ignore_errors=True)
+    
+    median = statistics.median(samples)
+    overhead = median - baseline
+    init_ms = statistics.median(phase["init"] for phase in phases) * 1000
+    print(f"query: 中位数 {median:.1f}ms，启动开销 {overhead:.1f}ms（预算 {args.query_budget_ms:.0f}ms）；"
+          f"导入 {statistics.median(phase['import'] for phase in phases) * 1000:.1f}ms，"
+          f"创建TimeSyncApp {init_ms:.1f}ms（预算 {INIT_BUDGET_MS}ms），"
+          f"查询 {statistics.median(phase['query'] for phase in phases) * 1000:.1f}ms")
+    if not all(phase["ok"] for phase in phases):
+        failed.append("query 没有从替身服务器取得时间")
+    if overhead > args.query_budget_ms:
+        failed.append(f"query 超出启动预算 {overhead - args.query_budget_ms:.1f}ms")
+    if init_ms > INIT_BUDGET_MS:
+        failed.append(f"创建TimeSyncApp 超出预算 {init_ms - INIT_BUDGET_MS:.1f}ms")
+    
+    print()
+    print(f"query的导入耗时排行（前{args.top}，累计）:")
+    for cumulative_us, name in report:
+        print(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+    
+    if failed:
+        print()
+        for line in failed:
+            print(line)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
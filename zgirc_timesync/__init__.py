@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+ZGIRC时间同步工具
+app: 配置、NTP查询、时钟调整、自动同步、日志、图形界面和命令行
+metrics: 运行指标的计数器、直方图和/metrics服务（HTTP服务在启用时才导入）
+drift: 时钟漂移估计（用到时才导入）
+server: 局域网时间服务（serve子命令，用到时才导入）
+fleet: 批量同步（agent和orchestrate子命令，用到时才导入）
+"""
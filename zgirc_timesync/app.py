@@ -0,0 +1,5010 @@
+# -*- coding: utf-8 -*-
+"""
+ZGIRC时间同步工具 v4.2
+功能：
+  - 一键同步系统时间（使用阿里云NTP服务器）
+  - 一键更新程序（自动下载最新版本）
+  - 查看运行日志
+  - 清理过期日志
+
+作者：kuangxing4250
+仓库：https://github.com/kuangxing4250/zgirc-time-sync
+
+程序主体放在可导入的模块中，入口time.py只负责调用main()：
+作为__main__运行的脚本每次启动都要重新编译，导入的模块则使用__pycache__中的字节码
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from .metrics import MetricsRegistry
+
+# 注意：requests、ctypes、subprocess等较重的模块在用到时才导入，
+# 以减少开机自启动时的启动耗时（见 tools/startup_budget.py）
+
+# 源码运行时入口脚本time.py所在的目录
+SOURCE_DIR = Path(__file__).resolve().parent.parent
+
+# ==================== 配置信息 ====================
+APP_NAME = "ZGIRC时间同步"
+VERSION = "0.0.2-beta.0"
+
+# GitHub信息（用于更新）
+GITHUB_USER = "kuangxing4250"
+GITHUB_REPO = "zgirc-time-sync"
+EXE_NAME = "ZGIRC_TimeSync.exe"
+
+# GitHub文件下载链接（主分支dist目录）
+GITHUB_RAW_URL = f"https://raw.githubusercontent.com/{GITHUB_USER}/{GITHUB_REPO}/main/dist/{EXE_NAME}"
+GITHUB_BLOB_URL = f"https://github.com/{GITHUB_USER}/{GITHUB_REPO}/blob/main/dist/{EXE_NAME}"
+
+# 更新地址列表（加速网站优先）
+UPDATE_URLS = [
+    f"https://gh.jasonzeng.dev/{GITHUB_BLOB_URL}",
+    GITHUB_RAW_URL,
+]
+
+# 更新下载参数
+UPDATE_WORKERS = 4                  # 并行下载的连接数
+UPDATE_CHUNK_SIZE = 1024 * 1024     # Range分块大小（字节）
+UPDATE_READ_SIZE = 256 * 1024       # 每次从网络读取的大小（字节）
+UPDATE_BUFFER_SIZE = 1024 * 1024    # 写文件缓冲区大小（字节）
+UPDATE_TIMEOUT = (5, 15)            # (连接超时, 读取超时)（秒）
+UPDATE_RACE_GRACE = 0.2             # 最快的镜像响应后，其余镜像再等待的时间（秒）
+UPDATE_RACE_GRACE_FACTOR = 2        # 另加最快镜像首字节时间的倍数
+UPDATE_MIRROR_SLACK = 3             # 预计耗时不超过最快镜像该倍数的镜像参与分块下载，其余作为备用
+UPDATE_ASSUMED_THROUGHPUT = 256 * 1024  # 没有历史记录时假定的吞吐量（字节/秒）
+UPDATE_STALL_WINDOW = 5             # 测速窗口（秒）
+UPDATE_STALL_RATE = 16 * 1024       # 窗口内低于该速度（字节/秒）视为卡住，切换镜像
+UPDATE_HISTORY_SMOOTHING = 0.3      # 镜像历史记录的指数平滑系数
+UPDATE_HASH_BUFFER = 8 * 1024 * 1024  # 边下载边计算摘要时，乱序到达的数据在内存中暂存的上限（字节）
+UPDATE_HANDOFF_TIMEOUT = 30         # 新版本启动后等待旧进程退出的最长时间（秒）
+
+# 版本清单：与EXE放在同一目录，内容为{"version", "sha256", "size", "patches"}，用于轻量检查更新
+# patches为{旧版本sha256: {"path", "sha256", "size"}}，path为相对清单目录的差分补丁路径
+UPDATE_MANIFEST_NAME = "version.json"
+UPDATE_CACHE_FILE = "update_cache.json"
+UPDATE_DELTA_FILE = "time_new.patch"
+
+# NTP服务器列表（阿里云）
+NTP_SERVERS = [
+    "time1.aliyun.com",
+    "time2.aliyun.com", 
+    "time3.aliyun.com",
+    "time4.aliyun.com",
+    "time5.aliyun.com",
+    "time6.aliyun.com",
+    "ntp1.aliyun.com",
+    "ntp2.aliyun.com",
+]
+
+# NTP查询参数
+NTP_PORT = 123
+NTP_EPOCH_OFFSET = 2208988800  # 1900-01-01到1970-01-01的秒数
+NTP_TIMEOUT = 5     # 整轮并发查询的总超时（秒）
+NTP_QUORUM = 3      # 多少个服务器完成采样即提前返回
+NTP_BURST = 4       # 每个服务器连续采样次数
+NTP_MIN_DISPERSION = 0.005  # 根距离下限（秒）
+NTP_CANCEL_POLL = 0.05      # 可取消的查询中，检查取消标志的间隔（秒）
+
+# 域名解析参数
+DNS_CACHE_TTL = 3600        # 解析结果缓存时间（秒）
+DNS_TIMEOUT = 2             # 首次解析的总超时（秒）
+DNS_MAX_ADDRESSES = 4       # 每个域名最多使用的地址数
+
+# 服务器健康记录参数
+NTP_HEALTH_FILE = "ntp_health.json"
+NTP_HEALTH_TTL = 7 * 86400     # 记录过期时间（秒）
+NTP_BACKOFF_BASE = 60          # 失败后首次退避时间（秒）
+NTP_BACKOFF_MAX = 6 * 3600     # 最长退避时间（秒）
+
+# 同步历史（SQLite）
+HISTORY_FILE = "sync_history.db"
+HISTORY_RETENTION_DAYS = 400   # 历史记录保留天数
+HISTORY_BIN_BASE = 1e-6        # 分位数直方图的最小分桶（秒）
+HISTORY_BIN_RATIO = 1.2        # 相邻分桶的比例，分位数的相对误差不超过±10%
+HISTORY_BINS = 92              # 分桶数，覆盖1微秒到约20秒
+
+# 时钟漂移估计参数
+DRIFT_WINDOW_DAYS = 14         # 参与估计的同步历史范围（天）
+DRIFT_HALF_LIFE = 3 * 86400    # 权重减半的时间（秒），温度变化和晶振老化引起的频率变化能逐渐反映出来
+DRIFT_MIN_POINTS = 3           # 至少需要的校正间隔数
+DRIFT_MAX_STDERR = 1.0         # 估计的标准误差超过该值（ppm）时不校正频率
+DRIFT_MAX_PPM = 200            # 单个间隔的频率误差超过该值（ppm）视为异常（如手动改了时间），不参与估计
+DRIFT_MIN_CHANGE = 0.05        # 新估计与当前校正量相差不到该值（ppm）时不重新设置
+DRIFT_NOISE_FLOOR = 0.0001     # 单次偏差测量误差的下限（秒）
+
+# 局域网时间服务参数（serve子命令）
+NTP_SERVE_PORT = 123           # 监听端口
+NTP_SERVE_RATE = 1.0           # 每个客户端每秒补充的令牌数（请求数）
+NTP_SERVE_BURST = 16           # 每个客户端允许的突发请求数（客户端每轮连续采样NTP_BURST次）
+NTP_SERVE_MAX_AGE = 2 * 86400  # 距上次上游同步超过该时间（秒）后以"未同步"响应
+NTP_SERVE_BATCH = 256          # 每次可读时最多处理的请求数
+NTP_SERVE_CLIENTS = 65536      # 最多记录的客户端数（限速用）
+
+# 批量同步参数（agent / orchestrate子命令）
+AGENT_PORT = 12123             # 同步代理的TCP端口
+AGENT_TIMEOUT = 15             # 每台主机的超时（秒），包括连接和一次完整同步
+ORCHESTRATE_WORKERS = 64       # 同时进行的任务数上限
+
+# 时钟调整参数
+CLOCK_STEP_THRESHOLD = 0.128   # 偏差超过该值（秒）时直接跳变，否则平滑调整
+CLOCK_MAX_SLEW_RATE = 0.0005   # 平滑调整的最大速率（500ppm）
+
+# 自动同步参数
+AUTO_SYNC_INTERVAL = 3600       # 默认同步间隔（秒）
+AUTO_SYNC_MIN_INTERVAL = 64     # 最短同步间隔（秒）
+AUTO_SYNC_MAX_INTERVAL = 86400  # 最长同步间隔（秒）
+AUTO_SYNC_LARGE_OFFSET = 0.050  # 偏差超过该值（秒）时间隔减半
+AUTO_SYNC_SMALL_OFFSET = 0.005  # 偏差小于该值（秒）视为稳定
+AUTO_SYNC_STABLE_ROUNDS = 3     # 连续稳定多少轮后间隔加倍
+
+# 同步触发参数
+TRIGGER_POLL_INTERVAL = 2       # 检查事件源的间隔（秒），只读取本地状态
+TRIGGER_MIN_GAP = 10            # 两次触发的最短间隔（秒），避免网络抖动或连续事件反复同步
+TRIGGER_JUMP_THRESHOLD = 0.5    # 系统时间相对单调时钟的跳变超过该值（秒）时触发
+TRIGGER_RESUME_THRESHOLD = 5    # 挂起时间超过该值（秒）时视为从睡眠中唤醒
+TRIGGER_SYSFS_NET = "/sys/class/net"    # Linux网卡状态目录
+TRIGGER_ROUTE_PROBE = ("223.5.5.5", 53) # 用于查询默认路由的公网地址（UDP connect不发送数据）
+
+# 界面参数
+UI_FRAME_MS = 16                # 有事件时取出界面事件的间隔（毫秒），约60帧/秒
+UI_IDLE_MS = 100                # 没有事件时的检查间隔（毫秒）
+UI_FRAME_BUDGET = 0.008         # 每帧处理事件的时间上限（秒），超出的留到下一帧
+UI_PROGRESS_INTERVAL = 0.1      # 下载进度事件的最短间隔（秒）
+UI_RATE_WINDOW = 2.0            # 计算下载速度的时间窗口（秒）
+
+# 运行指标参数（默认关闭，配置metrics为true时启用）
+METRICS_HOST = "127.0.0.1"     # /metrics的监听地址，默认只允许本机访问
+METRICS_PORT = 9123            # /metrics的监听端口
+METRICS_TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                        0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)        # 时间类直方图的分桶（秒）
+METRICS_RATE_BUCKETS = tuple(16384 * 4 ** i for i in range(7))            # 下载速度直方图的分桶（字节/秒），16KB/s到64MB/s
+
+# 日志参数
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_QUEUE_SIZE = 10000          # 日志队列容量（条），写入线程跟不上时按溢出策略丢弃
+LOG_BATCH_SIZE = 256            # 写入线程每批最多处理的日志条数，每批flush一次
+LOG_MAX_BYTES = 10 * 1024 * 1024        # 单个日志文件的大小上限（字节），超过后换新文件
+LOG_MAX_TOTAL_BYTES = 200 * 1024 * 1024 # 轮转下来的日志文件（压缩后）的总大小上限（字节）
+LOG_INDEX_FILE = "log_index.json"       # 轮转记录，清理时不需要扫描目录
+
+# 禁用代理
+os.environ['HTTP_PROXY'] = ''
+os.environ['HTTPS_PROXY'] = ''
+os.environ['NO_PROXY'] = '*'
+
+
+def _import_requests():
+    """
+    导入requests（仅更新时需要），首次导入时禁用证书警告
+    """
+    import requests
+    import urllib3
+    
+    # 禁用警告
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return requests
+
+
+# ==================== 运行指标 ====================
+
+# 全局指标（默认关闭，TimeSyncApp.start_metrics启用）
+METRICS = MetricsRegistry(VERSION)
+METRIC_NTP_RTT = METRICS.histogram(
+    "zgirc_ntp_rtt_seconds", "NTP往返延迟（每个采样）", METRICS_TIME_BUCKETS, ("server",))
+METRIC_NTP_OFFSET = METRICS.histogram(
+    "zgirc_ntp_offset_abs_seconds", "本机与NTP服务器的偏差绝对值（每个采样）", METRICS_TIME_BUCKETS, ("server",))
+METRIC_CLOCK_JITTER = METRICS.histogram(
+    "zgirc_clock_jitter_seconds", "时钟选择结果的抖动（每轮）", METRICS_TIME_BUCKETS)
+METRIC_CLOCK_OFFSET = METRICS.gauge(
+    "zgirc_clock_offset_seconds", "最近一轮测得的本机时钟偏差（校正前）")
+METRIC_DNS_RESOLVE = METRICS.histogram(
+    "zgirc_dns_resolve_seconds", "NTP服务器域名的阻塞解析耗时", METRICS_TIME_BUCKETS)
+METRIC_SYNC_DURATION = METRICS.histogram(
+    "zgirc_sync_duration_seconds", "一次完整同步（解析、查询、调整时钟）的耗时", METRICS_TIME_BUCKETS, ("result",))
+METRIC_CLOCK_FREQUENCY = METRICS.gauge(
+    "zgirc_clock_frequency_ppm", "当前的时钟频率校正（ppm，正数表示让时钟走快）")
+METRIC_LAST_SYNC = METRICS.gauge(
+    "zgirc_last_sync_timestamp_seconds", "最近一次同步成功的Unix时间")
+METRIC_UPDATE_THROUGHPUT = METRICS.histogram(
+    "zgirc_update_throughput_bytes_per_second", "更新下载的平均速度（每次下载）", METRICS_RATE_BUCKETS)
+METRIC_RESYNC_TRIGGERS = METRICS.counter(
+    "zgirc_resync_triggers_total", "因睡眠唤醒、网络变化或系统时间跳变立即同步的次数")
+METRIC_TIMEOUTS = METRICS.counter(
+    "zgirc_timeouts_total", "超时次数（ntp=NTP服务器无响应，dns=域名解析超时）", ("kind",))
+METRIC_FALLBACKS = METRICS.counter(
+    "zgirc_fallbacks_total", "改用备用方案的次数（clock_shell=命令行设置时间，mirror=分块换镜像，"
+    "stream=整体下载，delta=差分更新失败改为完整下载）", ("kind",))
+
+
+# ==================== NTP查询引擎 ====================
+
+def _parse_server(server, default_port=NTP_PORT):
+    """
+    解析服务器地址
+    server: "host"、"host:port"、"IPv6地址" 或 "[IPv6地址]:port"
+    default_port: 没有写端口时使用的端口
+    返回：(host, port)
+    """
+    if server.startswith('['):
+        host, _, rest = server[1:].partition(']')
+        port = rest.lstrip(':')
+        return host, int(port) if port.isdigit() else default_port
+    
+    host, sep, port = server.rpartition(':')
+    if sep and port.isdigit() and ':' not in host:
+        return host, int(port)
+    return server, default_port
+
+
+# 查询目标：name为显示和健康记录使用的名称，family/address用于创建socket和connect
+NTPTarget = namedtuple('NTPTarget', ['name', 'family', 'address'])
+
+
+class DNSCache:
+    """
+    NTP服务器域名解析缓存
+    所有域名并发解析一次，缓存全部A/AAAA记录，每个IP地址作为独立的查询目标；
+    记录过期后继续使用旧记录并在后台刷新，只有首次解析会阻塞同步流程
+    """
+    
+    def __init__(self, ttl=DNS_CACHE_TTL, family="any", max_addresses=DNS_MAX_ADDRESSES, logger=None):
+        """
+        ttl: 缓存有效期（秒）
+        family: 地址族，"any"=IPv4和IPv6，"ipv4"=仅IPv4，"ipv6"=仅IPv6
+        max_addresses: 每个域名最多使用的地址数
+        logger: 日志对象
+        """
+        self.ttl = ttl
+        self.family = family
+        self.max_addresses = max_addresses
+        self.logger = logger or logging.getLogger(__name__)
+        self.entries = {}       # server -> (过期时间, [NTPTarget])
+        self.refreshing = set()
+        self.last_resolve_time = 0.0  # 最近一次阻塞解析的耗时（秒）
+        self._lock = threading.Lock()
+    
+    def _lookup(self, server):
+        """
+        解析单个服务器地址
+        返回：[NTPTarget]
+        """
+        import socket
+        
+        host, port = _parse_server(server)
+        family = {"ipv4": socket.AF_INET, "ipv6": socket.AF_INET6}.get(self.family, socket.AF_UNSPEC)
+        infos = socket.getaddrinfo(host, port, family, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        
+        targets = []
+        seen = set()
+        for family, _, _, _, address in infos:
+            if address[0] in seen:
+                continue
+            seen.add(address[0])
+            # 域名显示为"域名/IP"，IP地址直接使用原始写法
+            name = server if address[0] == host else f"{host}/{address[0]}"
+            targets.append(NTPTarget(name, family, address))
+        return targets[:self.max_addresses]
+    
+    def _store(self, server, targets):
+        with self._lock:
+            self.entries[server] = (time.monotonic() + self.ttl, targets)
+            self.refreshing.discard(server)
+    
+    def _refresh(self, server):
+        """
+        后台刷新过期记录，失败时保留旧记录
+        """
+        try:
+            self._store(server, self._lookup(server))
+        except Exception as e:
+            self.logger.warning(f"刷新 {server} 的解析记录失败: {e}")
+            with self._lock:
+                self.refreshing.discard(server)
+    
+    def resolve(self, servers, timeout=DNS_TIMEOUT):
+        """
+        解析服务器列表
+        servers: 服务器地址列表
+        timeout: 没有缓存的域名并发解析的总超时（秒）
+        返回：(NTPTarget列表（按服务器顺序，相同地址只保留一个）, 失败原因字典{server: reason})
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait
+        
+        now = time.monotonic()
+        resolved = {}
+        missing = []
+        with self._lock:
+            for server in servers:
+                entry = self.entries.get(server)
+                if entry is None:
+                    missing.append(server)
+                    continue
+                expires, targets = entry
+                resolved[server] = targets
+                if expires <= now and server not in self.refreshing:
+                    self.refreshing.add(server)
+                    threading.Thread(target=self._refresh, args=(server,), daemon=True).start()
+        
+        failures = {}
+        if missing:
+            start = time.perf_counter()
+            # getaddrinfo无法取消，超时后放弃等待，解析线程自行结束
+            executor = ThreadPoolExecutor(max_workers=len(missing))
+            futures = {executor.submit(self._lookup, server): server for server in missing}
+            done, _ = wait(futures, timeout=timeout)
+            executor.shutdown(wait=False)
+            self.last_resolve_time = time.perf_counter() - start
+            METRIC_DNS_RESOLVE.observe(self.last_resolve_time)
+            
+            for future, server in futures.items():
+                if future not in done:
+                    failures[server] = "域名解析超时"
+                elif future.exception():
+                    failures[server] = future.exception()
+                else:
+                    resolved[server] = future.result()
+                    self._store(server, resolved[server])
+        
+        # 多个域名可能解析到同一个地址，同一地址只作为一个时间源
+        targets = []
+        seen = set()
+        for server in servers:
+            for target in resolved.get(server, ()):
+                if target.address[:2] not in seen:
+                    seen.add(target.address[:2])
+                    targets.append(target)
+        return targets, failures
+
+
+def _to_ntp_timestamp(unix_ns):
+    """
+    Unix纳秒时间 -> NTP 64位时间戳（高32位秒，低32位秒的小数）
+    """
+    seconds, ns = divmod(unix_ns, 1_000_000_000)
+    fraction = (ns << 32) // 1_000_000_000
+    return ((seconds + NTP_EPOCH_OFFSET) & 0xFFFFFFFF) << 32 | fraction
+
+
+def _from_ntp_timestamp(value):
+    """
+    NTP 64位时间戳 -> Unix纳秒时间
+    """
+    seconds = (value >> 32) - NTP_EPOCH_OFFSET
+    ns = ((value & 0xFFFFFFFF) * 1_000_000_000) >> 32
+    return seconds * 1_000_000_000 + ns
+
+
+def _from_ntp_short(value):
+    """
+    NTP 32位短格式（16位秒 + 16位小数）-> 秒
+    """
+    return value / 65536.0
+
+
+class NTPSample:
+    """
+    一次NTP查询的结果（RFC 5905 客户端/服务器模式）
+    T1：客户端发送时间  T2：服务器接收时间
+    T3：服务器发送时间  T4：客户端接收时间
+    时间均为Unix纳秒；offset/delay单位为秒
+    """
+    
+    __slots__ = ('server', 'leap', 'stratum', 'precision', 'root_delay',
+                 'root_dispersion', 'ref_id', 't1', 't2', 't3', 't4',
+                 'offset', 'delay')
+    
+    def __init__(self, server, leap, stratum, precision, root_delay,
+                 root_dispersion, ref_id, t1, t2, t3, t4):
+        self.server = server
+        self.leap = leap
+        self.stratum = stratum
+        self.precision = precision
+        self.root_delay = root_delay
+        self.root_dispersion = root_dispersion
+        self.ref_id = ref_id
+        self.t1 = t1
+        self.t2 = t2
+        self.t3 = t3
+        self.t4 = t4
+        # 时钟偏差 offset = ((T2 - T1) + (T3 - T4)) / 2
+        self.offset = ((t2 - t1) + (t3 - t4)) / 2e9
+        # 往返延迟 delay = (T4 - T1) - (T3 - T2)，不小于0
+        self.delay = max((t4 - t1) - (t3 - t2), 0) / 1e9
+    
+    def __repr__(self):
+        return (f"NTPSample(server={self.server!r}, stratum={self.stratum}, "
+                f"offset={self.offset * 1000:+.3f}ms, delay={self.delay * 1000:.3f}ms)")
+    
+    def now_ns(self):
+        """
+        按本次测得的偏差校正后的当前时间（Unix纳秒）
+        """
+        return time.time_ns() + round(self.offset * 1e9)
+
+
+def _build_ntp_request(t1):
+    """
+    构造NTP客户端请求包（LI=0, VN=4, Mode=3）
+    t1: 发送时间（Unix纳秒），写入发送时间戳字段，用于校验响应
+    """
+    return b'\x23' + 39 * b'\0' + struct.pack('!Q', _to_ntp_timestamp(t1))
+
+
+def _parse_ntp_reply(server, data, t1, t4):
+    """
+    解析NTP响应
+    server: 服务器地址
+    data: 响应数据
+    t1: 请求发送时间（Unix纳秒）
+    t4: 响应接收时间（Unix纳秒）
+    返回：(NTPSample, None) 或 (None, 失败原因)
+    """
+    if len(data) < 48:
+        return None, f"响应长度错误: {len(data)}"
+    
+    (flags, stratum, _poll, precision, root_delay, root_dispersion,
+     ref_id, _ref, _origin, receive, transmit) = struct.unpack('!BBbbII4sQQQQ', data[:48])
+    
+    mode = flags & 0x07
+    if mode != 4:
+        return None, f"响应模式错误: {mode}"
+    
+    if stratum == 0:
+        # Kiss-o'-Death包，参考标识为ASCII代码
+        return None, f"服务器拒绝服务(KoD): {ref_id.decode('ascii', 'replace')}"
+    
+    leap = flags >> 6
+    if leap == 3:
+        return None, "服务器时钟未同步"
+    
+    if not receive or not transmit:
+        return None, "时间戳为空"
+    
+    sample = NTPSample(
+        server=server,
+        leap=leap,
+        stratum=stratum,
+        precision=precision,
+        root_delay=_from_ntp_short(root_delay),
+        root_dispersion=_from_ntp_short(root_dispersion),
+        ref_id=ref_id,
+        t1=t1,
+        t2=_from_ntp_timestamp(receive),
+        t3=_from_ntp_timestamp(transmit),
+        t4=t4,
+    )
+    return sample, None
+
+
+def query_ntp_servers(targets, timeout=NTP_TIMEOUT, quorum=NTP_QUORUM, burst=1,
+                      on_sample=None, cancel=None):
+    """
+    并发查询NTP服务器
+    同时向所有目标发送请求（非阻塞UDP + selectors），每个目标收到响应后
+    立即发送下一个请求，直到采样burst次；整轮查询共用一个总超时，
+    有quorum个服务器完成采样后立即返回
+    T1/T4取自time.time_ns()，两者之差用perf_counter_ns()测量，不受系统时间跳变影响
+    targets: NTPTarget列表（由DNSCache.resolve得到）
+    timeout: 总超时（秒）
+    quorum: 提前返回所需完成采样的目标数
+    burst: 每个目标的采样次数
+    on_sample: 收到每个有效采样时的回调函数(NTPSample)，在调用线程中执行
+    cancel: threading.Event，置位后尽快返回已收到的采样
+    返回：(NTPSample列表（按到达顺序）, 失败原因字典{目标名称: reason})
+    """
+    import socket
+    import selectors
+    
+    samples = []
+    failures = {}
+    counts = {}
+    completed = 0
+    deadline = time.monotonic() + timeout
+    
+    def send_request(sock, server):
+        t1 = time.time_ns()
+        t1_perf = time.perf_counter_ns()
+        sock.send(_build_ntp_request(t1))
+        return server, t1, t1_perf
+    
+    with selectors.DefaultSelector() as sel:
+        # 向所有目标发送请求（地址已解析，不会阻塞在DNS上）
+        for server, family, address in targets:
+            sock = None
+            try:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+                sock.setblocking(False)
+                # connect后内核只接收该地址的响应
+                sock.connect(address)
+                sel.register(sock, selectors.EVENT_READ, send_request(sock, server))
+                counts[server] = 0
+            except Exception as e:
+                failures[server] = e
+                if sock:
+                    sock.close()
+        
+        # 等待响应，直到达到quorum或超时
+        while sel.get_map() and completed < quorum:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (cancel is not None and cancel.is_set()):
+                break
+            if cancel is not None:
+                remaining = min(remaining, NTP_CANCEL_POLL)
+            
+            for key, _ in sel.select(remaining):
+                server, t1, t1_perf = key.data
+                sock = key.fileobj
+                try:
+                    data = sock.recv(1024)
+                    t4 = t1 + (time.perf_counter_ns() - t1_perf)
+                    if data[24:32] != struct.pack('!Q', _to_ntp_timestamp(t1)):
+                        # 源时间戳不匹配：上一次请求的迟到响应或伪造包，忽略
+                        continue
+                    sample, reason = _parse_ntp_reply(server, data, t1, t4)
+                    if sample:
+                        samples.append(sample)
+                        counts[server] += 1
+                        if on_sample:
+                            on_sample(sample)
+                        if counts[server] < burst:
+                            sel.modify(sock, selectors.EVENT_READ, send_request(sock, server))
+                            continue
+                        completed += 1
+                    else:
+                        failures[server] = reason
+                except BlockingIOError:
+                    continue
+                except Exception as e:
+                    failures[server] = e
+                sel.unregister(sock)
+                sock.close()
+        
+        # 仍未完成的服务器：没有任何响应时记为超时
+        for key in list(sel.get_map().values()):
+            server = key.data[0]
+            if counts[server] == 0 and completed < quorum:
+                failures[server] = "超时"
+            sel.unregister(key.fileobj)
+            key.fileobj.close()
+    
+    return samples, failures
+
+
+# ==================== 时钟过滤与选择 ====================
+
+class ClockEstimate:
+    """
+    时钟选择的结果：多个服务器合并后的时钟偏差
+    offset: 合并后的偏差（秒）
+    delay: 系统对等体（根距离最小的服务器）的往返延迟（秒）
+    jitter: 存活服务器之间的偏差抖动（秒）
+    stratum: 系统对等体的层级
+    peer: 系统对等体地址
+    survivors: 存活的服务器列表
+    falsetickers: 被剔除的服务器列表
+    """
+    
+    __slots__ = ('offset', 'delay', 'jitter', 'stratum', 'peer',
+                 'survivors', 'falsetickers')
+    
+    def __init__(self, offset, delay, jitter, stratum, peer, survivors, falsetickers):
+        self.offset = offset
+        self.delay = delay
+        self.jitter = jitter
+        self.stratum = stratum
+        self.peer = peer
+        self.survivors = survivors
+        self.falsetickers = falsetickers
+    
+    def __repr__(self):
+        return (f"ClockEstimate(offset={self.offset * 1000:+.3f}ms, "
+                f"jitter={self.jitter * 1000:.3f}ms, peer={self.peer!r}, "
+                f"survivors={len(self.survivors)}, falsetickers={len(self.falsetickers)})")
+    
+    def now_ns(self):
+        """
+        按合并偏差校正后的当前时间（Unix纳秒）
+        """
+        return time.time_ns() + round(self.offset * 1e9)
+    
+    def as_dict(self):
+        """
+        转换为可JSON序列化的字典
+        """
+        return {
+            "offset": self.offset,
+            "delay": self.delay,
+            "jitter": self.jitter,
+            "stratum": self.stratum,
+            "peer": self.peer,
+            "survivors": self.survivors,
+            "falsetickers": self.falsetickers,
+        }
+
+
+class ClockSelector:
+    """
+    时钟过滤与选择（参考RFC 5905 第10、11章）
+    1. 时钟过滤：每个服务器的多次采样中取往返延迟最小的一个，其余采样用于估计抖动
+    2. 交集算法（Marzullo）：按各服务器的正确性区间[offset-λ, offset+λ]剔除错误时钟
+    3. 时钟合并：对存活服务器按根距离λ的倒数加权平均偏差
+    全程只对扁平的采样列表做排序和线性扫描，几百个采样一轮在毫秒以内
+    可替换为自定义实现，只需提供 select(samples) 方法
+    """
+    
+    def __init__(self, min_dispersion=NTP_MIN_DISPERSION):
+        """
+        min_dispersion: 根距离下限（秒），避免局域网内区间过窄导致误判
+        """
+        self.min_dispersion = min_dispersion
+    
+    def filter(self, samples):
+        """
+        时钟过滤
+        samples: NTPSample列表
+        返回：[(最佳采样, 抖动)]，每个服务器一项
+        """
+        ordered = sorted(samples, key=lambda s: (s.server, s.delay))
+        result = []
+        i = 0
+        while i < len(ordered):
+            best = ordered[i]
+            j = i + 1
+            sq_sum = 0.0
+            while j < len(ordered) and ordered[j].server == best.server:
+                sq_sum += (ordered[j].offset - best.offset) ** 2
+                j += 1
+            count = j - i - 1
+            jitter = (sq_sum / count) ** 0.5 if count else 0.0
+            # 抖动不小于服务器的时钟精度
+            result.append((best, max(jitter, 2.0 ** best.precision)))
+            i = j
+        return result
+    
+    def root_distance(self, sample, jitter):
+        """
+        根距离λ：服务器时间误差的上限（秒）
+        """
+        distance = (sample.root_delay + sample.delay) / 2 + sample.root_dispersion + jitter
+        return max(distance, self.min_dispersion)
+    
+    def intersect(self, peers):
+        """
+        交集算法：在允许f个错误时钟(f < n/2)的前提下，
+        找到被至少n-f个正确性区间同时包含的区间[low, high]
+        peers: [(offset, λ)]
+        返回：(low, high) 或 None（无法形成多数）
+        """
+        n = len(peers)
+        # 端点类型：-1=下界，0=中点，+1=上界；同值时下界在前
+        endpoints = []
+        for offset, distance in peers:
+            endpoints.append((offset - distance, -1))
+            endpoints.append((offset, 0))
+            endpoints.append((offset + distance, 1))
+        endpoints.sort()
+        
+        for allow in range((n + 1) // 2):
+            found = 0
+            chime = 0
+            low = None
+            for value, kind in endpoints:
+                chime -= kind
+                if chime >= n - allow:
+                    low = value
+                    break
+                if kind == 0:
+                    found += 1
+            
+            chime = 0
+            high = None
+            for value, kind in reversed(endpoints):
+                chime += kind
+                if chime >= n - allow:
+                    high = value
+                    break
+                if kind == 0:
+                    found += 1
+            
+            if found > allow:
+                continue
+            if low is not None and high is not None and low <= high:
+                return low, high
+        
+        return None
+    
+    def select(self, samples):
+        """
+        从一轮采样中选出合并后的时钟估计
+        samples: NTPSample列表（可包含同一服务器的多次采样）
+        返回：ClockEstimate 或 None（没有采样或无法形成多数）
+        """
+        peers = self.filter(samples)
+        if not peers:
+            return None
+        
+        distances = [self.root_distance(sample, jitter) for sample, jitter in peers]
+        interval = self.intersect([(sample.offset, d) for (sample, _), d in zip(peers, distances)])
+        if interval is None:
+            return None
+        low, high = interval
+        
+        # 区间与[low, high]有交集的为正确时钟，其余为错误时钟
+        survivors = []
+        falsetickers = []
+        for (sample, jitter), distance in zip(peers, distances):
+            if sample.offset - distance <= high and sample.offset + distance >= low:
+                survivors.append((sample, distance))
+            else:
+                falsetickers.append(sample.server)
+        
+        # 按根距离倒数加权合并
+        weight_sum = sum(1 / distance for _, distance in survivors)
+        offset = sum(sample.offset / distance for sample, distance in survivors) / weight_sum
+        
+        peer, _ = min(survivors, key=lambda item: item[1])
+        jitter = (sum((sample.offset - peer.offset) ** 2 for sample, _ in survivors)
+                  / len(survivors)) ** 0.5
+        
+        return ClockEstimate(
+            offset=offset,
+            delay=peer.delay,
+            jitter=jitter,
+            stratum=peer.stratum,
+            peer=peer.server,
+            survivors=[sample.server for sample, _ in survivors],
+            falsetickers=falsetickers,
+        )
+
+
+# ==================== 系统时钟调整 ====================
+
+class ClockBackend:
+    """
+    系统时钟调整接口
+    step: 直接跳变到校正后的时间
+    slew: 通过微调时钟频率平滑追上偏差，时间不会倒退
+    """
+    
+    name = "base"
+    
+    # 进程退出后平滑调整是否仍会继续（由内核完成）；否则一次性的进程应改为跳变或等待调整完成
+    slew_outlives_process = True
+    
+    def step(self, offset):
+        """
+        跳变时钟
+        offset: 偏差（秒），正数表示本机时间偏慢
+        """
+        raise NotImplementedError
+    
+    def slew(self, offset):
+        """
+        平滑调整时钟
+        offset: 偏差（秒）
+        返回：预计完成调整所需的时间（秒）
+        """
+        raise NotImplementedError
+    
+    def frequency(self):
+        """
+        当前的频率校正
+        返回：ppm，正数表示让时钟走快
+        """
+        return 0.0
+    
+    def set_frequency(self, ppm):
+        """
+        持续校正时钟频率，在两次同步之间抵消本机时钟的漂移（与step/slew互不影响）
+        ppm: 频率校正量，正数表示让时钟走快
+        返回：实际生效的校正量（ppm，按平台精度取整）
+        """
+        raise NotImplementedError
+    
+    def restore(self, wait=False):
+        """
+        结束进程内维持的平滑调整（进程退出前调用），频率校正保持不变
+        wait: True=等待平滑调整完成，False=立即取消
+        """
+
+
+class WindowsClock(ClockBackend):
+    """
+    Windows时钟调整
+    step: SetLocalTime
+    slew: SetSystemTimeAdjustment 临时改变每个时钟中断的增量，由进程内的定时器到期恢复，
+          进程退出时（atexit）立即恢复，否则系统时钟会一直以±500ppm走偏
+    set_frequency: 同样改变每个时钟中断的增量，但一直保持；平滑调整叠加在其上。
+    增量以100ns为单位（标准增量通常为156250），频率校正的精度约为6.4ppm
+    """
+    
+    name = "windows"
+    slew_outlives_process = False
+    
+    def __init__(self, max_slew_rate=CLOCK_MAX_SLEW_RATE):
+        self.max_slew_rate = max_slew_rate
+        self._restore_timer = None
+        self._privilege_enabled = False
+        self._increment = None      # 标准增量（100ns）
+        self._freq_delta = None     # 频率校正对应的增量变化（100ns），None表示尚未读取
+        self._atexit_registered = False
+    
+    def _enable_privilege(self):
+        """
+        启用SE_SYSTEMTIME_NAME权限（默认处于禁用状态）
+        """
+        if self._privilege_enabled:
+            return
+        
+        import ctypes
+        from ctypes import wintypes
+        
+        class LUID(ctypes.Structure):
+            _fields_ = [('LowPart', wintypes.DWORD), ('HighPart', wintypes.LONG)]
+        
+        class TOKEN_PRIVILEGES(ctypes.Structure):
+            _fields_ = [
+                ('PrivilegeCount', wintypes.DWORD),
+                ('Luid', LUID),
+                ('Attributes', wintypes.DWORD),
+            ]
+        
+        TOKEN_ADJUST_PRIVILEGES = 0x0020
+        TOKEN_QUERY = 0x0008
+        SE_PRIVILEGE_ENABLED = 0x0002
+        
+        advapi32 = ctypes.windll.advapi32
+        kernel32 = ctypes.windll.kernel32
+        token = wintypes.HANDLE()
+        if not advapi32.OpenProcessToken(kernel32.GetCurrentProcess(),
+                                         TOKEN_ADJUST_PRIVILEGES | TOKEN_QUERY,
+                                         ctypes.byref(token)):
+            raise ctypes.WinError()
+        try:
+            privileges = TOKEN_PRIVILEGES()
+            privileges.PrivilegeCount = 1
+            privileges.Attributes = SE_PRIVILEGE_ENABLED
+            if not advapi32.LookupPrivilegeValueW(None, "SeSystemtimePrivilege",
+                                                  ctypes.byref(privileges.Luid)):
+                raise ctypes.WinError()
+            advapi32.AdjustTokenPrivileges(token, False, ctypes.byref(privileges), 0, None, None)
+            if kernel32.GetLastError() != 0:
+                raise ctypes.WinError()
+        finally:
+            kernel32.CloseHandle(token)
+        self._privilege_enabled = True
+    
+    def _read_adjustment(self):
+        """
+        读取时钟增量
+        返回：(当前增量, 标准增量, 是否由系统自行调整)，单位100ns
+        """
+        import ctypes
+        from ctypes import wintypes
+        
+        adjustment = wintypes.DWORD()
+        increment = wintypes.DWORD()
+        disabled = wintypes.BOOL()
+        if not ctypes.windll.kernel32.GetSystemTimeAdjustment(ctypes.byref(adjustment),
+                                                              ctypes.byref(increment),
+                                                              ctypes.byref(disabled)):
+            raise ctypes.WinError()
+        self._increment = increment.value
+        return adjustment.value, increment.value, bool(disabled.value)
+    
+    def _load_state(self):
+        """
+        首次使用时读取当前的时钟增量：上一个进程设置的频率校正继续沿用；
+        超出频率校正范围的增量是上一个进程退出时未恢复的平滑调整，交还给系统
+        """
+        if self._freq_delta is not None:
+            return
+        import ctypes
+        
+        adjustment, increment, disabled = self._read_adjustment()
+        delta = 0 if disabled else adjustment - increment
+        if abs(delta) > increment * DRIFT_MAX_PPM * 1e-6:
+            self._enable_privilege()
+            if not ctypes.windll.kernel32.SetSystemTimeAdjustment(0, True):
+                raise ctypes.WinError()
+            delta = 0
+        self._freq_delta = delta
+    
+    def _apply_adjustment(self, slew_delta=0):
+        """
+        设置每个时钟中断的增量：标准增量 + 频率校正 + 平滑调整；没有任何校正时交还给系统
+        返回：True=成功
+        """
+        import ctypes
+        
+        self._load_state()
+        delta = (self._freq_delta or 0) + slew_delta
+        if delta == 0:
+            return bool(ctypes.windll.kernel32.SetSystemTimeAdjustment(0, True))
+        return bool(ctypes.windll.kernel32.SetSystemTimeAdjustment(self._increment + delta, False))
+    
+    def _cancel_slew(self):
+        """
+        取消进行中的平滑调整，恢复为只有频率校正的时钟增量
+        """
+        if self._restore_timer:
+            self._restore_timer.cancel()
+            self._restore_timer = None
+        self._apply_adjustment()
+    
+    def restore(self, wait=False):
+        timer = self._restore_timer
+        if timer is None:
+            return
+        if wait:
+            # 定时器到期时自行恢复增量
+            timer.join()
+        else:
+            self._cancel_slew()
+    
+    def step(self, offset):
+        import ctypes
+        
+        class SYSTEMTIME(ctypes.Structure):
+            _fields_ = [
+                ('wYear', ctypes.c_uint16),
+                ('wMonth', ctypes.c_uint16),
+                ('wDayOfWeek', ctypes.c_uint16),
+                ('wDay', ctypes.c_uint16),
+                ('wHour', ctypes.c_uint16),
+                ('wMinute', ctypes.c_uint16),
+                ('wSecond', ctypes.c_uint16),
+                ('wMilliseconds', ctypes.c_uint16)
+            ]
+        
+        self._enable_privilege()
+        self._cancel_slew()
+        kernel32 = ctypes.windll.kernel32
+        
+        # 在设置前一刻计算目标时间，避免查询到设置之间的耗时带来误差
+        dt = datetime.fromtimestamp(time.time() + offset)
+        systime = SYSTEMTIME()
+        systime.wYear = dt.year
+        systime.wMonth = dt.month
+        systime.wDay = dt.day
+        systime.wHour = dt.hour
+        systime.wMinute = dt.minute
+        systime.wSecond = dt.second
+        systime.wMilliseconds = dt.microsecond // 1000
+        
+        if not kernel32.SetLocalTime(ctypes.byref(systime)):
+            raise Exception("SetLocalTime返回失败")
+    
+    def slew(self, offset):
+        import ctypes
+        
+        self._enable_privilege()
+        self._cancel_slew()
+        increment = self._increment
+        
+        # 每个时钟中断多走(或少走)delta个100ns，按实际取整后的速率计算持续时间
+        delta = max(1, round(increment * self.max_slew_rate))
+        duration = abs(offset) * increment / delta
+        
+        if not self._apply_adjustment(delta if offset > 0 else -delta):
+            raise ctypes.WinError()
+        
+        self._restore_timer = threading.Timer(duration, self._cancel_slew)
+        self._restore_timer.daemon = True
+        self._restore_timer.start()
+        if not self._atexit_registered:
+            import atexit
+            
+            atexit.register(self.restore)
+            self._atexit_registered = True
+        return duration
+    
+    def frequency(self):
+        self._load_state()
+        return self._freq_delta / self._increment * 1e6 if self._increment else 0.0
+    
+    def set_frequency(self, ppm):
+        import ctypes
+        
+        self._enable_privilege()
+        self._load_state()
+        increment = self._increment
+        self._freq_delta = round(increment * ppm * 1e-6)
+        # 平滑调整进行中时，到期恢复增量时才生效
+        if self._restore_timer is None and not self._apply_adjustment():
+            raise ctypes.WinError()
+        return self._freq_delta / increment * 1e6
+
+
+_timex_type = None
+
+
+def make_timex(**fields):
+    """
+    创建Linux struct timex（adjtimex/clock_adjtime参数）
+    结构体类型在首次使用时才定义，避免启动时加载ctypes
+    fields: 字段初始值
+    """
+    global _timex_type
+    
+    if _timex_type is None:
+        import ctypes
+        
+        class Timex(ctypes.Structure):
+            _fields_ = [
+                ('modes', ctypes.c_uint),
+                ('offset', ctypes.c_long),
+                ('freq', ctypes.c_long),
+                ('maxerror', ctypes.c_long),
+                ('esterror', ctypes.c_long),
+                ('status', ctypes.c_int),
+                ('constant', ctypes.c_long),
+                ('precision', ctypes.c_long),
+                ('tolerance', ctypes.c_long),
+                ('time_sec', ctypes.c_long),
+                ('time_usec', ctypes.c_long),
+                ('tick', ctypes.c_long),
+                ('ppsfreq', ctypes.c_long),
+                ('jitter', ctypes.c_long),
+                ('shift', ctypes.c_int),
+                ('stabil', ctypes.c_long),
+                ('jitcnt', ctypes.c_long),
+                ('calcnt', ctypes.c_long),
+                ('errcnt', ctypes.c_long),
+                ('stbcnt', ctypes.c_long),
+                ('tai', ctypes.c_int),
+                ('_padding', ctypes.c_int * 11),
+            ]
+        
+        _timex_type = Timex
+    
+    return _timex_type(**fields)
+
+
+# adjtimex modes
+ADJ_FREQUENCY = 0x0002
+ADJ_OFFSET_SINGLESHOT = 0x8001
+ADJ_SETOFFSET = 0x0100
+ADJ_NANO = 0x2000
+
+
+def _libc_adjtimex(timex):
+    """
+    调用libc的adjtimex
+    timex: make_timex创建的结构体
+    返回：时钟状态
+    """
+    import ctypes
+    
+    libc = ctypes.CDLL(None, use_errno=True)
+    state = libc.adjtimex(ctypes.byref(timex))
+    if state == -1:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return state
+
+
+class LinuxClock(ClockBackend):
+    """
+    Linux时钟调整（需要CAP_SYS_TIME）
+    step: adjtimex(ADJ_SETOFFSET) 按相对偏差原子地跳变，不存在读取-写入竞争
+    slew: adjtimex(ADJ_OFFSET_SINGLESHOT) 由内核以500ppm的速率平滑调整
+    set_frequency: adjtimex(ADJ_FREQUENCY) 设置内核的频率校正，单次调整叠加在其上
+    adjtimex可替换为任意接受timex结构体参数的函数，便于在容器中用假时钟测试
+    """
+    
+    name = "linux"
+    
+    # 内核单次调整的固定速率
+    SLEW_RATE = 0.0005
+    # timex.freq的单位为2^-16 ppm，内核限制在±500ppm
+    FREQ_SCALE = 65536
+    MAX_FREQUENCY = 500
+    
+    def __init__(self, adjtimex=None):
+        self.adjtimex = adjtimex or _libc_adjtimex
+    
+    def step(self, offset):
+        # 先取消未完成的平滑调整
+        self.adjtimex(make_timex(modes=ADJ_OFFSET_SINGLESHOT, offset=0))
+        
+        offset_ns = round(offset * 1e9)
+        seconds, nanoseconds = divmod(offset_ns, 1_000_000_000)
+        self.adjtimex(make_timex(modes=ADJ_SETOFFSET | ADJ_NANO,
+                                 time_sec=seconds, time_usec=nanoseconds))
+    
+    def slew(self, offset):
+        self.adjtimex(make_timex(modes=ADJ_OFFSET_SINGLESHOT, offset=round(offset * 1e6)))
+        return abs(offset) / self.SLEW_RATE
+    
+    def frequency(self):
+        timex = make_timex(modes=0)
+        self.adjtimex(timex)
+        return timex.freq / self.FREQ_SCALE
+    
+    def set_frequency(self, ppm):
+        freq = round(max(-self.MAX_FREQUENCY, min(self.MAX_FREQUENCY, ppm)) * self.FREQ_SCALE)
+        self.adjtimex(make_timex(modes=ADJ_FREQUENCY, freq=freq))
+        return freq / self.FREQ_SCALE
+
+
+def create_clock_backend():
+    """
+    创建当前平台的时钟调整接口
+    返回：ClockBackend 或 None（不支持的平台）
+    """
+    if sys.platform == 'win32':
+        return WindowsClock()
+    if sys.platform.startswith('linux'):
+        return LinuxClock()
+    return None
+
+
+# ==================== 自动同步调度 ====================
+
+class AutoSyncScheduler:
+    """
+    自动同步调度器
+    后台线程按间隔执行同步，间隔像ntpd的poll指数一样自适应：
+    偏差较大时间隔减半，连续多轮偏差很小时间隔加倍，
+    始终限制在[min_interval, max_interval]之内；
+    有时钟漂移模型时，加倍不超过模型预测偏差仍保持在"稳定"范围内的间隔
+    """
+    
+    def __init__(self, sync_func, interval=AUTO_SYNC_INTERVAL,
+                 min_interval=AUTO_SYNC_MIN_INTERVAL, max_interval=AUTO_SYNC_MAX_INTERVAL,
+                 callback=None, interval_limit=None, logger=None):
+        """
+        sync_func: 执行一次同步的函数，返回带offset属性的结果或None（失败）
+        interval: 初始同步间隔（秒）
+        min_interval/max_interval: 间隔的上下限（秒）
+        callback: 每轮同步后的回调函数(result)
+        interval_limit: 返回加倍时间隔上限（秒）的函数，返回None表示不限制
+        logger: 日志对象
+        """
+        self.sync_func = sync_func
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = self._clamp(interval)
+        self.callback = callback
+        self.interval_limit = interval_limit
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self.stable_count = 0       # 连续偏差很小的轮数
+        self.failure_count = 0      # 连续失败的次数
+        # 每次start()使用新的事件，停止后马上重新启动时旧线程仍能看到自己的停止标志
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _clamp(self, interval):
+        return min(max(interval, self.min_interval), self.max_interval)
+    
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, delay=0):
+        """
+        启动调度线程
+        delay: 首次同步前的等待时间（秒）
+        """
+        if self.running:
+            return
+        self._wake, self._stop = threading.Event(), threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(delay, self._wake, self._stop), daemon=True)
+        self._thread.start()
+        self.logger.info(f"自动同步已启动，间隔 {self.interval:.0f} 秒")
+    
+    def stop(self):
+        """
+        停止调度线程（不等待进行中的同步结束）
+        """
+        self._stop.set()
+        self._wake.set()
+        self._thread = None
+        self.logger.info("自动同步已停止")
+    
+    def trigger(self):
+        """
+        立即执行一次同步
+        """
+        self._wake.set()
+    
+    def update(self, result):
+        """
+        根据本轮同步结果调整间隔
+        result: 同步结果（带offset属性）或None
+        返回：距下一次同步的等待时间（秒）
+        """
+        if result is None:
+            # 失败时从最小间隔开始指数退避重试，不超过当前间隔
+            self.failure_count += 1
+            return min(self.min_interval * 2 ** (self.failure_count - 1), self.interval)
+        
+        self.failure_count = 0
+        offset = abs(result.offset)
+        if offset > AUTO_SYNC_LARGE_OFFSET:
+            self.stable_count = 0
+            self.interval = self._clamp(self.interval / 2)
+        elif offset < AUTO_SYNC_SMALL_OFFSET:
+            self.stable_count += 1
+            if self.stable_count >= AUTO_SYNC_STABLE_ROUNDS:
+                self.stable_count = 0
+                limit = self.interval_limit() if self.interval_limit else None
+                interval = self.interval * 2 if limit is None else min(self.interval * 2, max(limit, self.interval))
+                self.interval = self._clamp(interval)
+        else:
+            self.stable_count = 0
+        return self.interval
+    
+    def _run(self, delay, wake, stop):
+        wait = delay
+        while not stop.is_set():
+            wake.wait(wait)
+            wake.clear()
+            if stop.is_set():
+                break
+            
+            try:
+                result = self.sync_func()
+            except Exception as e:
+                self.logger.error(f"自动同步异常: {e}")
+                result = None
+            
+            if stop.is_set():
+                # 同步期间已被停止（可能已重新启动），不再更新间隔和回调
+                break
+            wait = self.update(result)
+            self.logger.info(f"下次自动同步在 {wait:.0f} 秒后")
+            
+            if self.callback:
+                self.callback(result)
+
+
+# ==================== 同步触发 ====================
+
+class ClockJumpSource:
+    """
+    事件源：系统时间相对单调时钟跳变（被手动修改、其他程序校时、唤醒后从硬件时钟恢复等）
+    wall / monotonic可替换为模拟的时钟
+    """
+    
+    def __init__(self, threshold=TRIGGER_JUMP_THRESHOLD, wall=time.time, monotonic=time.monotonic):
+        self.threshold = threshold
+        self.wall = wall
+        self.monotonic = monotonic
+        self.base = self._offset()
+    
+    def _offset(self):
+        return self.wall() - self.monotonic()
+    
+    def reset(self):
+        self.base = self._offset()
+    
+    def poll(self):
+        """
+        返回：触发原因，没有事件时返回None
+        """
+        offset = self._offset()
+        jump = offset - self.base
+        self.base = offset
+        if abs(jump) >= self.threshold:
+            return f"系统时间跳变 {jump:+.1f} 秒"
+        return None
+
+
+def _suspended_time_func():
+    """
+    返回读取"累计挂起时间（秒）"的函数，不支持的平台返回None
+    Linux: CLOCK_BOOTTIME包含挂起时间，CLOCK_MONOTONIC不包含
+    Windows: GetTickCount64包含睡眠时间，QueryUnbiasedInterruptTime不包含
+    """
+    if hasattr(time, 'CLOCK_BOOTTIME'):
+        return lambda: time.clock_gettime(time.CLOCK_BOOTTIME) - time.clock_gettime(time.CLOCK_MONOTONIC)
+    if sys.platform == 'win32':
+        import ctypes
+        
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetTickCount64.restype = ctypes.c_uint64
+        unbiased = ctypes.c_uint64()
+        
+        def suspended():
+            kernel32.QueryUnbiasedInterruptTime(ctypes.byref(unbiased))
+            return kernel32.GetTickCount64() / 1e3 - unbiased.value / 1e7
+        return suspended
+    return None
+
+
+class ResumeSource:
+    """
+    事件源：从睡眠/休眠中唤醒，挂起期间"含挂起时间"的时钟继续走而另一个停止，两者之差增大
+    suspended: 返回累计挂起时间（秒）的函数，可替换为模拟的时钟
+    """
+    
+    def __init__(self, suspended, threshold=TRIGGER_RESUME_THRESHOLD):
+        self.suspended = suspended
+        self.threshold = threshold
+        self.base = suspended()
+    
+    def reset(self):
+        self.base = self.suspended()
+    
+    def poll(self):
+        value = self.suspended()
+        delta = value - self.base
+        self.base = value
+        if delta >= self.threshold:
+            return f"从睡眠中唤醒（挂起约 {delta:.0f} 秒）"
+        return None
+
+
+def _route_address(probe=TRIGGER_ROUTE_PROBE):
+    """
+    查询访问公网时使用的本机地址（UDP connect只让内核选择路由，不发送数据）
+    返回：地址字符串，没有可用路由时返回None
+    """
+    import socket
+    
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(probe)
+            return sock.getsockname()[0]
+    except OSError:
+        return None
+
+
+class NetworkSource:
+    """
+    事件源：网络连接上或切换（网卡增减或连接状态变化、默认路由的本机地址变化）
+    状态变化后等下一次检查仍不变（DHCP等已完成）才触发；断网不触发
+    Linux读取sysfs中各网卡的operstate，其他平台用socket.if_nameindex()；
+    sysfs和route可替换为模拟的目录和函数
+    """
+    
+    def __init__(self, sysfs=TRIGGER_SYSFS_NET, route=None):
+        self.sysfs = Path(sysfs)
+        self.route = route or _route_address
+        self.pending = None
+        self.state = self.read_state()
+    
+    def read_state(self):
+        """
+        返回：((网卡, 状态), ...), 默认路由的本机地址)
+        """
+        if self.sysfs.is_dir():
+            interfaces = []
+            for path in sorted(self.sysfs.iterdir()):
+                if path.name == 'lo':
+                    continue
+                try:
+                    interfaces.append((path.name, (path / 'operstate').read_text().strip()))
+                except OSError:
+                    interfaces.append((path.name, 'unknown'))
+        else:
+            import socket
+            
+            interfaces = sorted((name, 'present') for _, name in socket.if_nameindex())
+        return tuple(interfaces), self.route()
+    
+    def reset(self):
+        self.state = self.read_state()
+        self.pending = None
+    
+    def poll(self):
+        state = self.read_state()
+        if state == self.state:
+            self.pending = None
+            return None
+        if state != self.pending:
+            self.pending = state
+            return None
+        self.state = state
+        self.pending = None
+        if state[1] is None:
+            return None
+        return f"网络已连接或切换（本机地址 {state[1]}）"
+
+
+class ResyncWatcher:
+    """
+    同步触发
+    后台线程每隔几秒检查一次各事件源（只读取本地状态，开销很小），发现从睡眠中唤醒、
+    网络连接或切换、系统时间跳变时立即触发同步，不必等到下一个自动同步间隔；
+    程序自己调整时钟后调用reset()，不会把自己的跳变当作事件，
+    触发的同步刚完成时偶尔漏掉的自身跳变由min_gap挡住
+    事件源为带poll()和reset()方法的对象，可替换为模拟的事件源，用check()同步驱动
+    """
+    
+    def __init__(self, on_trigger, sources=None, interval=TRIGGER_POLL_INTERVAL,
+                 min_gap=TRIGGER_MIN_GAP, logger=None, monotonic=time.monotonic):
+        """
+        on_trigger: 触发时调用的函数(reason)，在检查线程中执行
+        sources: 事件源列表，默认为default_sources()
+        interval: 检查间隔（秒）
+        min_gap: 两次触发的最短间隔（秒），其间的事件只更新基准
+        logger: 日志对象
+        monotonic: 计算min_gap用的时钟，可替换为模拟的时钟
+        """
+        self.on_trigger = on_trigger
+        self.sources = self.default_sources() if sources is None else list(sources)
+        self.interval = interval
+        self.min_gap = min_gap
+        self.logger = logger or logging.getLogger(__name__)
+        self.monotonic = monotonic
+        self._last = float('-inf')
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @staticmethod
+    def default_sources():
+        """
+        当前平台可用的事件源
+        """
+        sources = [ClockJumpSource(), NetworkSource()]
+        suspended = _suspended_time_func()
+        if suspended is not None:
+            sources.append(ResumeSource(suspended))
+        return sources
+    
+    def reset(self):
+        """
+        重新读取各事件源的基准（程序自己调整时钟后调用）
+        """
+        with self._lock:
+            for source in self.sources:
+                source.reset()
+    
+    def check(self):
+        """
+        检查一次所有事件源，需要时触发同步
+        返回：触发原因列表（未触发时为空）
+        """
+        with self._lock:
+            reasons = []
+            for source in self.sources:
+                try:
+                    reason = source.poll()
+                except Exception as e:
+                    self.logger.debug(f"检查事件源失败: {e}")
+                    continue
+                if reason:
+                    reasons.append(reason)
+            now = self.monotonic()
+            if not reasons or now - self._last < self.min_gap:
+                return []
+            self._last = now
+        self.on_trigger("，".join(reasons))
+        return reasons
+    
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        if self.running:
+            return
+        # 与AutoSyncScheduler相同，每次启动使用新的停止标志
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+    
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"同步触发异常: {e}")
+
+
+# ==================== 服务器健康记录 ====================
+
+class ServerHealthStore:
+    """
+    NTP服务器健康记录（保存在配置文件旁的ntp_health.json）
+    每个服务器记录往返延迟、抖动、连续失败次数和最近成功时间，
+    据此给服务器打分排序，连续失败的服务器按指数退避暂时跳过
+    """
+    
+    # 延迟和抖动的指数平滑系数
+    SMOOTHING = 0.25
+    # 没有记录的服务器的默认得分（秒），排在已知良好的服务器之后
+    UNKNOWN_SCORE = 0.5
+    
+    def __init__(self, path, ttl=NTP_HEALTH_TTL, logger=None):
+        """
+        path: 记录文件路径
+        ttl: 记录过期时间（秒），超过该时间未更新的记录会被丢弃
+        logger: 日志对象
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self.entries = {}
+        self.load()
+    
+    def load(self):
+        """
+        从文件加载记录，并丢弃过期的记录
+        """
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"加载服务器健康记录失败: {e}")
+            self.entries = {}
+        self.expire()
+    
+    def save(self):
+        """
+        保存记录到文件（先写临时文件再替换，避免写到一半损坏）
+        """
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.warning(f"保存服务器健康记录失败: {e}")
+    
+    def expire(self, now=None):
+        """
+        丢弃超过ttl未更新的记录
+        """
+        now = now or time.time()
+        self.entries = {
+            server: entry for server, entry in self.entries.items()
+            if now - entry.get("updated", 0) < self.ttl
+        }
+    
+    def record_success(self, server, rtt, jitter, now=None):
+        """
+        记录一次成功的查询
+        rtt: 往返延迟（秒）
+        jitter: 抖动（秒）
+        """
+        now = now or time.time()
+        entry = self.entries.get(server)
+        if entry and entry.get("rtt") is not None:
+            entry["rtt"] += self.SMOOTHING * (rtt - entry["rtt"])
+            entry["jitter"] += self.SMOOTHING * (jitter - entry["jitter"])
+        else:
+            entry = self.entries[server] = {"rtt": rtt, "jitter": jitter}
+        entry["failures"] = 0
+        entry["backoff_until"] = 0
+        entry["last_success"] = now
+        entry["updated"] = now
+    
+    def record_failure(self, server, now=None):
+        """
+        记录一次失败（超时、拒绝服务、被判为错误时钟等），并按连续失败次数指数退避
+        """
+        now = now or time.time()
+        entry = self.entries.setdefault(server, {"rtt": None, "jitter": None})
+        entry["failures"] = entry.get("failures", 0) + 1
+        backoff = min(NTP_BACKOFF_BASE * 2 ** (entry["failures"] - 1), NTP_BACKOFF_MAX)
+        entry["backoff_until"] = now + backoff
+        entry["updated"] = now
+    
+    def record_round(self, samples, failures, falsetickers=()):
+        """
+        记录一轮查询的结果
+        samples: NTPSample列表
+        failures: 失败原因字典{server: reason}
+        falsetickers: 被时钟选择剔除的服务器
+        """
+        delays = {}
+        for sample in samples:
+            delays.setdefault(sample.server, []).append(sample.delay)
+        
+        for server, values in delays.items():
+            if server in falsetickers:
+                continue
+            rtt = min(values)
+            jitter = (sum((d - rtt) ** 2 for d in values) / len(values)) ** 0.5
+            self.record_success(server, rtt, jitter)
+        
+        for server in list(failures) + list(falsetickers):
+            self.record_failure(server)
+    
+    def score(self, server):
+        """
+        服务器得分（秒，越小越好）：延迟 + 4倍抖动，每次连续失败额外加罚
+        """
+        entry = self.entries.get(server)
+        if not entry or entry.get("rtt") is None:
+            score = self.UNKNOWN_SCORE
+        else:
+            score = entry["rtt"] + 4 * entry["jitter"]
+        if entry:
+            score += entry.get("failures", 0) * self.UNKNOWN_SCORE
+        return score
+    
+    def in_backoff(self, server, now=None):
+        """
+        服务器是否处于退避期
+        """
+        entry = self.entries.get(server)
+        return bool(entry) and entry.get("backoff_until", 0) > (now or time.time())
+    
+    def order(self, servers, keep=1):
+        """
+        按得分排序服务器，并去掉处于退避期的服务器
+        servers: 服务器列表
+        keep: 至少保留的服务器数，可用的不够时按得分补回退避中的服务器
+        返回：排序后的服务器列表
+        """
+        now = time.time()
+        ranked = sorted(servers, key=self.score)
+        available = [server for server in ranked if not self.in_backoff(server, now)]
+        if len(available) < keep:
+            backoff = [server for server in ranked if server not in available]
+            available += backoff[:keep - len(available)]
+        return available
+
+
+# ==================== 同步历史 ====================
+
+class SyncHistory:
+    """
+    同步历史记录（SQLite，保存在配置文件旁的sync_history.db）
+    rounds：每轮同步一行（合并后的偏差、延迟、抖动、层级、主服务器、跳变/平滑调整、当时的频率校正），按时间建索引
+    samples：每轮每个服务器的最佳采样（往返延迟最小的一次），按(时间, 服务器)聚簇存储
+    server_daily：每个服务器每天的采样数、异常次数，以及偏差和往返延迟的对数分桶直方图；
+    分位数查询只合并每天一行的直方图，一年每小时同步一次也只需读几千行，毫秒级返回
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rounds (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,           -- Unix时间（秒）
+            action TEXT NOT NULL,       -- step / slew / failed / error
+            offset REAL,                -- 合并后的偏差（秒），失败时为NULL
+            delay REAL,
+            jitter REAL,
+            stratum INTEGER,
+            peer TEXT,
+            survivors INTEGER,
+            falsetickers INTEGER,
+            freq REAL                   -- 到本轮为止生效的频率校正（ppm），见ClockBackend.set_frequency
+        );
+        CREATE INDEX IF NOT EXISTS rounds_ts ON rounds(ts);
+        CREATE TABLE IF NOT EXISTS samples (
+            ts REAL NOT NULL,
+            server TEXT NOT NULL,
+            round_id INTEGER NOT NULL,
+            offset REAL NOT NULL,
+            delay REAL NOT NULL,
+            stratum INTEGER,
+            falseticker INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (ts, server)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS server_daily (
+            day INTEGER NOT NULL,       -- Unix天数（UTC）
+            server TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            falsetickers INTEGER NOT NULL,
+            offset_hist BLOB NOT NULL,  -- |偏差|的分桶计数，见histogram_bin
+            delay_hist BLOB NOT NULL,   -- 往返延迟的分桶计数
+            PRIMARY KEY (day, server)
+        ) WITHOUT ROWID;
+    """
+    
+    # 直方图每个分桶占4字节（小端无符号整数）
+    BIN_BYTES = 4
+    
+    def __init__(self, path, retention_days=HISTORY_RETENTION_DAYS, logger=None):
+        """
+        path: 数据库文件路径
+        retention_days: 保留天数，更早的记录在首次打开时删除
+        logger: 日志对象
+        """
+        self.path = Path(path)
+        self.retention_days = retention_days
+        self.logger = logger or logging.getLogger(__name__)
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        """
+        首次使用时打开数据库（sqlite3只在需要时导入），建表并清理过期记录
+        """
+        if self._conn is None:
+            import sqlite3
+            
+            conn = sqlite3.connect(str(self.path), timeout=5, check_same_thread=False)
+            # WAL模式：写入不阻塞读取，每轮只追加几行
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            # 旧版本建的表没有freq列
+            if "freq" not in {row[1] for row in conn.execute("PRAGMA table_info(rounds)")}:
+                conn.execute("ALTER TABLE rounds ADD COLUMN freq REAL")
+            cutoff = time.time() - self.retention_days * 86400
+            conn.execute("DELETE FROM samples WHERE ts < ?", (cutoff,))
+            conn.execute("DELETE FROM rounds WHERE ts < ?", (cutoff,))
+            conn.execute("DELETE FROM server_daily WHERE day < ?", (int(cutoff // 86400),))
+            conn.commit()
+            self._conn = conn
+        return self._conn
+    
+    @staticmethod
+    def histogram_bin(value):
+        """
+        对数分桶：第0桶为小于HISTORY_BIN_BASE的值，第i桶为[BASE*RATIO^(i-1), BASE*RATIO^i)
+        """
+        import math
+        
+        if value < HISTORY_BIN_BASE:
+            return 0
+        index = int(math.log(value / HISTORY_BIN_BASE) / math.log(HISTORY_BIN_RATIO)) + 1
+        return min(index, HISTORY_BINS - 1)
+    
+    @staticmethod
+    def bin_value(index):
+        """
+        分桶的代表值：上下边界的几何平均
+        """
+        if index == 0:
+            return 0.0
+        return HISTORY_BIN_BASE * HISTORY_BIN_RATIO ** (index - 0.5)
+    
+    def _add_to_histogram(self, blob, value):
+        counts = bytearray(blob or bytes(HISTORY_BINS * self.BIN_BYTES))
+        position = self.histogram_bin(value) * self.BIN_BYTES
+        count = int.from_bytes(counts[position:position + self.BIN_BYTES], 'little') + 1
+        counts[position:position + self.BIN_BYTES] = count.to_bytes(self.BIN_BYTES, 'little')
+        return bytes(counts)
+    
+    def record(self, action, estimate=None, samples=(), when=None, freq=None):
+        """
+        记录一轮同步
+        action: "step"、"slew"、"failed"（未得到可用时间）或"error"（设置系统时间失败）
+        estimate: ClockEstimate，失败时为None
+        samples: 本轮的全部NTPSample
+        when: 时间戳（秒），默认当前时间
+        freq: 到本轮为止生效的频率校正（ppm），用于估计时钟本身的漂移
+        返回：本轮的记录ID
+        """
+        when = time.time() if when is None else when
+        day = int(when // 86400)
+        
+        # 每个服务器只保存往返延迟最小的采样
+        best = {}
+        for sample in samples:
+            if sample.server not in best or sample.delay < best[sample.server].delay:
+                best[sample.server] = sample
+        falsetickers = set(estimate.falsetickers) if estimate else set()
+        
+        with self._lock:
+            conn = self._connect()
+            if estimate:
+                cursor = conn.execute(
+                    "INSERT INTO rounds (ts, action, offset, delay, jitter, stratum, peer, survivors, falsetickers, freq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (when, action, estimate.offset, estimate.delay, estimate.jitter, estimate.stratum,
+                     estimate.peer, len(estimate.survivors), len(estimate.falsetickers), freq))
+            else:
+                cursor = conn.execute("INSERT INTO rounds (ts, action, freq) VALUES (?, ?, ?)", (when, action, freq))
+            round_id = cursor.lastrowid
+            
+            for server, sample in best.items():
+                falseticker = int(server in falsetickers)
+                conn.execute(
+                    "INSERT OR REPLACE INTO samples (ts, server, round_id, offset, delay, stratum, falseticker) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (when, server, round_id, sample.offset, sample.delay, sample.stratum, falseticker))
+                
+                row = conn.execute(
+                    "SELECT count, falsetickers, offset_hist, delay_hist FROM server_daily "
+                    "WHERE day = ? AND server = ?", (day, server)).fetchone()
+                count, bad, offset_hist, delay_hist = row or (0, 0, None, None)
+                conn.execute(
+                    "INSERT OR REPLACE INTO server_daily (day, server, count, falsetickers, offset_hist, delay_hist) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (day, server, count + 1, bad + falseticker,
+                     self._add_to_histogram(offset_hist, abs(sample.offset)),
+                     self._add_to_histogram(delay_hist, sample.delay)))
+            conn.commit()
+        return round_id
+    
+    def rounds(self, since, until=None):
+        """
+        查询时间范围内的同步记录
+        since / until: Unix时间（秒），until默认为现在
+        返回：[dict]，按时间排序
+        """
+        until = time.time() if until is None else until
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "SELECT ts, action, offset, delay, jitter, stratum, peer, survivors, falsetickers "
+                "FROM rounds WHERE ts >= ? AND ts <= ? ORDER BY ts", (since, until))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+    
+    def drift_intervals(self, since, until=None):
+        """
+        校正间隔：上一轮校正后到本轮之间，时钟在没有频率校正时会积累的偏差
+        = 本轮测得的偏差 + 期间的频率校正 x 间隔
+        间隔短于最短同步间隔、或上一轮的平滑调整尚未完成时，偏差中还有未校正的部分，不计入
+        返回：[(时间戳, 间隔秒, 积累的偏差秒, 测量误差秒)]，测量误差由两轮的抖动合成
+        """
+        until = time.time() if until is None else until
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT ts, action, offset, jitter, freq FROM rounds "
+                "WHERE ts >= ? AND ts <= ? AND offset IS NOT NULL ORDER BY ts", (since, until)).fetchall()
+        
+        intervals = []
+        for (prev_ts, prev_action, prev_offset, prev_jitter, _), (ts, _, offset, jitter, freq) in zip(rows, rows[1:]):
+            settle = abs(prev_offset) / CLOCK_MAX_SLEW_RATE if prev_action == "slew" else 0.0
+            interval = ts - prev_ts
+            if prev_action in ("step", "slew") and interval >= max(AUTO_SYNC_MIN_INTERVAL, settle):
+                error = ((prev_jitter or 0) ** 2 + (jitter or 0) ** 2 + DRIFT_NOISE_FLOOR ** 2) ** 0.5
+                intervals.append((ts, interval, offset + (freq or 0.0) * 1e-6 * interval, error))
+        return intervals
+    
+    def drift(self, since, until=None):
+        """
+        时钟漂移：每个校正间隔积累的偏差除以间隔，即本地时钟（不含频率校正）的频率误差
+        返回：[(时间戳, 漂移ppm)]
+        """
+        return [(ts, accumulated / interval * 1e6)
+                for ts, interval, accumulated, _ in self.drift_intervals(since, until)]
+    
+    def server_stats(self, since, until=None, quantiles=(0.5, 0.99)):
+        """
+        按服务器统计偏差（绝对值）和往返延迟的分位数
+        按天汇总，since/until所在的整天都计入；分位数取直方图分桶的代表值（相对误差±10%）
+        返回：{server: {"count", "falsetickers", "offset": {"p50": 秒, ...}, "delay": {"p50": 秒, ...}}}
+        """
+        until = time.time() if until is None else until
+        totals = {}
+        with self._lock:
+            conn = self._connect()
+            for server, count, bad, offset_hist, delay_hist in conn.execute(
+                    "SELECT server, count, falsetickers, offset_hist, delay_hist FROM server_daily "
+                    "WHERE day >= ? AND day <= ?", (int(since // 86400), int(until // 86400))):
+                # 把整个直方图当作一个大整数相加，各分桶互不进位（每桶4字节）
+                entry = totals.setdefault(server, [0, 0, 0, 0])
+                entry[0] += count
+                entry[1] += bad
+                entry[2] += int.from_bytes(offset_hist, 'little')
+                entry[3] += int.from_bytes(delay_hist, 'little')
+        
+        def pick(packed, count):
+            data = packed.to_bytes(HISTORY_BINS * self.BIN_BYTES, 'little')
+            result = {}
+            cumulative = 0
+            targets = [(q, min(int(q * count), count - 1)) for q in quantiles]
+            for index in range(HISTORY_BINS):
+                position = index * self.BIN_BYTES
+                cumulative += int.from_bytes(data[position:position + self.BIN_BYTES], 'little')
+                while targets and cumulative > targets[0][1]:
+                    result[f"p{targets.pop(0)[0] * 100:g}"] = self.bin_value(index)
+            return result
+        
+        return {server: {"count": count, "falsetickers": bad,
+                         "offset": pick(offset_packed, count), "delay": pick(delay_packed, count)}
+                for server, (count, bad, offset_packed, delay_packed) in totals.items()}
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ==================== 更新下载 ====================
+
+def create_http_session(pool_size=UPDATE_WORKERS * 2):
+    """
+    创建带连接池的requests会话（复用TCP/TLS连接）
+    pool_size: 每个主机的最大连接数
+    """
+    requests = _import_requests()
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    session.verify = False
+    session.trust_env = False   # 不使用系统代理
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def sibling_url(update_url, path):
+    """
+    由EXE下载地址得到同目录下其他文件（如差分补丁）的地址
+    """
+    return update_url.rsplit('/', 1)[0] + '/' + path
+
+
+def manifest_url(update_url):
+    """
+    由EXE下载地址得到同目录下的版本清单地址
+    """
+    return sibling_url(update_url, UPDATE_MANIFEST_NAME)
+
+
+def file_sha256(path, block_size=UPDATE_BUFFER_SIZE):
+    """
+    计算文件的SHA-256
+    返回：十六进制摘要
+    """
+    import hashlib
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# 差分补丁格式（由tools/make_delta.py生成）：
+#   文件头: 魔数(8) | 旧文件sha256(32) | 新文件sha256(32) | 新文件大小(8)
+#   操作:   b'C' | 旧文件偏移(8) | 长度(4)                  从旧文件复制
+#           b'I' | 原始长度(4) | 压缩长度(4) | zlib数据     插入新数据
+#           b'E'                                            结束
+DELTA_MAGIC = b'ZGDELTA1'
+DELTA_HEADER = struct.Struct('!8s32s32sQ')
+DELTA_COPY = struct.Struct('!QI')
+DELTA_INSERT = struct.Struct('!II')
+
+
+def apply_delta(patch_path, old_path, dest, old_sha256=None):
+    """
+    用旧文件和差分补丁重建新文件，流式处理，内存占用只与单个操作的大小有关
+    写入的同时计算SHA-256，与补丁中记录的新文件摘要不一致时删除输出并抛出异常
+    patch_path: 补丁文件
+    old_path: 旧文件（当前运行的EXE）
+    dest: 输出文件
+    old_sha256: 旧文件的摘要，与补丁不匹配时直接拒绝
+    返回：新文件的SHA-256（十六进制）
+    """
+    import zlib
+    import hashlib
+    
+    digest = hashlib.sha256()
+    try:
+        with open(patch_path, 'rb') as patch, open(old_path, 'rb') as old, \
+                open(dest, 'wb', buffering=UPDATE_BUFFER_SIZE) as out:
+            magic, base, target, size = DELTA_HEADER.unpack(patch.read(DELTA_HEADER.size))
+            if magic != DELTA_MAGIC:
+                raise Exception("不是有效的差分补丁")
+            if old_sha256 and base.hex() != old_sha256:
+                raise Exception("补丁与当前程序版本不匹配")
+            
+            written = 0
+            while True:
+                op = patch.read(1)
+                if op == b'C':
+                    offset, length = DELTA_COPY.unpack(patch.read(DELTA_COPY.size))
+                    old.seek(offset)
+                    while length:
+                        data = old.read(min(length, UPDATE_BUFFER_SIZE))
+                        if not data:
+                            raise Exception("旧文件长度不足")
+                        out.write(data)
+                        digest.update(data)
+                        written += len(data)
+                        length -= len(data)
+                elif op == b'I':
+                    raw_length, packed_length = DELTA_INSERT.unpack(patch.read(DELTA_INSERT.size))
+                    data = zlib.decompress(patch.read(packed_length))
+                    if len(data) != raw_length:
+                        raise Exception("补丁数据损坏")
+                    out.write(data)
+                    digest.update(data)
+                    written += len(data)
+                elif op == b'E':
+                    break
+                else:
+                    raise Exception("补丁数据损坏")
+        
+        if written != size or digest.digest() != target:
+            raise Exception("重建的文件校验失败")
+    except Exception:
+        Path(dest).unlink(missing_ok=True)
+        raise
+    return digest.hexdigest()
+
+
+def replace_executable(new_path, target):
+    """
+    用新文件替换正在运行的程序
+    Windows不能覆盖或删除正在运行的EXE，但可以重命名：先把旧程序改名为"<target>.old"，
+    再用os.replace把新文件原子地移到原位置，任何时刻原路径上都是完整的程序；
+    旧程序无法改名时（如被其他程序锁定）用MoveFileEx登记为重启后替换
+    返回："replaced"（已替换）或 "reboot"（重启电脑后生效）
+    """
+    target = Path(target)
+    backup = target.with_name(target.name + '.old')
+    
+    try:
+        # 上次更新残留的备份
+        backup.unlink(missing_ok=True)
+    except OSError:
+        pass
+    
+    try:
+        os.replace(target, backup)
+    except OSError:
+        if sys.platform != 'win32':
+            raise
+        import ctypes
+        MOVEFILE_REPLACE_EXISTING = 0x1
+        MOVEFILE_DELAY_UNTIL_REBOOT = 0x4
+        if not ctypes.windll.kernel32.MoveFileExW(
+                str(new_path), str(target), MOVEFILE_REPLACE_EXISTING | MOVEFILE_DELAY_UNTIL_REBOOT):
+            raise ctypes.WinError()
+        return "reboot"
+    
+    try:
+        os.replace(new_path, target)
+    except OSError:
+        # 放回旧程序
+        os.replace(backup, target)
+        raise
+    return "replaced"
+
+
+def relaunch_arguments(argv):
+    """
+    重新启动时沿用的命令行参数：去掉上次更新传入的--post-update参数
+    argv: 原来的参数（不含程序名）
+    """
+    args = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == '--post-update':
+            skip = True
+        elif not arg.startswith('--post-update='):
+            args.append(arg)
+    return args
+
+
+def wait_for_process(pid, timeout):
+    """
+    等待进程退出：Windows等待进程句柄，其他系统轮询
+    返回：True=已退出，False=超时
+    """
+    if sys.platform == 'win32':
+        import ctypes
+        SYNCHRONIZE = 0x00100000
+        WAIT_OBJECT_0 = 0
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(SYNCHRONIZE, False, pid)
+        if not handle:
+            # 进程已经不存在
+            return True
+        try:
+            return kernel32.WaitForSingleObject(handle, int(timeout * 1000)) == WAIT_OBJECT_0
+        finally:
+            kernel32.CloseHandle(handle)
+    
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def _parse_content_range(value):
+    """
+    解析Content-Range响应头，如"bytes 0-0/1234"
+    返回：(start, end, total) 或 None
+    """
+    try:
+        unit, _, spec = value.partition(' ')
+        span, _, total = spec.partition('/')
+        start, _, end = span.partition('-')
+        if unit != 'bytes' or total == '*':
+            return None
+        return int(start), int(end), int(total)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _iter_body(response, size):
+    """
+    逐块读取响应体，收到数据就返回而不等凑满size，便于及时测速
+    urllib3 2.x支持read1；旧版本退回iter_content
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=size)
+        return
+    while True:
+        data = read1(size)
+        if not data:
+            break
+        yield data
+
+
+class DownloadCancelled(Exception):
+    """
+    下载被用户取消（已下载的分块保留，下次断点续传）
+    """
+
+
+class OrderedHasher:
+    """
+    按文件顺序计算SHA-256，数据可以乱序到达（并行分块下载），不需要下载完成后再读一遍文件
+    - 正好接在已计算位置之后的数据直接计算，并依次计算后面暂存的数据
+    - 乱序到达的数据暂存在内存中，总量不超过limit字节
+    - 超出暂存上限的数据和断点续传前已下载的数据，在finish时从文件中补读
+    """
+    
+    def __init__(self, limit=UPDATE_HASH_BUFFER):
+        import hashlib
+        
+        self.digest = hashlib.sha256()
+        self.position = 0       # 已计算到的文件位置
+        self.pending = {}       # 偏移 -> 暂存的数据
+        self.buffered = 0
+        self.limit = limit
+        self._lock = threading.Lock()
+    
+    def feed(self, offset, data):
+        """
+        提供文件offset处的一段数据
+        """
+        with self._lock:
+            if offset == self.position:
+                self.digest.update(data)
+                self.position += len(data)
+                while self.position in self.pending:
+                    block = self.pending.pop(self.position)
+                    self.buffered -= len(block)
+                    self.digest.update(block)
+                    self.position += len(block)
+            elif offset > self.position and self.buffered + len(data) <= self.limit:
+                self.pending[offset] = data
+                self.buffered += len(data)
+    
+    def finish(self, path, total):
+        """
+        从文件中补读尚未计算的部分
+        返回：十六进制摘要
+        """
+        with self._lock:
+            self.pending.clear()
+            self.buffered = 0
+            if self.position < total:
+                with open(path, 'rb') as f:
+                    f.seek(self.position)
+                    for block in iter(lambda: f.read(UPDATE_BUFFER_SIZE), b''):
+                        self.digest.update(block)
+                        self.position += len(block)
+            return self.digest.hexdigest()
+
+
+class UpdateDownloader:
+    """
+    更新文件下载器
+    - 使用带连接池的Session，多个分块复用连接
+    - 下载前并发探测所有镜像（竞速），按首字节时间和历史吞吐量排序，明显较慢的镜像只作为备用
+    - 镜像支持Range时按分块并行下载，分块轮流分配给较快的镜像；
+      分块下载失败或速度过慢时，从断点换下一个镜像继续
+    - 下载中的数据写入"<目标>.part"，每个分块的进度记录在"<目标>.part.json"，中断后从断点继续
+    - 使用大块读取和大写缓冲，减少系统调用
+    - 边下载边计算SHA-256，可在下载完成时直接校验
+    """
+    
+    def __init__(self, urls, dest, session=None, workers=UPDATE_WORKERS,
+                 chunk_size=UPDATE_CHUNK_SIZE, timeout=UPDATE_TIMEOUT,
+                 history=None, progress=None, cancel=None, logger=None):
+        """
+        urls: 镜像地址列表（内容必须相同）
+        dest: 目标文件路径
+        session: requests会话，默认新建带连接池的会话
+        workers: 并行下载线程数
+        chunk_size: 分块大小（字节）
+        timeout: (连接超时, 读取超时)（秒）
+        history: 镜像历史记录{url: {"ttfb": 秒, "throughput": 字节/秒}}，用于排序
+        progress: 进度回调函数(已下载字节数, 总字节数)
+        cancel: threading.Event，置位后各下载线程在下一次读取后停止，抛出DownloadCancelled
+        logger: 日志对象
+        """
+        self.urls = list(urls)
+        self.dest = Path(dest)
+        self.part_path = self.dest.with_name(self.dest.name + '.part')
+        self.state_path = self.dest.with_name(self.dest.name + '.part.json')
+        self.session = session or create_http_session(workers * 2)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.history = history or {}
+        self.progress = progress
+        self.cancel = cancel
+        self.logger = logger or logging.getLogger(__name__)
+        
+        # 本次下载各镜像的统计{url: {"ttfb", "bytes", "seconds", "failures"}}
+        self.mirror_stats = {}
+        self.hasher = OrderedHasher()
+        self.sha256 = None      # 下载完成后文件的SHA-256
+        
+        self._lock = threading.Lock()
+        self._downloaded = 0
+        self._total = 0
+    
+    def _report(self, nbytes):
+        with self._lock:
+            self._downloaded += nbytes
+            downloaded = self._downloaded
+        if self.progress:
+            self.progress(downloaded, self._total)
+        self._check_cancel()
+    
+    def _check_cancel(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise DownloadCancelled("下载已取消")
+    
+    def _record(self, url, nbytes=0, seconds=0.0, failed=False, ttfb=None):
+        """
+        记录镜像的下载统计
+        """
+        with self._lock:
+            stats = self.mirror_stats.setdefault(
+                url, {"ttfb": None, "bytes": 0, "seconds": 0.0, "failures": 0})
+            stats["bytes"] += nbytes
+            stats["seconds"] += seconds
+            stats["failures"] += int(failed)
+            if ttfb is not None:
+                stats["ttfb"] = ttfb
+    
+    def probe(self, url):
+        """
+        探测镜像：请求第一个字节，判断是否支持Range并获取文件大小
+        返回：(total, validator, ttfb)，不支持Range时total为None，ttfb为首字节时间（秒）
+        """
+        start = time.perf_counter()
+        response = self.session.get(url, headers={'Range': 'bytes=0-0'},
+                                    timeout=self.timeout, stream=True)
+        ttfb = time.perf_counter() - start
+        try:
+            if response.status_code == 206:
+                content_range = _parse_content_range(response.headers.get('Content-Range'))
+                if content_range:
+                    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                    return content_range[2], validator, ttfb
+            elif response.status_code != 200:
+                raise Exception(f"HTTP状态码: {response.status_code}")
+            return None, None, ttfb
+        finally:
+            response.close()
+    
+    def expected_time(self, url, ttfb):
+        """
+        估计从该镜像下载一个分块的耗时（秒），用于镜像排序
+        """
+        throughput = self.history.get(url, {}).get("throughput") or UPDATE_ASSUMED_THROUGHPUT
+        return ttfb + self.chunk_size / throughput
+    
+    def race(self):
+        """
+        并发探测所有镜像（竞速）
+        最快的镜像响应后，其余镜像只再等待一小段时间，不会被超时的镜像拖住
+        返回：[(url, total, validator, ttfb)]，按预计耗时从快到慢排序
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        
+        executor = ThreadPoolExecutor(max_workers=len(self.urls))
+        futures = {executor.submit(self.probe, url): url for url in self.urls}
+        pending = set(futures)
+        results = []
+        deadline = None
+        
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                url = futures[future]
+                try:
+                    total, validator, ttfb = future.result()
+                except Exception as e:
+                    self.logger.warning(f"镜像 {url} 不可用: {e}")
+                    self._record(url, failed=True)
+                    continue
+                self._record(url, ttfb=ttfb)
+                results.append((url, total, validator, ttfb))
+                if deadline is None:
+                    deadline = time.monotonic() + ttfb * UPDATE_RACE_GRACE_FACTOR + UPDATE_RACE_GRACE
+        
+        # 探测请求无法取消，不再等待，线程结束后自行退出
+        executor.shutdown(wait=False)
+        for future in pending:
+            self.logger.info(f"镜像 {futures[future]} 响应过慢，本次不使用")
+        
+        results.sort(key=lambda item: self.expected_time(item[0], item[3]))
+        for url, _, _, ttfb in results:
+            self.logger.info(f"镜像 {url}: 首字节 {ttfb * 1000:.0f}ms")
+        return results
+    
+    def _chunk_span(self, index, total):
+        """
+        分块的起止位置
+        返回：(start, length)
+        """
+        start = index * self.chunk_size
+        return start, min(self.chunk_size, total - start)
+    
+    def _load_state(self, total, validator):
+        """
+        读取断点续传记录，与当前文件不一致时丢弃
+        返回：{分块序号: 已写入字节数}
+        """
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if (state.get("total") == total and state.get("chunk_size") == self.chunk_size
+                    and state.get("validator") == validator and self.part_path.exists()):
+                return {int(index): done for index, done in state.get("progress", {}).items()}
+        except Exception:
+            pass
+        return {}
+    
+    def _save_state(self, total, validator, progress):
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump({"total": total, "chunk_size": self.chunk_size,
+                       "validator": validator, "progress": progress}, f)
+    
+    def _fetch_chunk(self, urls, index, total, progress, save):
+        """
+        下载一个分块并写入.part文件的对应位置
+        失败或速度低于UPDATE_STALL_RATE时保留已写入的部分，换下一个镜像从断点继续
+        urls: 镜像列表，第一个为该分块的首选镜像
+        progress: {分块序号: 已写入字节数}，与其他线程共享
+        save: 保存续传记录的函数
+        """
+        start, length = self._chunk_span(index, total)
+        error = None
+        
+        for url in urls:
+            offset = start + progress.get(index, 0)
+            end = start + length - 1
+            began = time.monotonic()
+            fetched = 0
+            try:
+                response = self.session.get(url, headers={'Range': f'bytes={offset}-{end}'},
+                                            timeout=self.timeout, stream=True)
+                with response:
+                    content_range = _parse_content_range(response.headers.get('Content-Range'))
+                    if response.status_code != 206 or not content_range or content_range[0] != offset:
+                        raise Exception(f"分块响应无效: HTTP {response.status_code}")
+        
+                    window_start = time.monotonic()
+                    window_bytes = 0
+                    with open(self.part_path, 'r+b', buffering=UPDATE_BUFFER_SIZE) as f:
+                        f.seek(offset)
+                        for data in _iter_body(response, UPDATE_READ_SIZE):
+                            f.write(data)
+                            self.hasher.feed(offset + fetched, data)
+                            fetched += len(data)
+                            with self._lock:
+                                progress[index] = progress.get(index, 0) + len(data)
+                            self._report(len(data))
+        
+                            # 镜像中途变慢时切换到下一个镜像
+                            window_bytes += len(data)
+                            elapsed = time.monotonic() - window_start
+                            if elapsed >= UPDATE_STALL_WINDOW:
+                                if window_bytes / elapsed < UPDATE_STALL_RATE:
+                                    raise Exception(f"速度过慢（{window_bytes / elapsed / 1024:.0f} KB/s）")
+                                window_start = time.monotonic()
+                                window_bytes = 0
+        
+                if progress.get(index, 0) != length:
+                    raise Exception(f"分块长度不符: {progress.get(index, 0)}/{length}")
+                self._record(url, fetched, time.monotonic() - began)
+                save()
+                return
+        
+            except DownloadCancelled:
+                save()
+                raise
+            except Exception as e:
+                error = e
+                self._record(url, fetched, time.monotonic() - began, failed=True)
+                METRIC_FALLBACKS.inc("mirror")
+                save()
+                self.logger.warning(f"分块 {index} 从 {url} 下载中断，切换镜像: {e}")
+        
+        raise Exception(f"分块 {index} 所有镜像均下载失败: {error}")
+
+    def _download_ranges(self, mirrors, fallbacks, total, validator):
+        """
+        并行下载所有未完成的分块
+        mirrors: 轮流分配分块的镜像（较快的镜像）
+        fallbacks: 只在分块失败时使用的备用镜像
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        progress = self._load_state(total, validator)
+        if not progress:
+            # 预分配文件
+            with open(self.part_path, 'wb') as f:
+                f.truncate(total)
+        
+        count = (total + self.chunk_size - 1) // self.chunk_size
+        pending = [i for i in range(count) if progress.get(i, 0) < self._chunk_span(i, total)[1]]
+        self._total = total
+        self._downloaded = sum(progress.values())
+        if self._downloaded:
+            self.logger.info(f"断点续传：已完成 {self._downloaded}/{total} bytes")
+        
+        def save():
+            with self._lock:
+                self._save_state(total, validator, progress)
+        
+        def chunk_urls(index):
+            # 首选镜像轮换，其余镜像依次作为失败时的备选
+            shift = index % len(mirrors)
+            return mirrors[shift:] + mirrors[:shift] + fallbacks
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._fetch_chunk, chunk_urls(i), i, total, progress, save)
+                       for i in pending]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _download_stream(self, url):
+        """
+        镜像不支持Range时整体下载（无法续传）
+        """
+        self._downloaded = 0
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"HTTP状态码: {response.status_code}")
+            self._total = int(response.headers.get('Content-Length') or 0)
+            with open(self.part_path, 'wb', buffering=UPDATE_BUFFER_SIZE) as f:
+                for data in response.iter_content(chunk_size=UPDATE_READ_SIZE):
+                    f.write(data)
+                    self.hasher.feed(self._downloaded, data)
+                    self._report(len(data))
+        return self._downloaded
+    
+    def download(self, expected_sha256=None):
+        """
+        下载文件到目标路径，下载完成后的摘要保存在self.sha256
+        expected_sha256: 预期的SHA-256，不一致时删除下载的数据并抛出异常
+        返回：文件大小（字节）
+        """
+        began = time.monotonic()
+        results = self.race()
+        self._check_cancel()
+        
+        # 以最快的支持Range的镜像为准，只使用文件大小一致的镜像并行下载
+        ranged = [item for item in results if item[1] is not None]
+        if ranged:
+            _, total, validator, _ = ranged[0]
+            ranged = [item for item in ranged if item[1] == total]
+            best = self.expected_time(ranged[0][0], ranged[0][3])
+            mirrors = [url for url, _, _, ttfb in ranged
+                       if self.expected_time(url, ttfb) <= best * UPDATE_MIRROR_SLACK]
+            fallbacks = [url for url, _, _, _ in ranged if url not in mirrors]
+        
+            self.logger.info(f"并行下载 {total} bytes，{len(mirrors)} 个镜像"
+                             f"（备用 {len(fallbacks)} 个），{self.workers} 个连接")
+            self._download_ranges(mirrors, fallbacks, total, validator)
+            size = total
+        elif results:
+            url = results[0][0]
+            self.logger.info(f"镜像不支持分块下载，整体下载: {url}")
+            METRIC_FALLBACKS.inc("stream")
+            stream_began = time.monotonic()
+            size = self._download_stream(url)
+            self._record(url, size, time.monotonic() - stream_began)
+        else:
+            raise Exception("所有镜像都不可用")
+        
+        self.sha256 = self.hasher.finish(self.part_path, size)
+        if expected_sha256 and self.sha256 != expected_sha256:
+            self.part_path.unlink(missing_ok=True)
+            self.state_path.unlink(missing_ok=True)
+            raise Exception(f"文件校验失败: SHA-256 {self.sha256}，应为 {expected_sha256}")
+        
+        os.replace(self.part_path, self.dest)
+        self.state_path.unlink(missing_ok=True)
+        
+        # 本次实际下载的字节数（不含断点续传前已完成的部分）
+        fetched = sum(stats["bytes"] for stats in self.mirror_stats.values())
+        elapsed = time.monotonic() - began
+        if fetched and elapsed > 0:
+            METRIC_UPDATE_THROUGHPUT.observe(fetched / elapsed)
+        return size
+
+
+# ==================== 异步日志 ====================
+
+class QueueLogHandler(logging.Handler):
+    """
+    非阻塞的日志handler：调用线程只把日志记录放入有界队列，格式化和文件I/O都由写入线程完成，
+    NTP查询等对时间敏感的代码不会因为写日志而阻塞
+    队列满时的溢出策略：丢弃新的INFO及以下日志；WARNING及以上挤掉队列中最旧的一条，保证错误不丢
+    （与logging.handlers.QueueHandler作用相同，不导入logging.handlers以免拖慢启动）
+    """
+    
+    def __init__(self, log_queue):
+        super().__init__()
+        self.queue = log_queue
+        self.dropped = 0        # 因队列满丢弃的日志条数
+        self.writer = None      # 从队列取出日志的AsyncLogWriter
+    
+    def emit(self, record):
+        import queue
+        
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        
+        self.dropped += 1
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+
+
+class BatchFlushMixin:
+    """
+    emit时不立即flush，由写入线程处理完一批日志后调用flush_batch统一flush
+    """
+    
+    def flush(self):
+        pass
+    
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class AsyncLogWriter:
+    """
+    后台日志写入线程（与logging.handlers.QueueListener作用相同）
+    从队列中批量取出日志交给各handler，一批处理完后统一flush，减少写文件的系统调用；
+    有日志因队列满被丢弃时，写入一条警告说明丢弃的数量
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, log_queue, handlers, source=None):
+        """
+        log_queue: 日志队列
+        handlers: 实际输出日志的handler列表
+        source: 向队列写入的QueueLogHandler，用于统计丢弃数量
+        """
+        self.queue = log_queue
+        self.handlers = list(handlers)
+        self.source = source
+        self._reported = 0
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout=5):
+        """
+        写完队列中剩余的日志后停止
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except Exception:
+            return
+        self._thread.join(timeout)
+    
+    def close(self, timeout=5):
+        """
+        写完剩余的日志后停止，并关闭各handler（重新设置日志时替换旧的写入线程）
+        """
+        self.stop(timeout)
+        for handler in self.handlers:
+            handler.close()
+    
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+    
+    def _report_dropped(self):
+        dropped = self.source.dropped if self.source else 0
+        if dropped > self._reported:
+            record = logging.LogRecord(
+                "log-writer", logging.WARNING, __file__, 0,
+                f"日志队列已满，丢弃了 {dropped - self._reported} 条日志", None, None)
+            self._reported = dropped
+            self._handle(record)
+    
+    def _run(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Exception:
+                    break
+            
+            for record in batch:
+                if record is self._STOP:
+                    running = False
+                    continue
+                self._handle(record)
+            self._report_dropped()
+            
+            for handler in self.handlers:
+                try:
+                    getattr(handler, 'flush_batch', handler.flush)()
+                except Exception:
+                    pass
+
+
+# ==================== 日志轮转 ====================
+
+class LogArchive:
+    """
+    轮转下来的日志文件（保存在日志目录的log_index.json）
+    按轮转顺序记录每个文件的日期和大小，清理时从最旧的一端删除，不扫描目录、不逐个stat；
+    换下来的文件在后台线程中压缩为.log.gz
+    """
+    
+    def __init__(self, log_dir, days=7, max_total=LOG_MAX_TOTAL_BYTES, logger=None, load=True):
+        """
+        log_dir: 日志目录
+        days: 保留天数
+        max_total: 轮转文件的总大小上限（字节）
+        logger: 日志对象
+        load: 是否立即加载索引；为False时第一次用到时才加载（程序启动时由日志写入线程加载）
+        """
+        import queue
+        from collections import deque
+        
+        self.log_dir = Path(log_dir)
+        self.path = self.log_dir / LOG_INDEX_FILE
+        self.days = days
+        self.max_total = max_total
+        self.logger = logger or logging.getLogger(__name__)
+        self.entries = deque()      # [{"name", "day", "size", "compressed"}]，最旧的在前
+        self.names = set()
+        self.total = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._failed = []           # 没能删除原文件的压缩任务，下次轮转时重试
+        self._thread = None
+        self.loaded = False
+        if load:
+            self.load()
+    
+    def __contains__(self, name):
+        self.ensure_loaded()
+        return name in self.names
+    
+    @staticmethod
+    def _segment(name):
+        """
+        日志文件名的轮转序号：time_sync_YYYYMMDD.log为0，time_sync_YYYYMMDD_N.log为N
+        """
+        part = name[19:-4]
+        return int(part) if part.isdigit() else 0
+    
+    def load(self):
+        """
+        加载索引；没有索引时（首次运行新版本）扫描一次目录，把已有的日志登记进来，
+        当天最后一个未压缩的文件是正在写入的日志，留给handler继续写入，不登记也不压缩
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = []
+            for path in self.log_dir.glob("time_sync_*.log*"):
+                compressed = path.suffix == '.gz'
+                name = path.name[:-3] if compressed else path.name
+                if path.suffix in ('.log', '.gz') and name not in (entry["name"] for entry in entries):
+                    entries.append({"name": name, "day": name[10:18], "size": path.stat().st_size,
+                                    "compressed": compressed})
+            # 按日期和轮转序号排序（_10在_9之后），最旧的在前
+            entries.sort(key=lambda entry: (entry["day"], self._segment(entry["name"])))
+            today = datetime.now().strftime('%Y%m%d')
+            current = [entry for entry in entries if entry["day"] == today and not entry["compressed"]]
+            if current:
+                entries.remove(current[-1])
+        except Exception as e:
+            self.logger.warning(f"加载日志索引失败: {e}")
+            entries = []
+        
+        self.entries.extend(entries)
+        self.names.update(entry["name"] for entry in entries)
+        self.total = sum(entry["size"] for entry in entries)
+        self.save()
+        for entry in entries:
+            if not entry["compressed"]:
+                self._enqueue(entry)
+        self.loaded = True
+    
+    def ensure_loaded(self):
+        """
+        还没加载索引时加载（首次运行时会扫描目录）
+        """
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                self.load()
+    
+    def save(self):
+        """
+        保存索引（先写临时文件再替换，避免写到一半损坏）
+        """
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self.entries), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.warning(f"保存日志索引失败: {e}")
+    
+    def add(self, path, day):
+        """
+        登记一个刚换下来的日志文件，排队压缩，并按保留策略删除最旧的文件
+        """
+        self.ensure_loaded()
+        path = Path(path)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        entry = {"name": path.name, "day": day, "size": size, "compressed": False}
+        with self._lock:
+            self.entries.append(entry)
+            self.names.add(entry["name"])
+            self.total += size
+            self._prune(self.days)
+            self.save()
+        self._enqueue(entry)
+    
+    def prune(self, days=None):
+        """
+        删除超过保留天数的日志文件，以及超出总大小上限的最旧的文件
+        days: 保留天数，默认为创建时指定的天数
+        返回：删除的文件数量
+        """
+        self.ensure_loaded()
+        with self._lock:
+            count = self._prune(self.days if days is None else days)
+            if count:
+                self.save()
+        return count
+    
+    def _prune(self, days):
+        from datetime import timedelta
+        
+        cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
+        count = 0
+        while self.entries and (self.entries[0]["day"] < cutoff or self.total > self.max_total):
+            entry = self.entries.popleft()
+            self.names.discard(entry["name"])
+            self.total -= entry["size"]
+            for name in (entry["name"], entry["name"] + '.gz'):
+                try:
+                    (self.log_dir / name).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    self.logger.warning(f"删除日志文件失败: {name}: {e}")
+            count += 1
+        return count
+    
+    def _enqueue(self, entry):
+        if entry["name"] in self._queued:
+            return
+        self._queued.add(entry["name"])
+        self._queue.put(entry)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="log-compress", daemon=True)
+            self._thread.start()
+    
+    def retry(self):
+        """
+        重新排队之前没能压缩的文件（例如当时正被日志查看器打开）
+        """
+        failed, self._failed = self._failed, []
+        for entry in failed:
+            if entry["name"] in self.names:
+                self._enqueue(entry)
+    
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                self._compress(entry)
+            except Exception as e:
+                self.logger.warning(f"压缩日志失败: {entry['name']}: {e}")
+            finally:
+                self._queued.discard(entry["name"])
+    
+    def _compress(self, entry):
+        """
+        把日志压缩为.log.gz，成功后删除原文件
+        """
+        import gzip
+        import shutil
+        
+        source = self.log_dir / entry["name"]
+        target = self.log_dir / (entry["name"] + '.gz')
+        tmp_path = target.with_suffix('.tmp')
+        if not source.exists():
+            return
+        with open(source, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp_path, target)
+        try:
+            source.unlink()
+        except OSError:
+            # Windows上文件仍被打开（日志查看器）时无法删除，保留原文件，下次轮转时重试
+            target.unlink()
+            self._failed.append(entry)
+            return
+        
+        size = target.stat().st_size
+        with self._lock:
+            if entry["name"] not in self.names:
+                # 压缩期间已被清理
+                target.unlink()
+                return
+            self.total += size - entry["size"]
+            entry["size"] = size
+            entry["compressed"] = True
+            self.save()
+
+
+class RotatingLogHandler(BatchFlushMixin, logging.FileHandler):
+    """
+    按天和大小轮转的日志文件handler（由AsyncLogWriter的写入线程调用）
+    当天的日志写入time_sync_YYYYMMDD.log，超过max_bytes后依次改写_1.log、_2.log……
+    只切换新文件，不重命名正在写的文件，日志查看器打开的文件不受影响；
+    换下来的文件交给LogArchive压缩和清理
+    """
+    
+    def __init__(self, archive, max_bytes=LOG_MAX_BYTES, encoding='utf-8'):
+        """
+        archive: LogArchive
+        max_bytes: 单个日志文件的大小上限（字节）
+        """
+        self.archive = archive
+        self.max_bytes = max_bytes
+        self.day = None
+        self.rollover_at = 0
+        if archive.loaded:
+            path = self._select(time.time())
+        else:
+            # 日志索引还没加载：写第一条日志时（在写入线程中）再加载索引、选择文件，不占用启动时间
+            path = os.path.abspath(archive.log_dir / f"time_sync_{datetime.now().strftime('%Y%m%d')}.log")
+        super().__init__(path, encoding=encoding, delay=True)
+    
+    def _select(self, now):
+        """
+        选择当天第一个还没轮转过的文件名，并计算下一次按天轮转的时间
+        """
+        from datetime import timedelta
+        
+        today = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.day = today.strftime('%Y%m%d')
+        self.rollover_at = (today + timedelta(days=1)).timestamp()
+        part = 0
+        while True:
+            name = f"time_sync_{self.day}_{part}.log" if part else f"time_sync_{self.day}.log"
+            if name not in self.archive:
+                return os.path.abspath(self.archive.log_dir / name)
+            part += 1
+    
+    def rotate(self, now):
+        """
+        关闭当前文件并切换到新文件
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.archive.add(self.baseFilename, self.day)
+        self.baseFilename = self._select(now)
+        self.archive.retry()
+    
+    def emit(self, record):
+        if self.day is None:
+            self.baseFilename = self._select(record.created)
+        elif record.created >= self.rollover_at:
+            self.rotate(record.created)
+        super().emit(record)
+    
+    def flush_batch(self):
+        super().flush_batch()
+        # 每批写完后检查一次大小，单个文件最多超出一批日志
+        if self.stream is not None and self.stream.tell() >= self.max_bytes:
+            self.rotate(time.time())
+
+
+# ==================== 界面事件 ====================
+
+class UIEventQueue:
+    """
+    工作线程到界面线程的事件通道
+    工作线程只调用post()把事件放入线程安全的队列，界面线程用root.after定时取出并分发，
+    StringVar等Tk对象只在界面线程中访问，也不需要root.update()
+    - 每帧处理事件的时间不超过UI_FRAME_BUDGET，其余留到下一帧，界面保持流畅
+    - coalesce中的事件（如下载进度）每帧只分发最新的一条
+    - 没有事件时降低检查频率，空闲时几乎不占CPU
+    """
+    
+    def __init__(self, root, coalesce=()):
+        """
+        root: 主窗口
+        coalesce: 只需要最新一条的事件类型
+        """
+        import queue
+        
+        self.root = root
+        self.coalesce = set(coalesce)
+        self.handlers = {}
+        self._queue = queue.SimpleQueue()
+        self._after = None
+    
+    def on(self, kind, handler):
+        """
+        注册事件处理函数（在界面线程中调用）
+        """
+        self.handlers[kind] = handler
+    
+    def post(self, kind, *args):
+        """
+        发送事件（可在任意线程中调用）
+        """
+        self._queue.put((kind, args))
+    
+    def callback(self, kind):
+        """
+        返回一个把参数作为kind事件发送的函数，作为工作线程的回调
+        """
+        return lambda *args: self.post(kind, *args)
+    
+    def start(self):
+        if self._after is None:
+            self._after = self.root.after(UI_IDLE_MS, self._drain)
+    
+    def stop(self):
+        if self._after is not None:
+            self.root.after_cancel(self._after)
+            self._after = None
+    
+    def _drain(self):
+        """
+        在界面线程中取出并分发事件
+        """
+        import queue
+        
+        deadline = time.perf_counter() + UI_FRAME_BUDGET
+        latest = {}
+        handled = 0
+        while time.perf_counter() < deadline:
+            try:
+                kind, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            handled += 1
+            if kind in self.coalesce:
+                latest[kind] = args
+                continue
+            # 先分发之前合并的事件，保持与其他事件的先后顺序
+            for item in latest.items():
+                self._dispatch(*item)
+            latest.clear()
+            self._dispatch(kind, args)
+        for item in latest.items():
+            self._dispatch(*item)
+        
+        busy = handled or not self._queue.empty()
+        self._after = self.root.after(UI_FRAME_MS if busy else UI_IDLE_MS, self._drain)
+    
+    def _dispatch(self, kind, args):
+        handler = self.handlers.get(kind)
+        if handler is None:
+            return
+        try:
+            handler(*args)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"处理界面事件 {kind} 失败: {e}")
+
+
+class TransferMeter:
+    """
+    下载进度回调：按最近UI_RATE_WINDOW秒的数据量计算速度，
+    最多每UI_PROGRESS_INTERVAL秒调用一次callback(已下载字节数, 总字节数, 字节/秒)
+    可被多个下载线程同时调用
+    """
+    
+    def __init__(self, callback, interval=UI_PROGRESS_INTERVAL, window=UI_RATE_WINDOW):
+        from collections import deque
+        
+        self.callback = callback
+        self.interval = interval
+        self.window = window
+        self._points = deque()      # [(时间, 已下载字节数)]
+        self._last = 0.0
+        self._lock = threading.Lock()
+    
+    def __call__(self, downloaded, total):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last < self.interval and downloaded != total:
+                return
+            self._last = now
+            points = self._points
+            points.append((now, downloaded))
+            while now - points[0][0] > self.window and len(points) > 2:
+                points.popleft()
+            began, base = points[0]
+            rate = (downloaded - base) / (now - began) if now > began else 0.0
+        self.callback(downloaded, total, rate)
+
+
+# ==================== 日志查看 ====================
+
+# 级别过滤：选中某个级别时显示该级别及以上的日志
+LOG_VIEW_LEVELS = {
+    "全部": None,
+    "INFO": (b" - INFO - ", b" - WARNING - ", b" - ERROR - ", b" - CRITICAL - "),
+    "WARNING": (b" - WARNING - ", b" - ERROR - ", b" - CRITICAL - "),
+    "ERROR": (b" - ERROR - ", b" - CRITICAL - "),
+}
+
+
+class LogIndex:
+    """
+    日志文件的行偏移索引（基于mmap）
+    扫描一遍换行符，记录每行的起始位置（每行8字节），读取某一行时直接从映射中切片，
+    不把整个文件读入内存；文件增长时只索引新增的部分，适合跟随正在写入的日志
+    """
+    
+    def __init__(self, path):
+        from array import array
+        
+        self.path = Path(path)
+        self.offsets = array('Q', [0])  # offsets[i]为第i行的起始位置，最后一项为已索引部分的末尾
+        self.size = 0                   # 已映射的文件大小
+        self.resets = 0                 # 重建索引的次数，行号在重建后失效
+        self._map = None
+    
+    def __len__(self):
+        """
+        已索引的完整行数（最后一行没有换行符时暂不计入）
+        """
+        return len(self.offsets) - 1
+    
+    def refresh(self):
+        """
+        重新映射文件并索引新增的完整行；文件变小（被截断或替换）时重建索引
+        返回：新增的行数
+        """
+        import mmap
+        from array import array
+        
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            size = 0
+        if size < self.size:
+            self.offsets = array('Q', [0])
+            self.size = 0
+            self.resets += 1
+        if size == self.size:
+            return 0
+        
+        with open(self.path, 'rb') as f:
+            # 旧的映射可能仍被后台过滤线程使用，不主动关闭，没有引用后自动释放
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = size
+        
+        before = len(self)
+        data = self._map
+        position = self.offsets[-1]
+        append = self.offsets.append
+        while True:
+            position = data.find(b'\n', position) + 1
+            if not position:
+                break
+            append(position)
+        return len(self) - before
+    
+    def line(self, index):
+        """
+        读取第index行（不含换行符）
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self._map[start:end].decode('utf-8', 'replace').rstrip('\r\n')
+    
+    def search(self, level=None, text=None, start=0, end=None, cancel=None):
+        """
+        查找匹配的行（在后台线程中调用）
+        level: LOG_VIEW_LEVELS中的键，None或"全部"表示不按级别过滤
+        text: 要包含的文本（不区分大小写）
+        start / end: 行号范围，end默认为当前已索引的行数
+        cancel: threading.Event，置位时放弃查找
+        返回：匹配的行号数组，被取消时返回None
+        """
+        import re
+        from array import array
+        from bisect import bisect_right
+        
+        markers = LOG_VIEW_LEVELS.get(level)
+        end = len(self) if end is None else end
+        matches = array('L')
+        if self._map is None or start >= end:
+            # 空文件从未映射
+            return matches
+        if not markers and not text:
+            matches.extend(range(start, end))
+            return matches
+        
+        # 用正则在整段映射上查找，命中后定位所在行并跳到下一行继续，避免逐行切片
+        if markers:
+            pattern = re.compile(b'|'.join(re.escape(marker) for marker in markers))
+            needle = text.lower().encode('utf-8') if text else None
+        else:
+            pattern = re.compile(re.escape(text.encode('utf-8')), re.IGNORECASE)
+            needle = None
+        data = self._map
+        offsets = self.offsets
+        position, stop = offsets[start], offsets[end]
+        while True:
+            if cancel is not None and not len(matches) % 4096 and cancel.is_set():
+                return None
+            found = pattern.search(data, position, stop)
+            if found is None:
+                break
+            index = bisect_right(offsets, found.start(), start, end) - 1
+            position = offsets[index + 1]
+            if needle and needle not in data[offsets[index]:position].lower():
+                continue
+            matches.append(index)
+        return matches
+
+
+class LogViewer:
+    """
+    日志查看器窗口
+    - 按行偏移索引读取日志，只渲染窗口中可见的行（虚拟滚动），几十MB的日志也不会卡住界面
+    - 跟随模式下每秒检查文件增长，只索引新增部分并滚动到末尾
+    - 按级别和文本过滤在后台线程中进行，结果通过root.after回到界面线程
+    """
+    
+    REFRESH_MS = 1000       # 检查文件增长的间隔（毫秒）
+    POLL_MS = 50            # 检查后台过滤结果的间隔（毫秒）
+    DEBOUNCE_MS = 300       # 输入过滤文本后延迟开始过滤的时间（毫秒）
+    
+    def __init__(self, root, log_dir):
+        """
+        root: 主窗口
+        log_dir: 日志目录
+        """
+        import re
+        import queue
+        from tkinter import Toplevel, Text, StringVar, BooleanVar
+        from tkinter import ttk, font
+        
+        self.log_dir = Path(log_dir)
+        # 最新的在前；同一天的分段按序号排序（_10在_9之后）
+        self.files = sorted(self.log_dir.glob("time_sync_*.log"), reverse=True,
+                            key=lambda path: [int(part) if part.isdigit() else part
+                                              for part in re.split(r'(\d+)', path.name)])
+        self.index = None
+        self.matches = None         # 过滤结果（行号数组），None表示不过滤
+        self.first = 0              # 第一个可见行在当前视图中的位置
+        self.follow = BooleanVar(value=True)
+        self.level = StringVar(value="全部")
+        self.text = StringVar()
+        self.status = StringVar()
+        self._results = queue.Queue()
+        self._generation = 0        # 过滤条件的版本号，丢弃过期的过滤结果
+        self._cancel = None
+        self._pending = 0           # 尚未返回的后台过滤数
+        self._next = 0              # 下一段应追加到过滤结果的起始行号
+        self._ready = {}            # 提前返回的后续分段：{起始行号: (结束行号, 行号数组)}
+        self._error = None          # 最近一次过滤失败的原因
+        self._debounce = None
+        self._closed = False
+        
+        self.window = Toplevel(root)
+        self.window.title("日志查看器")
+        self.window.geometry("800x500")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        # 工具栏：文件、级别、文本过滤、跟随
+        toolbar = ttk.Frame(self.window, padding=(10, 10, 10, 0))
+        toolbar.pack(fill='x')
+        self.file_box = ttk.Combobox(toolbar, state='readonly', width=24,
+                                     values=[path.name for path in self.files])
+        self.file_box.pack(side='left')
+        self.file_box.bind('<<ComboboxSelected>>', lambda event: self.open_file(self.files[self.file_box.current()]))
+        ttk.Label(toolbar, text="级别:").pack(side='left', padx=(10, 0))
+        level_box = ttk.Combobox(toolbar, state='readonly', width=9, textvariable=self.level,
+                                 values=list(LOG_VIEW_LEVELS))
+        level_box.pack(side='left')
+        level_box.bind('<<ComboboxSelected>>', lambda event: self.start_search())
+        ttk.Label(toolbar, text="包含:").pack(side='left', padx=(10, 0))
+        entry = ttk.Entry(toolbar, textvariable=self.text, width=20)
+        entry.pack(side='left')
+        entry.bind('<KeyRelease>', lambda event: self._schedule_search())
+        ttk.Checkbutton(toolbar, text="跟随最新", variable=self.follow,
+                        command=self.render).pack(side='left', padx=(10, 0))
+        ttk.Label(toolbar, textvariable=self.status).pack(side='right')
+        
+        # 文本区：只放可见的行，滚动条由程序按总行数设置
+        body = ttk.Frame(self.window, padding=10)
+        body.pack(expand=True, fill='both')
+        self.scrollbar = ttk.Scrollbar(body, orient='vertical', command=self.on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        self.view = Text(body, wrap='none', state='disabled')
+        self.view.pack(side='left', expand=True, fill='both')
+        self.view.tag_configure('WARNING', foreground='#b36b00')
+        self.view.tag_configure('ERROR', foreground='#c00000')
+        self.linespace = font.nametofont(self.view.cget('font')).metrics('linespace')
+        
+        self.view.bind('<Configure>', lambda event: self.render())
+        self.view.bind('<MouseWheel>', lambda event: self.scroll_lines(-3 if event.delta > 0 else 3))
+        self.view.bind('<Button-4>', lambda event: self.scroll_lines(-3))
+        self.view.bind('<Button-5>', lambda event: self.scroll_lines(3))
+        
+        if self.files:
+            self.file_box.current(0)
+            self.open_file(self.files[0])
+        else:
+            self.status.set("没有日志文件")
+        self.window.after(self.REFRESH_MS, self._tick)
+    
+    def open_file(self, path):
+        """
+        切换到另一个日志文件
+        """
+        self.index = LogIndex(path)
+        self.index.refresh()
+        self.first = 0
+        self.start_search()
+    
+    # ---------- 视图 ----------
+    
+    def row_count(self):
+        if self.index is None:
+            return 0
+        return len(self.matches) if self.matches is not None else len(self.index)
+    
+    def visible_rows(self):
+        return max(1, self.view.winfo_height() // self.linespace)
+    
+    def render(self):
+        """
+        只渲染可见的行，并按总行数设置滚动条
+        """
+        if self._closed or self.index is None:
+            return
+        total = self.row_count()
+        visible = self.visible_rows()
+        if self.follow.get():
+            self.first = total
+        self.first = max(0, min(self.first, total - visible))
+        last = min(total, self.first + visible)
+        
+        self.view.config(state='normal')
+        self.view.delete('1.0', 'end')
+        for row in range(self.first, last):
+            line = self.index.line(self.matches[row] if self.matches is not None else row)
+            tag = 'ERROR' if ' - ERROR - ' in line else 'WARNING' if ' - WARNING - ' in line else ''
+            self.view.insert('end', line + ('\n' if row < last - 1 else ''), tag)
+        self.view.config(state='disabled')
+        
+        if total:
+            self.scrollbar.set(self.first / total, last / total)
+        else:
+            self.scrollbar.set(0, 1)
+        shown = f"{total}/{len(self.index)} 行" if self.matches is not None else f"{total} 行"
+        if self._error:
+            shown += f"（过滤失败: {self._error}）"
+        self.status.set(("正在过滤... " if self._pending else "") + shown)
+    
+    def scroll_lines(self, count):
+        self.follow.set(False)
+        self.first += count
+        self.render()
+    
+    def on_scroll(self, action, value, unit=None):
+        """
+        滚动条回调：("moveto", 比例) 或 ("scroll", 数量, "units"/"pages")
+        """
+        self.follow.set(False)
+        if action == 'moveto':
+            self.first = int(float(value) * self.row_count())
+        elif unit == 'pages':
+            self.first += int(value) * self.visible_rows()
+        else:
+            self.first += int(value)
+        self.render()
+    
+    # ---------- 后台过滤 ----------
+    
+    def _schedule_search(self):
+        if self._debounce is not None:
+            self.window.after_cancel(self._debounce)
+        self._debounce = self.window.after(self.DEBOUNCE_MS, self.start_search)
+    
+    def start_search(self):
+        """
+        过滤条件变化时，取消正在进行的过滤并在后台线程中重新过滤
+        """
+        self._debounce = None
+        self._generation += 1
+        if self._cancel is not None:
+            self._cancel.set()
+        self._cancel = None
+        
+        if self.level.get() == "全部" and not self.text.get():
+            self.matches = None
+            self.render()
+            return
+        
+        from array import array
+        self.matches = array('L')
+        self._cancel = threading.Event()
+        self._next = 0
+        self._ready = {}
+        self._error = None
+        self._search(0, len(self.index))
+        self.render()
+    
+    def _search(self, start, end):
+        """
+        在后台线程中过滤[start, end)范围内的行，结果放入队列
+        """
+        generation = self._generation
+        index, cancel = self.index, self._cancel
+        level, text = self.level.get(), self.text.get()
+        
+        def worker():
+            # 无论成功、取消还是出错都要放入结果，否则_pending不会归零，一直显示"正在过滤"
+            result = None
+            try:
+                result = index.search(level, text, start, end, cancel)
+            except Exception as e:
+                result = e
+            finally:
+                self._results.put((generation, start, end, result))
+        
+        if self._pending == 0:
+            self.window.after(self.POLL_MS, self._poll)
+        self._pending += 1
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _poll(self):
+        """
+        在界面线程中取回后台过滤结果
+        """
+        import queue
+        
+        if self._closed:
+            return
+        changed = False
+        while True:
+            try:
+                generation, start, end, matches = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if generation == self._generation and isinstance(matches, Exception):
+                # 跳过出错的分段，后续分段照常拼接
+                self._error = str(matches) or type(matches).__name__
+                self._ready[start] = (end, ())
+            elif generation == self._generation and matches is not None:
+                self._ready[start] = (end, matches)
+            # 新增行的过滤可能先于之前的分段完成，按行号顺序拼接
+            while self._next in self._ready:
+                end, matches = self._ready.pop(self._next)
+                self.matches.extend(matches)
+                self._next = end
+            changed = True
+        if changed:
+            self.render()
+        if self._pending:
+            self.window.after(self.POLL_MS, self._poll)
+    
+    # ---------- 跟随 ----------
+    
+    def _tick(self):
+        """
+        定时检查日志文件增长：只索引新增的行，过滤时只过滤新增的行
+        """
+        if self._closed:
+            return
+        if self.index is not None:
+            before, resets = len(self.index), self.index.resets
+            if self.index.refresh():
+                if self.index.resets != resets:
+                    # 文件被截断或替换，行号全部失效
+                    self.start_search()
+                elif self.matches is not None:
+                    self._search(before, len(self.index))
+                self.render()
+        self.window.after(self.REFRESH_MS, self._tick)
+    
+    def close(self):
+        self._closed = True
+        if self._cancel is not None:
+            self._cancel.set()
+        self.window.destroy()
+
+
+class TimeSyncApp:
+    """时间同步程序主类"""
+    
+    def __init__(self, program_dir=None):
+        """
+        初始化程序
+        设置日志、加载配置
+        program_dir: 存放日志和配置文件的目录，默认为程序所在目录
+        """
+        # 程序所在目录（用于存放日志和配置文件）
+        # 打包后为EXE所在目录，源码运行时为time.py所在目录
+        if program_dir:
+            self.program_dir = Path(program_dir)
+        elif getattr(sys, 'frozen', False):
+            self.program_dir = Path(sys.executable).parent
+        else:
+            self.program_dir = SOURCE_DIR
+        self.log_dir = self.program_dir / "log"
+        self.log_archive = None
+        
+        # 加载配置
+        self.config_error = None
+        self.config = self.load_config()
+        
+        # 设置日志
+        self.setup_logging()
+        if self.config_error:
+            self.logger.error(f"加载配置失败: {self.config_error}")
+        
+        # 初始化变量
+        self.root = None
+        self.last_sync_time = None
+        self.scheduler = None
+        self.resync_watcher = None
+        self.resync_callback = None     # 没有自动同步时，触发同步调用的函数(reason)
+        self._sync_lock = threading.Lock()
+        self._http_session = None
+        self.metrics_server = None
+        
+        # 系统时钟调整接口
+        self.clock_backend = create_clock_backend()
+        self.short_lived = False    # 一次性的命令行进程（见RESIDENT_COMMANDS），同步后很快退出
+        self.last_clock_action = None
+        self.last_samples = []
+        self.last_estimate = None
+        
+        # NTP服务器域名解析缓存
+        self.dns_cache = DNSCache(
+            ttl=self.config.get("dns_cache_ttl", DNS_CACHE_TTL),
+            family=self.config.get("ip_version", "any"),
+            logger=self.logger,
+        )
+        
+        # NTP服务器健康记录，第一次查询时才加载
+        self._server_health = None
+        
+        # 同步历史
+        self.sync_history = SyncHistory(self.program_dir / HISTORY_FILE, logger=self.logger)
+        
+        # 时钟漂移估计（由同步历史得出本机时钟的频率误差），第一次用到时才创建
+        self._drift_estimator = None
+        self.drift_model = None
+        
+        # 时钟过滤与选择阶段，可替换为自定义实现
+        self.clock_selector = ClockSelector(
+            min_dispersion=self.config.get("ntp_min_dispersion", NTP_MIN_DISPERSION)
+        )
+        
+        self.logger.info(f"程序启动，版本: {VERSION}")
+    
+    def load_config(self):
+        """
+        加载配置文件
+        返回：配置字典
+        """
+        config_path = self.program_dir / "config.json"
+        
+        if config_path.exists():
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                # 此时日志尚未初始化，留到setup_logging之后再记录
+                self.config_error = e
+        
+        # 默认配置
+        return {
+            "auto_check_update": True,  # 启动时自动检查更新
+            "save_log": True,           # 保存日志
+            "log_days": 7              # 日志保留天数
+        }
+    
+    def save_config(self):
+        """
+        保存配置到文件
+        """
+        config_path = self.program_dir / "config.json"
+        try:
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump(self.config, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            self.logger.error(f"保存配置失败: {e}")
+    
+    def setup_logging(self):
+        """
+        设置日志系统
+        根据配置决定是否保存日志文件；日志先进入有界队列，由后台线程批量写入文件和控制台
+        可以重复调用（如同一进程中创建多个TimeSyncApp）：之前的队列handler被替换，其写入线程写完后停止
+        """
+        import queue
+        import atexit
+        
+        self.logger = logging.getLogger(__name__)
+        for old in [handler for handler in self.logger.handlers if isinstance(handler, QueueLogHandler)]:
+            self.logger.removeHandler(old)
+            if old.writer is not None:
+                atexit.unregister(old.writer.stop)
+                old.writer.close()
+        
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [BatchStreamHandler()]
+        if self.config.get("save_log", True):
+            # 输出到文件和控制台
+            self.log_dir.mkdir(exist_ok=True, parents=True)
+            # 日志索引由写入线程在写第一条日志时加载（首次运行时要扫描日志目录），不阻塞启动
+            self.log_archive = LogArchive(self.log_dir, days=self.config.get("log_days", 7),
+                                          logger=logging.getLogger(__name__), load=False)
+            handlers.insert(0, RotatingLogHandler(self.log_archive))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        queue_handler = QueueLogHandler(log_queue)
+        self.log_writer = AsyncLogWriter(log_queue, handlers, source=queue_handler)
+        queue_handler.writer = self.log_writer
+        self.log_writer.start()
+        # 退出时写完队列中剩余的日志
+        atexit.register(self.log_writer.stop)
+        
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(queue_handler)
+    
+    def is_admin(self):
+        """
+        检查是否具有管理员权限
+        返回：True=有管理员权限，False=没有
+        """
+        try:
+            if sys.platform != 'win32':
+                return os.geteuid() == 0
+            import ctypes
+            return ctypes.windll.shell32.IsUserAnAdmin()
+        except:
+            return False
+    
+    def check_startup(self):
+        """
+        检查是否已设置开机自启动
+        返回：True=已启用，False=未启用
+        """
+        try:
+            import winreg
+            key = winreg.OpenKey(
+                winreg.HKEY_CURRENT_USER, 
+                r"Software\Microsoft\Windows\CurrentVersion\Run", 
+                0, 
+                winreg.KEY_READ
+            )
+            try:
+                winreg.QueryValueEx(key, APP_NAME)
+                return True
+            except FileNotFoundError:
+                return False
+        except Exception as e:
+            self.logger.error(f"检查启动项失败: {e}")
+            return False
+    
+    def set_startup(self, enable):
+        """
+        设置开机自启动
+        enable: True=启用，False=禁用
+        返回：True=成功，False=失败
+        """
+        try:
+            import winreg
+            key = winreg.OpenKey(
+                winreg.HKEY_CURRENT_USER, 
+                r"Software\Microsoft\Windows\CurrentVersion\Run", 
+                0, 
+                winreg.KEY_WRITE
+            )
+            
+            if enable:
+                exe_path = sys.executable
+                winreg.SetValueEx(key, APP_NAME, 0, winreg.REG_SZ, f'"{exe_path}"')
+            else:
+                try:
+                    winreg.DeleteValue(key, APP_NAME)
+                except FileNotFoundError:
+                    pass
+            
+            self.logger.info(f"开机自启动设置{'成功' if enable else '取消成功'}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"设置启动项失败: {e}")
+            return False
+    
+    def get_ntp_time(self, on_sample=None, cancel=None):
+        """
+        从NTP服务器获取网络时间
+        所有服务器并发连续采样，经时钟过滤与选择后合并
+        on_sample: 收到每个采样时的回调函数(NTPSample)，用于显示进度
+        cancel: threading.Event，置位后放弃本次查询
+        返回：ClockEstimate 或 None
+        """
+        servers = self.config.get("ntp_servers", NTP_SERVERS)
+        timeout = self.config.get("ntp_timeout", NTP_TIMEOUT)
+        quorum = self.config.get("ntp_quorum", NTP_QUORUM)
+        burst = self.config.get("ntp_burst", NTP_BURST)
+        
+        # 解析所有域名（有缓存时不阻塞），每个IP地址作为独立的时间源
+        targets, dns_failures = self.dns_cache.resolve(servers)
+        for server, reason in dns_failures.items():
+            self.logger.warning(f"解析 {server} 失败: {reason}")
+            if reason == "域名解析超时":
+                METRIC_TIMEOUTS.inc("dns")
+        
+        # 已知最快的服务器排在前面，连续失败的服务器暂时跳过
+        names = self.server_health.order([target.name for target in targets], keep=quorum)
+        by_name = {target.name: target for target in targets}
+        targets = [by_name[name] for name in names]
+        
+        self.logger.info(f"正在并发查询 {len(targets)} 个NTP服务器地址...")
+        samples, failures = query_ntp_servers(targets, timeout=timeout, quorum=quorum, burst=burst,
+                                              on_sample=on_sample, cancel=cancel)
+        self.last_samples = samples
+        if cancel is not None and cancel.is_set():
+            # 不完整的一轮不计入服务器健康记录
+            self.logger.info("同步已取消")
+            return None
+        
+        for server, reason in failures.items():
+            self.logger.warning(f"从 {server} 获取时间失败: {reason}")
+        
+        estimate = self.clock_selector.select(samples) if samples else None
+        if METRICS.enabled:
+            self.record_round_metrics(samples, failures, estimate)
+        self.server_health.record_round(samples, failures, estimate.falsetickers if estimate else ())
+        self.server_health.save()
+        
+        if not samples:
+            self.logger.error("所有NTP服务器都无法连接")
+            return None
+        
+        if estimate is None:
+            self.logger.error(f"{len(samples)} 个采样无法选出一致的时间，放弃本次同步")
+            return None
+        
+        if estimate.falsetickers:
+            self.logger.warning(f"剔除时间异常的服务器: {', '.join(estimate.falsetickers)}")
+        self.logger.info(
+            f"获取时间成功，偏差 {estimate.offset * 1000:+.3f}ms，"
+            f"抖动 {estimate.jitter * 1000:.3f}ms，"
+            f"主服务器 {estimate.peer}（延迟 {estimate.delay * 1000:.3f}ms，层级 {estimate.stratum}），"
+            f"采用 {len(estimate.survivors)} 个服务器"
+        )
+        return estimate
+    
+    def record_round_metrics(self, samples, failures, estimate):
+        """
+        记录一轮查询的运行指标：每个采样的往返延迟和偏差、超时的服务器数、选择结果的抖动和偏差
+        """
+        for sample in samples:
+            METRIC_NTP_RTT.observe(sample.delay, sample.server)
+            METRIC_NTP_OFFSET.observe(abs(sample.offset), sample.server)
+        timeouts = sum(1 for reason in failures.values() if reason == "超时")
+        if timeouts:
+            METRIC_TIMEOUTS.inc("ntp", amount=timeouts)
+        if estimate is not None:
+            METRIC_CLOCK_JITTER.observe(estimate.jitter)
+            METRIC_CLOCK_OFFSET.set(estimate.offset)
+    
+    def set_system_time(self, sample):
+        """
+        设置系统时间
+        偏差小于跳变阈值时平滑调整(slew)，时间不会倒退；否则直接跳变(step)
+        sample: ClockEstimate或NTPSample
+        返回：True=成功，False=失败
+        """
+        offset = sample.offset
+        mode = self.config.get("clock_mode", "auto")
+        threshold = self.config.get("step_threshold", CLOCK_STEP_THRESHOLD)
+        use_slew = mode == "slew" or (mode == "auto" and abs(offset) < threshold)
+        # 平滑调整要在进程内结束时（Windows），一次性的进程退出前来不及完成：
+        # auto模式改为跳变，slew模式等待调整完成
+        wait_slew = use_slew and self.short_lived and self.clock_backend is not None \
+            and not self.clock_backend.slew_outlives_process
+        if wait_slew and mode == "auto":
+            use_slew = wait_slew = False
+        
+        try:
+            if not self.is_admin():
+                self.logger.warning("无管理员权限，设置时间可能失败")
+            
+            if self.clock_backend is None:
+                raise Exception(f"不支持的平台: {sys.platform}")
+            
+            if use_slew:
+                duration = self.clock_backend.slew(offset)
+                self.last_clock_action = "slew"
+                self.logger.info(f"平滑调整时间 {offset * 1000:+.3f}ms，预计 {duration:.1f} 秒完成")
+                if wait_slew:
+                    self.logger.info("等待平滑调整完成后退出...")
+                    self.clock_backend.restore(wait=True)
+            else:
+                self.clock_backend.step(offset)
+                self.last_clock_action = "step"
+                self.logger.info(f"系统时间已跳变 {offset * 1000:+.3f}ms")
+            return True
+                
+        except Exception as e:
+            self.logger.error(f"设置时间失败: {e}")
+            
+            if sys.platform != 'win32':
+                return False
+            
+            # 备用方案：使用命令行（只能精确到秒）
+            METRIC_FALLBACKS.inc("clock_shell")
+            try:
+                import subprocess
+                dt = datetime.fromtimestamp(sample.now_ns() / 1e9)
+                date_cmd = f'date {dt.strftime("%Y-%m-%d")}'
+                time_cmd = f'time {dt.strftime("%H:%M:%S")}'
+                subprocess.run(date_cmd, shell=True, capture_output=True)
+                subprocess.run(time_cmd, shell=True, capture_output=True)
+                self.last_clock_action = "step"
+                self.logger.info("使用命令行方式设置时间成功")
+                return True
+            except Exception as e2:
+                self.logger.error(f"命令行方式也失败: {e2}")
+                return False
+    
+    def sync_once(self, on_sample=None, cancel=None):
+        """
+        执行一次完整的同步（查询 + 设置系统时间），在调用线程中同步执行
+        on_sample / cancel: 见get_ntp_time；取消后不再设置系统时间
+        返回：ClockEstimate（成功）或 None（失败或取消）
+        """
+        with self._sync_lock:
+            started = time.perf_counter()
+            self.logger.info("开始同步时间...")
+            
+            # 获取网络时间
+            estimate = self.get_ntp_time(on_sample=on_sample, cancel=cancel)
+            if cancel is not None and cancel.is_set():
+                METRIC_SYNC_DURATION.observe(time.perf_counter() - started, "cancelled")
+                return None
+            
+            if estimate and self.set_system_time(estimate):
+                if self.resync_watcher:
+                    # 自己调整的时钟不算跳变
+                    self.resync_watcher.reset()
+                self.last_estimate = estimate
+                self.last_sync_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                self.logger.info(f"时间同步完成！校正量 {estimate.offset * 1000:+.3f}ms")
+                self.record_history(self.last_clock_action, estimate)
+                self.update_drift()
+                METRIC_SYNC_DURATION.observe(time.perf_counter() - started, "success")
+                METRIC_LAST_SYNC.set(time.time())
+                return estimate
+            
+            self.record_history("error" if estimate else "failed", estimate)
+            METRIC_SYNC_DURATION.observe(time.perf_counter() - started, "error" if estimate else "failed")
+            return None
+    
+    def record_history(self, action, estimate):
+        """
+        把本轮同步写入历史记录，写入失败只记日志，不影响同步
+        """
+        try:
+            self.sync_history.record(action, estimate, self.last_samples, freq=self.clock_frequency())
+        except Exception as e:
+            self.logger.warning(f"保存同步历史失败: {e}")
+    
+    def clock_frequency(self):
+        """
+        读取当前的时钟频率校正（ppm），平台不支持或读取失败时返回None
+        """
+        if self.clock_backend is None:
+            return None
+        try:
+            return self.clock_backend.frequency()
+        except Exception:
+            return None
+    
+    @property
+    def server_health(self):
+        """
+        NTP服务器健康记录，第一次用到时才读取文件，不占用启动时间
+        """
+        if self._server_health is None:
+            self._server_health = ServerHealthStore(self.program_dir / NTP_HEALTH_FILE, logger=self.logger)
+        return self._server_health
+    
+    @property
+    def drift_estimator(self):
+        """
+        时钟漂移估计，第一次用到时才导入drift模块
+        """
+        if self._drift_estimator is None:
+            from .drift import DriftEstimator
+            
+            self._drift_estimator = DriftEstimator()
+        return self._drift_estimator
+    
+    def update_drift(self, now=None):
+        """
+        用最近的同步历史重新估计本机时钟的频率误差，模型可信时校正系统时钟频率，
+        两次同步之间（包括断网期间）时钟也不会明显漂移，自动同步的间隔可以更长
+        配置drift_correction为false时只估计不校正
+        返回：DriftModel 或 None
+        """
+        now = time.time() if now is None else now
+        try:
+            intervals = self.sync_history.drift_intervals(now - DRIFT_WINDOW_DAYS * 86400, now)
+        except Exception as e:
+            self.logger.warning(f"读取同步历史失败: {e}")
+            return self.drift_model
+        
+        # 间隔数不足时不可能得出模型，不需要加载漂移估计
+        if len(intervals) < DRIFT_MIN_POINTS:
+            self.drift_model = None
+            return None
+        self.drift_model = self.drift_estimator.fit(intervals, now)
+        model = self.drift_model
+        if model is None or not self.config.get("drift_correction", True):
+            return model
+        
+        applied = self.clock_frequency()
+        if applied is None or abs(model.ppm - applied) < DRIFT_MIN_CHANGE:
+            return model
+        try:
+            applied = self.clock_backend.set_frequency(model.ppm)
+        except NotImplementedError:
+            return model
+        except Exception as e:
+            self.logger.warning(f"校正时钟频率失败: {e}")
+            return model
+        METRIC_CLOCK_FREQUENCY.set(applied)
+        self.logger.info(f"本机时钟频率误差 {model.ppm:+.3f}ppm（±{model.stderr:.3f}，"
+                         f"{model.points} 个间隔），频率校正已设为 {applied:+.3f}ppm")
+        return model
+    
+    def drift_interval_limit(self):
+        """
+        自动同步间隔的上限：按漂移模型预测，偏差积累到"稳定"阈值所需的时间
+        返回：秒，没有可信模型时返回None（不限制）
+        """
+        if self.drift_model is None:
+            return None
+        return self.drift_estimator.safe_interval(self.drift_model, self.clock_frequency() or 0.0,
+                                                  AUTO_SYNC_SMALL_OFFSET)
+    
+    def sync_time(self, callback=None, on_sample=None, cancel=None):
+        """
+        同步时间（在线程中执行）
+        callback: 回调函数(result, datetime_str)，result为"success"、"failed"或"cancelled"，在工作线程中调用
+        on_sample / cancel: 见get_ntp_time
+        """
+        def sync_thread():
+            if self.sync_once(on_sample=on_sample, cancel=cancel):
+                if callback:
+                    callback("success", self.last_sync_time)
+                return
+            
+            # 同步失败或取消
+            if callback:
+                callback("cancelled" if cancel is not None and cancel.is_set() else "failed", None)
+        
+        thread = threading.Thread(target=sync_thread, daemon=True)
+        thread.start()
+    
+    def start_auto_sync(self, callback=None):
+        """
+        启动后台自动同步
+        callback: 每轮同步后的回调函数(result, datetime_str)
+        """
+        if self.scheduler and self.scheduler.running:
+            return
+        
+        def on_round(estimate):
+            if callback:
+                if estimate:
+                    callback("success", self.last_sync_time)
+                else:
+                    callback("failed", None)
+        
+        self.scheduler = AutoSyncScheduler(
+            self.sync_once,
+            interval=self.config.get("interval", AUTO_SYNC_INTERVAL),
+            min_interval=self.config.get("min_interval", AUTO_SYNC_MIN_INTERVAL),
+            max_interval=self.config.get("max_interval", AUTO_SYNC_MAX_INTERVAL),
+            callback=on_round,
+            interval_limit=self.drift_interval_limit,
+            logger=self.logger,
+        )
+        # 上次运行积累的历史可以直接得出漂移模型
+        self.update_drift()
+        self.scheduler.start()
+        self.start_resync_watcher()
+    
+    def stop_auto_sync(self):
+        """
+        停止后台自动同步
+        """
+        if self.scheduler:
+            self.scheduler.stop()
+            self.scheduler = None
+    
+    def start_resync_watcher(self, sources=None):
+        """
+        启动同步触发：从睡眠中唤醒、网络连接或切换、系统时间跳变时立即同步
+        配置resync_triggers为false时不启动
+        sources: 事件源列表，默认为当前平台可用的全部事件源
+        """
+        if self.resync_watcher or not self.config.get("resync_triggers", True):
+            return
+        self.resync_watcher = ResyncWatcher(self.on_resync, sources=sources, logger=self.logger)
+        self.resync_watcher.start()
+    
+    def stop_resync_watcher(self):
+        if self.resync_watcher:
+            self.resync_watcher.stop()
+            self.resync_watcher = None
+    
+    def on_resync(self, reason):
+        """
+        同步触发：自动同步运行中时让调度器立即同步，否则交给resync_callback（如界面）
+        """
+        self.logger.info(f"{reason}，立即同步时间")
+        METRIC_RESYNC_TRIGGERS.inc()
+        if self.scheduler and self.scheduler.running:
+            self.scheduler.trigger()
+        elif self.resync_callback:
+            self.resync_callback(reason)
+    
+    def start_metrics(self, port=None):
+        """
+        启用运行指标，并在HTTP端口上提供/metrics和/metrics.json
+        配置metrics为true或指定了端口时才启用；未启用时各处的记录操作几乎没有开销
+        port: 监听端口，默认读取配置metrics_port
+        返回：MetricsServer 或 None
+        """
+        if port is None and not self.config.get("metrics", False):
+            return None
+        host = self.config.get("metrics_host", METRICS_HOST)
+        port = self.config.get("metrics_port", METRICS_PORT) if port is None else port
+        
+        from .metrics import MetricsServer
+        
+        server = MetricsServer(METRICS, host, port, logger=self.logger)
+        try:
+            server.start()
+        except OSError as e:
+            self.logger.warning(f"无法在 {host}:{port} 提供运行指标: {e}")
+            return None
+        METRICS.enable()
+        self.metrics_server = server
+        self.logger.info(f"运行指标: http://{server.address[0]}:{server.address[1]}/metrics")
+        return server
+    
+    def get_http_session(self):
+        """
+        获取共享的HTTP会话（首次调用时创建）
+        """
+        if self._http_session is None:
+            self._http_session = create_http_session(self.config.get("update_workers", UPDATE_WORKERS) * 2)
+        return self._http_session
+    
+    def load_update_cache(self):
+        """
+        加载更新检查缓存（版本清单及ETag/Last-Modified等校验值）
+        返回：缓存字典
+        """
+        cache_path = self.program_dir / UPDATE_CACHE_FILE
+        if cache_path.exists():
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.warning(f"加载更新缓存失败: {e}")
+        return {}
+    
+    def save_update_cache(self, cache):
+        """
+        保存更新检查缓存
+        """
+        cache_path = self.program_dir / UPDATE_CACHE_FILE
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            self.logger.warning(f"保存更新缓存失败: {e}")
+    
+    def current_exe_digest(self, cache):
+        """
+        当前运行的EXE的SHA-256（按文件大小和修改时间缓存，避免每次重新计算）
+        源码运行时返回None
+        """
+        if not getattr(sys, 'frozen', False):
+            return None
+        
+        stat = os.stat(sys.executable)
+        cached = cache.get("current_exe", {})
+        if cached.get("size") == stat.st_size and cached.get("mtime") == stat.st_mtime:
+            return cached.get("sha256")
+        
+        digest = file_sha256(sys.executable)
+        cache["current_exe"] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest}
+        return digest
+    
+    def rank_mirrors(self, urls, cache):
+        """
+        按历史记录给镜像排序：首字节时间短、吞吐量高的在前，没有记录的保持原顺序
+        """
+        history = cache.get("mirrors", {})
+        
+        def expected(url):
+            entry = history.get(url) or {}
+            throughput = entry.get("throughput") or UPDATE_ASSUMED_THROUGHPUT
+            return (entry.get("ttfb") or 0) + UPDATE_CHUNK_SIZE / throughput
+        
+        return sorted(urls, key=expected)
+    
+    def merge_mirror_stats(self, cache, stats):
+        """
+        把本次下载的镜像统计按指数平滑合并到历史记录cache["mirrors"]
+        """
+        history = cache.setdefault("mirrors", {})
+        alpha = UPDATE_HISTORY_SMOOTHING
+        for url, current in stats.items():
+            entry = history.setdefault(url, {"ttfb": None, "throughput": None, "failures": 0})
+            if current["ttfb"] is not None:
+                entry["ttfb"] = current["ttfb"] if entry["ttfb"] is None else \
+                    entry["ttfb"] + alpha * (current["ttfb"] - entry["ttfb"])
+            if current["bytes"] and current["seconds"] > 0:
+                throughput = current["bytes"] / current["seconds"]
+                entry["throughput"] = throughput if entry["throughput"] is None else \
+                    entry["throughput"] + alpha * (throughput - entry["throughput"])
+            # 连续失败次数，成功传输过数据后清零
+            entry["failures"] = entry["failures"] + current["failures"] if current["failures"] else 0
+            entry["updated"] = time.time()
+
+    def fetch_manifest(self, urls, cache):
+        """
+        获取版本清单（带If-None-Match，清单未变化时服务器只返回304）
+        urls: EXE下载地址列表
+        cache: 更新缓存，成功时写入新的清单和ETag
+        返回：清单字典 或 None（所有镜像都没有发布清单）
+        """
+        session = self.get_http_session()
+        for url in map(manifest_url, urls):
+            try:
+                headers = {}
+                if cache.get("manifest") and cache.get("manifest_etag"):
+                    headers['If-None-Match'] = cache["manifest_etag"]
+                response = session.get(url, headers=headers, timeout=UPDATE_TIMEOUT)
+                
+                if response.status_code == 304:
+                    self.logger.info("版本清单未变化")
+                    return cache["manifest"]
+                if response.status_code != 200:
+                    self.logger.info(f"获取版本清单失败，HTTP状态码: {response.status_code}")
+                    continue
+                
+                manifest = response.json()
+                if not manifest.get("version") or not manifest.get("sha256"):
+                    self.logger.warning(f"版本清单格式错误: {url}")
+                    continue
+                
+                cache["manifest"] = manifest
+                cache["manifest_etag"] = response.headers.get('ETag')
+                return manifest
+                
+            except Exception as e:
+                self.logger.warning(f"获取版本清单失败: {e}")
+        return None
+    
+    def probe_exe_changed(self, urls, cache):
+        """
+        没有版本清单时，用带If-None-Match/If-Modified-Since的HEAD请求判断EXE是否变化
+        urls: EXE下载地址列表
+        cache: 更新缓存，探测到的校验值暂存在"pending_exe"中，下载确认后才生效
+        返回：True=可能有变化（需要下载），False=未变化
+        """
+        session = self.get_http_session()
+        for url in urls:
+            try:
+                headers = {}
+                if cache.get("exe_etag"):
+                    headers['If-None-Match'] = cache["exe_etag"]
+                if cache.get("exe_last_modified"):
+                    headers['If-Modified-Since'] = cache["exe_last_modified"]
+                response = session.head(url, headers=headers, timeout=UPDATE_TIMEOUT,
+                                        allow_redirects=True)
+                
+                if response.status_code == 304:
+                    return False
+                if response.status_code == 200:
+                    cache["pending_exe"] = {
+                        "etag": response.headers.get('ETag'),
+                        "last_modified": response.headers.get('Last-Modified'),
+                    }
+                    return True
+                self.logger.info(f"HEAD请求失败，HTTP状态码: {response.status_code}")
+                
+            except Exception as e:
+                self.logger.warning(f"HEAD请求失败: {e}")
+        # 无法判断时按有变化处理，由下载后的摘要比较决定
+        return True
+    
+    def fetch_delta(self, urls, manifest, patch, current_digest, exe_path, cache, progress=None, cancel=None):
+        """
+        下载差分补丁，用当前程序在本地重建time_new.exe
+        补丁和重建结果都按清单中的SHA-256校验；任何一步失败都返回False，由调用方改为下载完整EXE
+        patch: 清单中当前版本对应的补丁信息{"path", "sha256", "size"}
+        返回：True=重建成功
+        """
+        patch_urls = {sibling_url(url, patch["path"]): url for url in urls}
+        patch_path = self.program_dir / UPDATE_DELTA_FILE
+        downloader = UpdateDownloader(
+            list(patch_urls),
+            patch_path,
+            session=self.get_http_session(),
+            workers=self.config.get("update_workers", UPDATE_WORKERS),
+            history=cache.get("mirrors"),
+            progress=progress,
+            cancel=cancel,
+            logger=self.logger,
+        )
+        
+        try:
+            start = time.perf_counter()
+            patch_size = downloader.download(patch["sha256"])
+            digest = apply_delta(patch_path, sys.executable, exe_path, current_digest)
+            if digest != manifest["sha256"]:
+                exe_path.unlink(missing_ok=True)
+                raise Exception("重建的程序与版本清单不一致")
+            
+            elapsed = time.perf_counter() - start
+            self.logger.info(f"差分更新完成：下载 {patch_size} bytes"
+                             f"（完整程序 {manifest.get('size', '?')} bytes），耗时 {elapsed:.1f} 秒")
+            cache["pending_install"] = {"sha256": digest, "size": exe_path.stat().st_size}
+            return True
+        except DownloadCancelled:
+            return False
+        except Exception as e:
+            self.logger.warning(f"差分更新失败，改为下载完整程序: {e}")
+            METRIC_FALLBACKS.inc("delta")
+            return False
+        finally:
+            # 镜像统计按EXE地址记录，与完整下载共用历史
+            self.merge_mirror_stats(cache, {patch_urls[url]: stats
+                                            for url, stats in downloader.mirror_stats.items()})
+            patch_path.unlink(missing_ok=True)
+    
+    def fetch_update(self, progress=None, cancel=None):
+        """
+        检查并下载新版本到time_new.exe，在调用线程中同步执行
+        先获取几百字节的版本清单（或发送条件HEAD请求），只有版本号或摘要不同时才下载；
+        清单中有当前版本的差分补丁时只下载补丁，在本地重建新版本；
+        下载中断时保留进度，下次检查更新时断点续传
+        progress: 进度回调函数(已下载字节数, 总字节数)
+        cancel: threading.Event，置位后停止下载（保留进度，下次续传）
+        返回：True=有新版本，False=没有、失败或取消
+        """
+        self.logger.info(f"正在检查更新... 当前版本: {VERSION}")
+        
+        cache = self.load_update_cache()
+        urls = self.rank_mirrors(self.config.get("update_urls", UPDATE_URLS), cache)
+        current_digest = self.current_exe_digest(cache)
+        
+        manifest = self.fetch_manifest(urls, cache)
+        if manifest:
+            same_build = current_digest is None or manifest["sha256"] == current_digest
+            if manifest["version"] == VERSION and same_build:
+                self.save_update_cache(cache)
+                self.logger.info("当前是最新版本")
+                return False
+            self.logger.info(f"发现新版本: {manifest['version']}")
+        elif not self.probe_exe_changed(urls, cache):
+            self.save_update_cache(cache)
+            self.logger.info("程序文件未变化，当前是最新版本")
+            return False
+        
+        exe_path = self.program_dir / "time_new.exe"
+        patch = manifest.get("patches", {}).get(current_digest) if manifest and current_digest else None
+        if patch and self.fetch_delta(urls, manifest, patch, current_digest, exe_path, cache, progress, cancel):
+            self.save_update_cache(cache)
+            self.logger.info("有新版本！")
+            return True
+        if cancel is not None and cancel.is_set():
+            self.logger.info("更新已取消")
+            self.save_update_cache(cache)
+            return False
+        
+        downloader = UpdateDownloader(
+            urls,
+            exe_path,
+            session=self.get_http_session(),
+            workers=self.config.get("update_workers", UPDATE_WORKERS),
+            history=cache.get("mirrors"),
+            progress=progress,
+            cancel=cancel,
+            logger=self.logger,
+        )
+        
+        try:
+            start = time.perf_counter()
+            total_size = downloader.download(manifest["sha256"] if manifest else None)
+            elapsed = time.perf_counter() - start
+        except DownloadCancelled:
+            self.logger.info("更新已取消，下次检查更新时继续下载")
+            self.merge_mirror_stats(cache, downloader.mirror_stats)
+            self.save_update_cache(cache)
+            return False
+        except Exception as e:
+            self.logger.warning(f"下载失败: {e}")
+            self.merge_mirror_stats(cache, downloader.mirror_stats)
+            self.save_update_cache(cache)
+            return False
+        
+        self.merge_mirror_stats(cache, downloader.mirror_stats)
+        self.logger.info(f"下载完成，大小: {total_size} bytes，"
+                         f"耗时 {elapsed:.1f} 秒（{total_size / max(elapsed, 1e-6) / 1024:.0f} KB/s）")
+        
+        if manifest is None and total_size <= 100000:  # 没有清单可校验时，大于100KB才是有效exe
+            self.logger.warning("下载的文件太小")
+            exe_path.unlink(missing_ok=True)
+            self.save_update_cache(cache)
+            return False
+        
+        # 记录本次下载的校验值，下次HEAD请求未变化时不再下载
+        pending = cache.pop("pending_exe", None)
+        if pending:
+            cache["exe_etag"] = pending["etag"]
+            cache["exe_last_modified"] = pending["last_modified"]
+        
+        if manifest is None and current_digest is not None:
+            # 没有清单时比较下载文件与当前程序，相同则不是新版本
+            if downloader.sha256 == current_digest:
+                self.logger.info("下载的程序与当前版本相同")
+                exe_path.unlink(missing_ok=True)
+                self.save_update_cache(cache)
+                return False
+        
+        cache["pending_install"] = {"sha256": downloader.sha256, "size": total_size}
+        self.save_update_cache(cache)
+        self.logger.info("有新版本！")
+        return True
+    
+    def check_update(self, callback=None, progress=None, cancel=None):
+        """
+        检查更新（在线程中执行）
+        callback: 回调函数(has_update, latest_version)，在工作线程中调用
+        progress / cancel: 见fetch_update
+        """
+        def check_thread():
+            has_update = self.fetch_update(progress=progress, cancel=cancel)
+            if callback:
+                callback(has_update, VERSION if has_update else None)
+        
+        thread = threading.Thread(target=check_thread, daemon=True)
+        thread.start()
+    
+    def install_update(self, relaunch=None):
+        """
+        安装更新：原子替换程序文件并启动新版本，在调用线程中同步执行
+        假设time_new.exe已由fetch_update下载并校验；新版本以"--post-update <PID> <relaunch>"启动，
+        等本进程退出后删除旧程序备份，不需要批处理脚本和固定的等待时间
+        relaunch: 新版本沿用的命令行参数（图形界面为原来的参数）；None表示不启动新版本，
+                  如命令行update，正在运行的daemon/serve/agent需要自行重启，旧程序备份在下次更新时删除
+        返回：(result, message)，result为"success"、"reboot"（重启电脑后生效）或"failed"
+        """
+        self.logger.info("开始更新程序...")
+        
+        # 源码运行时sys.executable是python.exe，不能替换
+        if not getattr(sys, 'frozen', False):
+            self.logger.warning("源码运行时不支持自动更新，请使用git pull")
+            return "failed", "源码运行不支持自动更新"
+        
+        try:
+            exe_path = self.program_dir / "time_new.exe"
+            current_exe = Path(sys.executable)
+            
+            # 检查文件是否存在
+            if not exe_path.exists():
+                self.logger.error("未找到新版本文件")
+                return "failed", "文件不存在"
+            
+            # 下载时已校验摘要，这里只确认文件没有被截断或替换
+            cache = self.load_update_cache()
+            pending = cache.pop("pending_install", None)
+            if not pending or exe_path.stat().st_size != pending["size"]:
+                self.logger.error("新版本文件与下载时校验的不一致")
+                exe_path.unlink(missing_ok=True)
+                self.save_update_cache(cache)
+                return "failed", "文件无效"
+            self.save_update_cache(cache)
+            
+            if replace_executable(exe_path, current_exe) == "reboot":
+                self.logger.warning("程序文件被占用，已登记为重启电脑后替换")
+                return "reboot", "重启电脑后完成更新"
+            self.logger.info(f"程序文件已替换，SHA-256: {pending['sha256']}")
+            
+            if relaunch is None:
+                self.logger.info("更新成功！下次启动时使用新版本")
+                return "success", "更新完成，正在运行的daemon/serve/agent重启后使用新版本"
+            
+            import subprocess
+            flags = subprocess.DETACHED_PROCESS if sys.platform == 'win32' else 0
+            subprocess.Popen(
+                [str(current_exe), '--post-update', str(os.getpid())] + list(relaunch),
+                cwd=str(self.program_dir),
+                creationflags=flags,
+                close_fds=True,
+            )
+            
+            self.logger.info("更新成功！程序即将重启...")
+            return "success", "更新完成"
+                    
+        except Exception as e:
+            self.logger.error(f"更新异常: {e}")
+            return "failed", str(e)
+    
+    def finish_update(self, pid):
+        """
+        新版本启动后的收尾：等待旧进程退出，删除旧程序备份"<EXE>.old"
+        pid: 旧进程的PID
+        """
+        if not wait_for_process(pid, UPDATE_HANDOFF_TIMEOUT):
+            self.logger.warning(f"旧进程 {pid} 在 {UPDATE_HANDOFF_TIMEOUT} 秒内未退出，保留旧程序备份")
+            return
+        
+        current_exe = Path(sys.executable)
+        backup = current_exe.with_name(current_exe.name + '.old')
+        try:
+            backup.unlink(missing_ok=True)
+        except OSError as e:
+            self.logger.warning(f"删除旧程序备份失败: {e}")
+            return
+        self.logger.info(f"更新完成，当前版本: {VERSION}")
+    
+    def do_update(self, callback=None):
+        """
+        执行更新（在线程中执行）
+        callback: 回调函数(result, message)，在工作线程中调用；result为"success"时由调用方退出程序
+        """
+        def update_thread():
+            # 新版本以原来的参数重新启动图形界面
+            result, message = self.install_update(relaunch=relaunch_arguments(sys.argv[1:]))
+            if callback:
+                callback(result, message)
+        
+        thread = threading.Thread(target=update_thread, daemon=True)
+        thread.start()
+    
+    def restart_app(self):
+        """
+        重启程序
+        """
+        try:
+            import subprocess
+            subprocess.Popen([sys.executable])
+            self.logger.info("程序已重启")
+        except Exception as e:
+            self.logger.error(f"重启失败: {e}")
+    
+    def clean_old_logs(self, days=None):
+        """
+        清理过期日志文件（轮转时也会按log_days自动清理）
+        days: 保留天数，默认从配置读取
+        返回：清理的文件数量
+        """
+        if days is None:
+            days = self.config.get("log_days", 7)
+        
+        try:
+            # 按轮转记录从最旧的一端删除，不扫描目录
+            archive = self.log_archive
+            if archive is None and self.log_dir.exists():
+                archive = LogArchive(self.log_dir, days=days, logger=self.logger)
+            deleted_count = archive.prune(days) if archive else 0
+            
+            self.logger.info(f"已清理 {deleted_count} 个过期日志文件")
+            return deleted_count
+            
+        except Exception as e:
+            self.logger.error(f"清理日志失败: {e}")
+            return 0
+    
+    def show_logs(self):
+        """
+        显示日志查看器窗口
+        """
+        if not self.root:
+            return
+        LogViewer(self.root, self.log_dir)
+    
+    def create_gui(self):
+        """
+        创建GUI界面
+        """
+        from tkinter import Tk, Toplevel, StringVar, BooleanVar, N, S, E, W, HORIZONTAL
+        from tkinter import ttk, messagebox, scrolledtext
+        
+        # 创建主窗口
+        self.root = Tk()
+        self.root.title(f"{APP_NAME} v{VERSION}")
+        self.root.geometry("500x400")
+        self.root.resizable(False, False)
+        
+        # 状态变量
+        status_var = StringVar(value="就绪")
+        last_sync_var = StringVar(value="从未同步")
+        startup_var = BooleanVar(value=self.check_startup())
+        save_log_var = BooleanVar(value=self.config.get("save_log", True))
+        auto_sync_var = BooleanVar(value=self.config.get("auto_sync", False))
+        
+        # 工作线程只通过事件队列通知界面，以下处理函数都在界面线程中执行
+        events = UIEventQueue(self.root, coalesce=("ntp_sample", "download"))
+        sync_cancel = None      # 正在进行的同步的取消标志
+        update_cancel = None    # 正在进行的更新检查/下载的取消标志
+        
+        # 事件：自动同步完成一轮
+        def on_sync_result(result, datetime_str):
+            if result == "success":
+                status_var.set("同步成功")
+                last_sync_var.set(datetime_str)
+            elif result == "cancelled":
+                status_var.set("同步已取消")
+            else:
+                status_var.set("同步失败")
+        
+        # 事件：手动同步完成
+        def on_sync_complete(result, datetime_str):
+            nonlocal sync_cancel
+            on_sync_result(result, datetime_str)
+            sync_cancel = None
+            sync_button.config(text="立即同步时间")
+        
+        # 事件：收到NTP采样
+        def on_ntp_sample(count, server, delay):
+            status_var.set(f"正在同步时间... 已收到 {count} 个采样（{server} 延迟 {delay * 1000:.1f}ms）")
+        
+        # 事件：下载进度
+        def on_download(downloaded, total, rate):
+            size = f"{downloaded / 1048576:.1f}/{total / 1048576:.1f}MB" if total else f"{downloaded / 1048576:.1f}MB"
+            status_var.set(f"正在下载 {size}，{rate / 1024:.0f} KB/s")
+        
+        # 事件：更新完成
+        def on_update_complete(result, message):
+            if result == "success":
+                status_var.set("更新成功，重启中...")
+                self.quit_app()
+            elif result == "reboot":
+                status_var.set(message)
+            else:
+                status_var.set(f"更新失败: {message}")
+            update_button.config(text="一键更新程序", state='normal')
+        
+        # 事件：检查更新完成
+        def on_check_update_complete(has_update, version):
+            nonlocal update_cancel
+            cancelled = update_cancel is not None and update_cancel.is_set()
+            update_cancel = None
+            if has_update:
+                status_var.set("发现新版本，正在更新...")
+                # 替换程序文件不能中途取消
+                update_button.config(text="正在更新...", state='disabled')
+                self.do_update(callback=events.callback("update"))
+            else:
+                status_var.set("更新已取消" if cancelled else "当前是最新版本")
+                update_button.config(text="一键更新程序")
+        
+        # 事件：睡眠唤醒、网络变化或系统时间跳变（未开启自动同步时），像点击按钮一样同步一次
+        def on_resync(reason):
+            if sync_cancel is None and not (self.scheduler and self.scheduler.running):
+                sync_action()
+        
+        events.on("sync", on_sync_complete)
+        events.on("resync", on_resync)
+        events.on("auto_sync", on_sync_result)
+        events.on("ntp_sample", on_ntp_sample)
+        events.on("download", on_download)
+        events.on("update", on_update_complete)
+        events.on("check_update", on_check_update_complete)
+        events.start()
+        
+        # 样式设置
+        style = ttk.Style()
+        style.configure("TButton", padding=6)
+        style.configure("TLabel", padding=2)
+        
+        # 主框架
+        main_frame = ttk.Frame(self.root, padding="20")
+        main_frame.grid(row=0, column=0, sticky=(W, E))
+        
+        # 标题
+        title_label = ttk.Label(
+            main_frame, 
+            text=f"🔧 {APP_NAME} v{VERSION}", 
+            font=("Microsoft YaHei", 16, "bold")
+        )
+        title_label.grid(row=0, column=0, columnspan=2, pady=(0, 15))
+        
+        # 状态
+        ttk.Label(main_frame, text="状态:").grid(row=1, column=0, sticky=W, pady=5)
+        status_label = ttk.Label(
+            main_frame, 
+            textvariable=status_var, 
+            foreground="blue"
+        )
+        status_label.grid(row=1, column=1, sticky=W, pady=5)
+        
+        # 上次同步时间
+        ttk.Label(main_frame, text="上次同步:").grid(row=2, column=0, sticky=W, pady=5)
+        last_sync_label = ttk.Label(main_frame, textvariable=last_sync_var)
+        last_sync_label.grid(row=2, column=1, sticky=W, pady=5)
+        
+        # 分隔线
+        separator = ttk.Separator(main_frame, orient=HORIZONTAL)
+        separator.grid(row=3, column=0, columnspan=2, sticky=(W, E), pady=15)
+        
+        # ========== 按钮功能 ==========
+        
+        # 同步时间按钮（同步进行中时为取消按钮）
+        def sync_action():
+            nonlocal sync_cancel
+            if sync_cancel is not None:
+                sync_cancel.set()
+                status_var.set("正在取消同步...")
+                return
+            
+            sync_cancel = threading.Event()
+            samples = []
+            
+            def on_sample(sample):
+                samples.append(sample)
+                events.post("ntp_sample", len(samples), sample.server, sample.delay)
+            
+            status_var.set("正在同步时间...")
+            sync_button.config(text="取消同步")
+            self.sync_time(callback=events.callback("sync"), on_sample=on_sample, cancel=sync_cancel)
+        
+        sync_button = ttk.Button(
+            main_frame, 
+            text="立即同步时间", 
+            command=sync_action
+        )
+        sync_button.grid(row=4, column=0, columnspan=2, sticky=(W, E), pady=5)
+        
+        # 一键更新按钮（检查和下载进行中时为取消按钮）
+        def update_action():
+            nonlocal update_cancel
+            if update_cancel is not None:
+                update_cancel.set()
+                status_var.set("正在取消更新...")
+                return
+            
+            update_cancel = threading.Event()
+            status_var.set("正在检查更新...")
+            update_button.config(text="取消更新")
+            self.check_update(callback=events.callback("check_update"),
+                              progress=TransferMeter(events.callback("download")),
+                              cancel=update_cancel)
+        
+        update_button = ttk.Button(
+            main_frame, 
+            text="一键更新程序", 
+            command=update_action
+        )
+        update_button.grid(row=5, column=0, columnspan=2, sticky=(W, E), pady=5)
+        
+        # 开机自启动开关
+        def toggle_startup():
+            enable = startup_var.get()
+            if self.set_startup(enable):
+                self.logger.info(f"开机自启动{'已启用' if enable else '已禁用'}")
+            else:
+                startup_var.set(not enable)
+        
+        startup_check = ttk.Checkbutton(
+            main_frame, 
+            text="开机自启动", 
+            variable=startup_var,
+            command=toggle_startup
+        )
+        startup_check.grid(row=6, column=0, sticky=W, pady=5)
+        
+        # 自动同步开关
+        def toggle_auto_sync():
+            enable = auto_sync_var.get()
+            self.config["auto_sync"] = enable
+            self.save_config()
+            if enable:
+                self.start_auto_sync(callback=events.callback("auto_sync"))
+            else:
+                self.stop_auto_sync()
+            self.logger.info(f"自动同步{'已启用' if enable else '已禁用'}")
+        
+        auto_sync_check = ttk.Checkbutton(
+            main_frame, 
+            text="自动同步", 
+            variable=auto_sync_var,
+            command=toggle_auto_sync
+        )
+        auto_sync_check.grid(row=6, column=1, sticky=W, pady=5)
+        
+        # 日志保存开关
+        def toggle_save_log():
+            self.config["save_log"] = save_log_var.get()
+            self.save_config()
+            self.logger.info(f"日志保存{'已启用' if save_log_var.get() else '已禁用'}")
+        
+        save_log_check = ttk.Checkbutton(
+            main_frame, 
+            text="保存日志", 
+            variable=save_log_var,
+            command=toggle_save_log
+        )
+        save_log_check.grid(row=7, column=0, columnspan=2, sticky=W, pady=5)
+        
+        # 清理日志按钮
+        def clean_logs_action():
+            count = self.clean_old_logs()
+            status_var.set(f"已清理 {count} 个日志文件")
+        
+        clean_log_button = ttk.Button(
+            main_frame, 
+            text="清理日志", 
+            command=clean_logs_action
+        )
+        clean_log_button.grid(row=8, column=0, sticky=(W, E), pady=10)
+        
+        # 查看日志按钮
+        view_log_button = ttk.Button(
+            main_frame, 
+            text="查看日志", 
+            command=self.show_logs
+        )
+        view_log_button.grid(row=8, column=1, sticky=(W, E), pady=10)
+        
+        # 退出按钮
+        quit_button = ttk.Button(
+            main_frame, 
+            text="退出", 
+            command=self.quit_app
+        )
+        quit_button.grid(row=9, column=1, sticky=(W, E), pady=10)
+        
+        # 列配置
+        self.root.columnconfigure(0, weight=1)
+        self.root.columnconfigure(1, weight=1)
+        
+        # 关闭窗口事件
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
+        
+        self.logger.info("GUI界面已启动")
+        
+        if auto_sync_var.get():
+            self.start_auto_sync(callback=events.callback("auto_sync"))
+        
+        # 没有开启自动同步时，唤醒、网络变化等事件也会像点击按钮一样同步一次
+        self.resync_callback = events.callback("resync")
+        self.start_resync_watcher()
+        
+        # 启动主循环
+        self.root.mainloop()
+    
+    def quit_app(self):
+        """
+        退出程序
+        """
+        self.logger.info("程序退出")
+        self.stop_auto_sync()
+        self.stop_resync_watcher()
+        if self.clock_backend:
+            self.clock_backend.restore()
+        self.log_writer.stop()
+        if self.root:
+            self.root.destroy()
+        sys.exit(0)
+
+
+# ==================== 命令行 ====================
+
+def estimate_result(estimate, clock_action=None):
+    """
+    同步/查询结果 -> 可JSON序列化的字典（agent响应、orchestrate输出和命令行--json共用）
+    """
+    if estimate is None:
+        return {"ok": False, "error": "同步失败" if clock_action else "查询失败"}
+    result = {"ok": True, "offset": estimate.offset, "delay": estimate.delay, "jitter": estimate.jitter,
+              "stratum": estimate.stratum, "peer": estimate.peer}
+    if clock_action:
+        result["clock_action"] = clock_action
+    return result
+
+
+def build_arg_parser():
+    """
+    创建命令行参数解析器
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog="ZGIRC_TimeSync",
+        description=f"{APP_NAME} v{VERSION}（不带子命令时启动图形界面）",
+    )
+    parser.add_argument('--version', action='version', version=VERSION)
+    # 更新后由旧版本传入自己的PID，新版本等它退出后清理旧程序
+    parser.add_argument('--post-update', type=int, metavar='PID', help=argparse.SUPPRESS)
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help=f'在该端口提供/metrics运行指标（界面和daemon/serve/agent有效），'
+                             f'默认按配置metrics和metrics_port（{METRICS_PORT}）')
+    commands = parser.add_subparsers(dest='command', metavar='命令')
+    
+    sync_parser = commands.add_parser('sync', help='同步一次系统时间')
+    sync_parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    
+    query_parser = commands.add_parser('query', help='查询网络时间偏差，不修改系统时间')
+    query_parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    
+    daemon_parser = commands.add_parser('daemon', help='常驻后台，按自适应间隔自动同步')
+    daemon_parser.add_argument('--interval', type=int, help='初始同步间隔（秒），默认读取配置')
+    
+    commands.add_parser('update', help='检查并安装更新')
+    
+    history_parser = commands.add_parser('history', help='统计最近的同步历史')
+    history_parser.add_argument('--days', type=float, default=30, help='统计最近多少天，默认30')
+    history_parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    
+    serve_parser = commands.add_parser('serve', help='自动同步并作为局域网NTP服务器提供时间')
+    serve_parser.add_argument('--host', default='0.0.0.0', help='监听地址，默认0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=NTP_SERVE_PORT, help=f'监听端口，默认{NTP_SERVE_PORT}')
+    serve_parser.add_argument('--rate', type=float, default=NTP_SERVE_RATE,
+                              help=f'每个客户端每秒允许的请求数，0表示不限速，默认{NTP_SERVE_RATE:g}')
+    serve_parser.add_argument('--burst', type=int, default=NTP_SERVE_BURST,
+                              help=f'每个客户端允许的突发请求数，默认{NTP_SERVE_BURST}')
+    
+    agent_parser = commands.add_parser('agent', help='作为同步代理，接受orchestrate的远程同步/查询请求')
+    agent_parser.add_argument('--host', default='0.0.0.0', help='监听地址，默认0.0.0.0')
+    agent_parser.add_argument('--port', type=int, default=AGENT_PORT, help=f'监听端口，默认{AGENT_PORT}')
+    agent_parser.add_argument('--token', help='共享口令，默认读取配置agent_token；不设置时只接受query')
+    
+    orchestrate_parser = commands.add_parser('orchestrate', help='批量同步/查询多台电脑，按行输出JSON结果')
+    orchestrate_parser.add_argument('inventory', nargs='?', help='主机清单文件（每行一个"主机[:端口]"，-为标准输入）')
+    orchestrate_parser.add_argument('--host', action='append', default=[], help='追加一台主机（可重复）')
+    orchestrate_parser.add_argument('--action', choices=('query', 'sync'), default='query', help='执行的操作，默认query')
+    orchestrate_parser.add_argument('--workers', type=int, default=ORCHESTRATE_WORKERS,
+                                    help=f'同时进行的任务数，默认{ORCHESTRATE_WORKERS}')
+    orchestrate_parser.add_argument('--timeout', type=float, default=AGENT_TIMEOUT,
+                                    help=f'每台主机的超时（秒），默认{AGENT_TIMEOUT}')
+    orchestrate_parser.add_argument('--token', help='代理的共享口令，默认读取配置agent_token')
+    return parser
+
+
+def cmd_sync(app, args):
+    """
+    sync子命令：同步一次系统时间
+    """
+    estimate = app.sync_once()
+    if args.json:
+        print(json.dumps(estimate_result(estimate, app.last_clock_action or "failed"), ensure_ascii=False))
+        return 0 if estimate else 1
+    if estimate is None:
+        print("同步失败")
+        return 1
+    print(f"同步成功，校正量 {estimate.offset * 1000:+.3f}ms（{app.last_clock_action}）")
+    return 0
+
+
+def cmd_query(app, args):
+    """
+    query子命令：查询网络时间偏差
+    """
+    estimate = app.get_ntp_time()
+    if args.json:
+        print(json.dumps(estimate.as_dict() if estimate else None, ensure_ascii=False))
+    elif estimate:
+        print(f"偏差: {estimate.offset * 1000:+.3f}ms")
+        print(f"延迟: {estimate.delay * 1000:.3f}ms")
+        print(f"抖动: {estimate.jitter * 1000:.3f}ms")
+        print(f"主服务器: {estimate.peer}（层级 {estimate.stratum}）")
+    else:
+        print("查询失败")
+    return 0 if estimate else 1
+
+
+def cmd_daemon(app, args):
+    """
+    daemon子命令：常驻后台自动同步，收到SIGINT/SIGTERM时退出
+    """
+    import signal
+    
+    if args.interval:
+        app.config["interval"] = args.interval
+    
+    stop = threading.Event()
+    for name in ('SIGINT', 'SIGTERM'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stop.set())
+    
+    app.start_auto_sync()
+    # 分段等待，保证Windows下Ctrl+C也能及时响应
+    while not stop.wait(1):
+        pass
+    app.stop_auto_sync()
+    return 0
+
+
+def cmd_update(app, args):
+    """
+    update子命令：检查并安装更新
+    """
+    if not app.fetch_update():
+        print("当前是最新版本")
+        return 0
+    result, message = app.install_update()
+    print(message)
+    return 0 if result in ("success", "reboot") else 1
+
+
+def cmd_history(app, args):
+    """
+    history子命令：统计最近的同步次数、时钟漂移，以及各服务器偏差和往返延迟的分位数
+    """
+    since = time.time() - args.days * 86400
+    rounds = app.sync_history.rounds(since)
+    drift = sorted(ppm for _, ppm in app.sync_history.drift(since))
+    model = app.drift_estimator.fit(app.sync_history.drift_intervals(since))
+    servers = app.sync_history.server_stats(since)
+    succeeded = sum(1 for row in rounds if row["action"] in ("step", "slew"))
+    drift_ppm = drift[len(drift) // 2] if drift else None
+    frequency = app.clock_frequency()
+    
+    if args.json:
+        print(json.dumps({"days": args.days, "rounds": len(rounds), "succeeded": succeeded,
+                          "drift_ppm": drift_ppm, "drift_model": model._asdict() if model else None,
+                          "frequency_ppm": frequency, "servers": servers}, ensure_ascii=False))
+        return 0
+    
+    print(f"最近 {args.days:g} 天：同步 {len(rounds)} 次，成功 {succeeded} 次")
+    if drift_ppm is not None:
+        print(f"时钟漂移（中位数）: {drift_ppm:+.3f} ppm")
+    if model is not None:
+        print(f"时钟漂移（回归）: {model.ppm:+.3f} ppm ±{model.stderr:.3f}（{model.points} 个间隔），"
+              f"当前频率校正 {frequency or 0.0:+.3f} ppm")
+    if servers:
+        print(f"{'服务器':<32}{'采样':>6}{'偏差p50':>10}{'偏差p99':>10}{'延迟p50':>10}{'延迟p99':>10}  (ms)")
+        for server, entry in sorted(servers.items()):
+            offset, delay = entry["offset"], entry["delay"]
+            print(f"{server:<32}{entry['count']:>6}{offset['p50'] * 1000:>10.3f}{offset['p99'] * 1000:>10.3f}"
+                  f"{delay['p50'] * 1000:>10.3f}{delay['p99'] * 1000:>10.3f}")
+    return 0
+
+
+def _lazy_command(module, name):
+    """
+    放在单独模块中的子命令：执行时才导入该模块，图形界面和其他子命令启动时不加载
+    module: zgirc_timesync包中的模块名
+    name: 子命令函数名
+    """
+    def command(app, args):
+        import importlib
+        
+        return getattr(importlib.import_module(f".{module}", __package__), name)(app, args)
+    return command
+
+
+# 常驻运行的子命令（None为图形界面）：提供运行指标，平滑调整可以在进程内完成
+RESIDENT_COMMANDS = (None, 'daemon', 'serve', 'agent')
+
+CLI_COMMANDS = {
+    'sync': cmd_sync,
+    'query': cmd_query,
+    'daemon': cmd_daemon,
+    'update': cmd_update,
+    'history': cmd_history,
+    'serve': _lazy_command('server', 'cmd_serve'),
+    'agent': _lazy_command('fleet', 'cmd_agent'),
+    'orchestrate': _lazy_command('fleet', 'cmd_orchestrate'),
+}
+
+
+def main(argv=None):
+    """
+    程序入口
+    不带子命令时启动图形界面，否则以命令行方式运行（不加载tkinter）
+    返回：退出码
+    """
+    args = build_arg_parser().parse_args(argv)
+    
+    try:
+        app = TimeSyncApp()
+        if args.post_update:
+            threading.Thread(target=app.finish_update, args=(args.post_update,), daemon=True).start()
+        app.short_lived = args.command not in RESIDENT_COMMANDS
+        if not app.short_lived:
+            app.start_metrics(args.metrics_port)
+        if args.command:
+            return CLI_COMMANDS[args.command](app, args)
+        app.create_gui()
+        
+    except KeyboardInterrupt:
+        print("\n用户中断，程序退出")
+    except Exception as e:
+        print(f"\n程序异常: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 0
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+时钟漂移估计
+只在同步历史中有足够的校正间隔时导入，首次同步和图形界面启动时不需要加载这部分代码
+"""
+
+import time
+from collections import namedtuple
+
+from .app import DRIFT_HALF_LIFE, DRIFT_MIN_POINTS, DRIFT_MAX_STDERR, DRIFT_MAX_PPM
+
+
+# ==================== 时钟漂移估计 ====================
+
+# ppm: 频率误差估计；stderr: 估计的标准误差；spread: 各间隔频率误差的离散程度（温度变化等）；单位均为ppm
+DriftModel = namedtuple('DriftModel', ['ppm', 'stderr', 'spread', 'points', 'span'])
+
+
+class DriftEstimator:
+    """
+    时钟漂移估计
+    每个校正间隔积累的偏差 = 频率误差 x 间隔 + 测量误差，对所有间隔做过原点的加权线性回归：
+    权重为 1/测量误差^2，并按时间指数衰减（半衰期DRIFT_HALF_LIFE），较长的间隔自然占更大比重；
+    拟合后剔除残差超过3倍测量误差的间隔再拟合一次，避免个别异常的同步拉偏结果
+    """
+    
+    def __init__(self, half_life=DRIFT_HALF_LIFE, min_points=DRIFT_MIN_POINTS,
+                 max_stderr=DRIFT_MAX_STDERR, max_ppm=DRIFT_MAX_PPM):
+        """
+        half_life: 权重减半的时间（秒）
+        min_points: 至少需要的校正间隔数
+        max_stderr: 标准误差上限（ppm），超过时认为模型不可信
+        max_ppm: 单个间隔的频率误差上限（ppm），超过的间隔不参与估计
+        """
+        self.half_life = half_life
+        self.min_points = min_points
+        self.max_stderr = max_stderr
+        self.max_ppm = max_ppm
+    
+    @staticmethod
+    def _regress(points):
+        """
+        过原点的加权最小二乘：accumulated = ppm * 1e-6 * interval
+        points: [(间隔, 积累的偏差, 测量误差, 权重)]
+        返回：(频率误差ppm, 标准误差ppm, 离散程度ppm)
+        离散程度为各间隔的频率误差相对估计值的加权均方根
+        """
+        sxx = sum(weight * interval ** 2 for interval, _, _, weight in points)
+        sxy = sum(weight * interval * accumulated for interval, accumulated, _, weight in points)
+        slope = sxy / sxx
+        # 残差比测量误差大时（如温度变化），按约化卡方放大标准误差
+        chi2 = sum(weight * (accumulated - slope * interval) ** 2 for interval, accumulated, _, weight in points)
+        scale = max(1.0, chi2 / (len(points) - 1)) if len(points) > 1 else 1.0
+        return slope * 1e6, (scale / sxx) ** 0.5 * 1e6, (chi2 / sxx) ** 0.5 * 1e6
+    
+    def fit(self, intervals, now=None):
+        """
+        估计频率误差
+        intervals: SyncHistory.drift_intervals的结果
+        now: 计算衰减权重的当前时间，默认time.time()
+        返回：DriftModel（ppm为正表示本机时钟偏慢），数据不足或不可信时返回None
+        """
+        now = time.time() if now is None else now
+        points = [(interval, accumulated, error, 0.5 ** (max(0.0, now - ts) / self.half_life) / error ** 2)
+                  for ts, interval, accumulated, error in intervals
+                  if abs(accumulated / interval) * 1e6 <= self.max_ppm]
+        if len(points) < self.min_points:
+            return None
+        
+        ppm, _, _ = self._regress(points)
+        points = [point for point in points if abs(point[1] - ppm * 1e-6 * point[0]) <= 3 * point[2]]
+        if len(points) < self.min_points:
+            return None
+        
+        ppm, stderr, spread = self._regress(points)
+        if stderr > self.max_stderr:
+            return None
+        span = sum(interval for interval, _, _, _ in points)
+        return DriftModel(ppm, stderr, spread, len(points), span)
+    
+    @staticmethod
+    def safe_interval(model, applied, tolerance):
+        """
+        按模型预测，偏差积累到tolerance所需的时间
+        频率校正后剩余的漂移为 |ppm - applied|，再加2倍标准误差和各间隔的离散程度作为余量
+        model: DriftModel
+        applied: 当前的频率校正（ppm）
+        tolerance: 允许积累的偏差（秒）
+        返回：秒
+        """
+        rate = (abs(model.ppm - applied) + 2 * model.stderr + model.spread) * 1e-6
+        return tolerance / rate if rate > 0 else float('inf')
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+批量同步（agent和orchestrate子命令）
+只在运行这两个子命令时导入，图形界面和其他子命令启动时不需要加载这部分代码
+"""
+
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+
+from .app import (
+    SOURCE_DIR, VERSION, AGENT_PORT, AGENT_TIMEOUT, ORCHESTRATE_WORKERS, _parse_server, estimate_result,
+)
+
+
+# ==================== 批量同步 ====================
+
+class SyncAgent:
+    """
+    批量同步的代理端（agent子命令）
+    在TCP端口上接收JSON行请求{"id", "action": "query"/"sync"/"ping", "token"}，
+    调用本机的同步流程，返回一行JSON响应；同一连接上可以连续发送多个请求
+    设置了token时所有请求都要带相同的token；没有设置token时只接受query和ping，不允许远程修改时间
+    """
+    
+    def __init__(self, app, host='0.0.0.0', port=AGENT_PORT, token=None):
+        """
+        app: TimeSyncApp
+        host / port: 监听地址，端口为0时随机分配
+        token: 共享口令
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.token = token
+        self.address = None
+    
+    def _authorized(self, request, action):
+        import hmac
+        
+        if not self.token:
+            return action != "sync"
+        # 按字节比较：compare_digest不接受含非ASCII字符的字符串
+        token = str(request.get("token", "")).encode('utf-8')
+        return hmac.compare_digest(token, self.token.encode('utf-8'))
+    
+    def handle(self, request):
+        """
+        处理一个请求（在线程池中执行，同步流程本身由TimeSyncApp的锁串行化）
+        request: 解析后的JSON，不是对象时按格式错误处理
+        返回：响应字典，出错时为{"ok": False, "error": 原因}
+        """
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "请求格式错误"}
+        action = request.get("action")
+        if action not in ("ping", "query", "sync"):
+            return {"ok": False, "error": f"未知操作: {action}"}
+        if not self._authorized(request, action):
+            return {"ok": False, "error": "未授权" if self.token else "代理未设置agent_token，不接受sync"}
+        try:
+            if action == "ping":
+                return {"ok": True, "version": VERSION}
+            if action == "query":
+                return estimate_result(self.app.get_ntp_time())
+            return estimate_result(self.app.sync_once(), self.app.last_clock_action or "failed")
+        except Exception as e:
+            self.app.logger.error(f"处理代理请求 {action} 失败: {e}")
+            return {"ok": False, "error": str(e) or type(e).__name__}
+    
+    async def _serve_client(self, reader, writer):
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                response = await loop.run_in_executor(None, self.handle, request)
+                if isinstance(request, dict):
+                    response["id"] = request.get("id")
+                else:
+                    request = {}
+                self.app.logger.info(f"代理请求 {peer[0]}: {request.get('action')} -> "
+                                     f"{'成功' if response['ok'] else response['error']}")
+                writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            # readline遇到超过缓冲区上限的行时抛出ValueError，直接断开连接
+            pass
+        finally:
+            writer.close()
+    
+    def run(self, stop, ready=None):
+        """
+        在调用线程中运行代理，直到stop（threading.Event）被置位
+        ready: 开始监听后置位的threading.Event
+        """
+        import asyncio
+        
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(self._serve_client, self.host, self.port))
+        self.address = server.sockets[0].getsockname()[:2]
+        self.app.logger.info(f"同步代理已启动: {self.address[0]}:{self.address[1]}"
+                             f"{'' if self.token else '（未设置agent_token，只接受query）'}")
+        
+        def tick():
+            if stop.is_set():
+                loop.stop()
+                return
+            loop.call_later(0.5, tick)
+        
+        tick()
+        if ready is not None:
+            ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+            self.app.logger.info("同步代理已停止")
+
+
+def load_inventory(path):
+    """
+    读取主机清单：每行一个"主机[:端口]"，#之后为注释；"local"表示在本机以子进程执行
+    path: 文件路径，"-"表示标准输入
+    返回：主机列表
+    """
+    if path == '-':
+        text = sys.stdin.read()
+    else:
+        text = Path(path).read_text(encoding='utf-8')
+    hosts = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            hosts.append(line)
+    return hosts
+
+
+class SyncOrchestrator:
+    """
+    批量同步/查询多台电脑（orchestrate子命令）
+    所有主机的任务在一个asyncio事件循环中并发执行，同时进行的任务数不超过workers；
+    远程主机通过TCP连接其上的同步代理（agent子命令），"local"在本机以子进程运行query/sync；
+    每完成一台就输出一行结果，最后输出汇总
+    """
+    
+    def __init__(self, hosts, action="query", workers=ORCHESTRATE_WORKERS, timeout=AGENT_TIMEOUT, token=None):
+        """
+        hosts: 主机列表（见load_inventory）
+        action: "query"或"sync"
+        workers: 同时进行的任务数上限
+        timeout: 每台主机的超时（秒），包括连接和同步
+        token: 代理的共享口令
+        """
+        self.hosts = list(hosts)
+        self.action = action
+        self.workers = workers
+        self.timeout = timeout
+        self.token = token
+    
+    async def _agent_job(self, host):
+        import asyncio
+        
+        reader, writer = await asyncio.open_connection(*_parse_server(host, AGENT_PORT))
+        try:
+            request = {"id": 1, "action": self.action}
+            if self.token:
+                request["token"] = self.token
+            writer.write(json.dumps(request).encode('utf-8') + b'\n')
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("代理关闭了连接")
+            return json.loads(line)
+        finally:
+            writer.close()
+    
+    async def _local_job(self):
+        import asyncio
+        
+        command = [sys.executable] if getattr(sys, 'frozen', False) else [sys.executable, str(SOURCE_DIR / "time.py")]
+        process = await asyncio.create_subprocess_exec(
+            *command, self.action, '--json',
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            stdout, _ = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        lines = stdout.decode('utf-8', 'replace').strip().splitlines()
+        if not lines:
+            raise Exception(f"子进程退出码 {process.returncode}，没有输出")
+        # query --json输出偏差字典或null，sync --json输出estimate_result
+        data = json.loads(lines[-1])
+        if data is None:
+            return estimate_result(None, self.action == "sync")
+        return data if "ok" in data else dict(data, ok=True)
+    
+    async def _job(self, host, slots):
+        import asyncio
+        
+        async with slots:
+            start = time.perf_counter()
+            try:
+                job = self._local_job() if host == "local" else self._agent_job(host)
+                result = await asyncio.wait_for(job, self.timeout)
+                result.pop("id", None)
+            except asyncio.TimeoutError:
+                result = {"ok": False, "error": "超时"}
+            except Exception as e:
+                result = {"ok": False, "error": str(e) or type(e).__name__}
+            return dict({"host": host}, elapsed=round(time.perf_counter() - start, 3), **result)
+    
+    async def run(self, emit):
+        """
+        执行所有任务
+        emit: 每完成一台主机时的回调函数(结果字典)
+        返回：汇总字典
+        """
+        import asyncio
+        
+        start = time.perf_counter()
+        slots = asyncio.Semaphore(self.workers)
+        tasks = [asyncio.ensure_future(self._job(host, slots)) for host in self.hosts]
+        results = []
+        for future in asyncio.as_completed(tasks):
+            result = await future
+            results.append(result)
+            emit(result)
+        return self.summarize(results, time.perf_counter() - start)
+    
+    def summarize(self, results, elapsed):
+        """
+        汇总：成功/失败数、偏差分位数、失败原因统计
+        """
+        offsets = sorted(abs(result["offset"]) for result in results if result["ok"])
+        failures = {}
+        for result in results:
+            if not result["ok"]:
+                failures[result["error"]] = failures.get(result["error"], 0) + 1
+        
+        def pick(q):
+            return offsets[min(len(offsets) - 1, int(q * len(offsets)))] if offsets else None
+        
+        return {
+            "action": self.action,
+            "hosts": len(results),
+            "ok": len(offsets),
+            "failed": len(results) - len(offsets),
+            "abs_offset_p50": pick(0.5),
+            "abs_offset_p99": pick(0.99),
+            "abs_offset_max": offsets[-1] if offsets else None,
+            "failures": failures,
+            "elapsed": round(elapsed, 3),
+        }
+
+
+# ==================== 命令行 ====================
+
+def cmd_agent(app, args):
+    """
+    agent子命令：作为同步代理常驻，收到SIGINT/SIGTERM时退出
+    """
+    import signal
+    
+    agent = SyncAgent(app, args.host, args.port, token=args.token or app.config.get("agent_token"))
+    stop = threading.Event()
+    for name in ('SIGINT', 'SIGTERM'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stop.set())
+    try:
+        agent.run(stop)
+    except OSError as e:
+        print(f"无法监听 {args.host}:{args.port}: {e}")
+        return 1
+    return 0
+
+
+def cmd_orchestrate(app, args):
+    """
+    orchestrate子命令：批量同步/查询，每完成一台输出一行JSON，最后一行为{"summary": ...}
+    全部成功时退出码为0
+    """
+    import asyncio
+    
+    hosts = (load_inventory(args.inventory) if args.inventory else []) + args.host
+    if not hosts:
+        print("没有主机：请指定主机清单文件或--host")
+        return 1
+    
+    def emit(result):
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+    
+    orchestrator = SyncOrchestrator(hosts, args.action, workers=args.workers, timeout=args.timeout,
+                                    token=args.token or app.config.get("agent_token"))
+    summary = asyncio.run(orchestrator.run(emit))
+    emit({"summary": summary})
+    return 0 if summary["failed"] == 0 else 1
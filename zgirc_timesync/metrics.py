@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标：计数器、仪表、直方图、注册表和/metrics HTTP服务
+指标本身由app定义；http.server只在启用运行指标时才导入
+"""
+
+import json
+import time
+import logging
+import threading
+
+
+def _format_metric_value(value):
+    """
+    按Prometheus文本格式输出数值
+    """
+    if isinstance(value, int):
+        return str(value)
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    """
+    转义标签值中的反斜杠、双引号和换行
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """
+    指标基类
+    每组标签值对应一条时间序列；未启用时记录操作只检查一次enabled就返回，热路径上几乎没有开销
+    """
+    
+    kind = None
+    
+    def __init__(self, name, help, labels=()):
+        """
+        name: 指标名（Prometheus命名规则）
+        help: 说明
+        labels: 标签名元组，记录时按相同顺序传入标签值
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.enabled = False
+        self.series = {}    # 标签值元组 -> 数据
+        self._lock = threading.Lock()
+    
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in pairs) + "}"
+    
+    def family(self, openmetrics=False):
+        """
+        指标族名：OpenMetrics中计数器的族名不带_total后缀
+        """
+        if openmetrics and self.kind == "counter" and self.name.endswith("_total"):
+            return self.name[:-len("_total")]
+        return self.name
+    
+    def expose(self, openmetrics=False):
+        """
+        返回：文本格式的行列表（含HELP和TYPE）
+        """
+        family = self.family(openmetrics)
+        lines = [f"# HELP {family} {self.help}", f"# TYPE {family} {self.kind}"]
+        with self._lock:
+            series = sorted(self.series.items())
+            for values, data in series:
+                lines.extend(self._expose_series(values, data))
+        return lines
+    
+    def _expose_series(self, values, data):
+        return [f"{self.name}{self._label_text(values)} {_format_metric_value(data)}"]
+    
+    def snapshot(self):
+        """
+        返回：JSON快照{"type", "help", "series": [{"labels", ...}]}
+        """
+        with self._lock:
+            series = [dict(self._snapshot_series(data), labels=dict(zip(self.labels, values)))
+                      for values, data in sorted(self.series.items())]
+        return {"type": self.kind, "help": self.help, "series": series}
+    
+    def _snapshot_series(self, data):
+        return {"value": data}
+
+
+class Counter(Metric):
+    """
+    计数器：只增不减
+    """
+    
+    kind = "counter"
+    
+    def inc(self, *values, amount=1):
+        """
+        values: 标签值
+        amount: 增加量
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    仪表：记录最新值
+    """
+    
+    kind = "gauge"
+    
+    def set(self, value, *values):
+        """
+        value: 新值
+        values: 标签值
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.series[values] = value
+
+
+class Histogram(Metric):
+    """
+    直方图：按固定分桶计数，另记总和与次数，可在Prometheus中计算分位数
+    """
+    
+    kind = "histogram"
+    
+    def __init__(self, name, help, buckets, labels=()):
+        """
+        buckets: 递增的分桶上限（不含+Inf）
+        """
+        from bisect import bisect_left
+        
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._bisect = bisect_left
+    
+    def observe(self, value, *values):
+        """
+        value: 观测值
+        values: 标签值
+        """
+        if not self.enabled:
+            return
+        # le为闭区间：value <= 上限时落入该桶
+        index = self._bisect(self.buckets, value)
+        with self._lock:
+            data = self.series.get(values)
+            if data is None:
+                data = self.series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][index] += 1
+            data[1] += value
+    
+    def _cumulative(self, counts):
+        total = 0
+        for upper, count in zip(self.buckets + (float('inf'),), counts):
+            total += count
+            yield upper, total
+    
+    def _expose_series(self, values, data):
+        counts, total = data
+        lines = [f"{self.name}_bucket{self._label_text(values, [('le', _format_metric_value(upper))])} {count}"
+                 for upper, count in self._cumulative(counts)]
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_format_metric_value(total)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {sum(counts)}")
+        return lines
+    
+    def _snapshot_series(self, data):
+        counts, total = data
+        return {"count": sum(counts), "sum": total,
+                "buckets": [[_format_metric_value(upper), count] for upper, count in self._cumulative(counts)]}
+
+
+class MetricsRegistry:
+    """
+    指标注册表：统一启用/关闭，生成Prometheus/OpenMetrics文本和JSON快照
+    """
+    
+    def __init__(self, version=None):
+        """
+        version: 程序版本，写入JSON快照
+        """
+        self.version = version
+        self.metrics = []
+        self.enabled = False
+        self.started = time.time()
+    
+    def _add(self, metric):
+        metric.enabled = self.enabled
+        self.metrics.append(metric)
+        return metric
+    
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+    
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+    
+    def histogram(self, name, help, buckets, labels=()):
+        return self._add(Histogram(name, help, buckets, labels))
+    
+    def enable(self, enabled=True):
+        """
+        启用或关闭所有指标，关闭后已有数据保留
+        """
+        self.enabled = enabled
+        for metric in self.metrics:
+            metric.enabled = enabled
+    
+    def render(self, openmetrics=False):
+        """
+        返回：Prometheus文本格式（0.0.4），openmetrics为True时为OpenMetrics 1.0格式
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+    
+    def snapshot(self):
+        """
+        返回：JSON快照{"version", "enabled", "started", "time", "metrics": {指标名: ...}}
+        """
+        return {
+            "version": self.version,
+            "enabled": self.enabled,
+            "started": self.started,
+            "time": time.time(),
+            "metrics": {metric.name: metric.snapshot() for metric in self.metrics},
+        }
+
+
+class MetricsServer:
+    """
+    在HTTP端口上提供运行指标，供Prometheus抓取
+    GET /metrics       Prometheus文本格式（Accept包含application/openmetrics-text时为OpenMetrics格式）
+    GET /metrics.json  JSON快照
+    """
+    
+    PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+    OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+    
+    def __init__(self, registry, host, port, logger=None):
+        """
+        registry: MetricsRegistry
+        host / port: 监听地址和端口（端口为0时自动分配）
+        logger: 日志对象
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.logger = logger or logging.getLogger(__name__)
+        self.address = None
+        self._httpd = None
+    
+    def start(self):
+        """
+        在后台线程中开始提供服务，监听失败时抛出OSError
+        """
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        
+        registry = self.registry
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+                    body = registry.render(openmetrics).encode('utf-8')
+                    content_type = server.OPENMETRICS_CONTENT_TYPE if openmetrics else server.PROMETHEUS_CONTENT_TYPE
+                elif path == '/metrics.json':
+                    body = json.dumps(registry.snapshot(), ensure_ascii=False).encode('utf-8')
+                    content_type = "application/json; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                # 抓取很频繁，不写入程序日志
+                pass
+        
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.address = self._httpd.server_address[:2]
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+局域网时间服务（serve子命令）
+只在运行serve时导入，图形界面和其他子命令启动时不需要加载这部分代码
+"""
+
+import time
+import struct
+import logging
+import threading
+
+from .app import (
+    NTP_MIN_DISPERSION, NTP_SERVE_PORT, NTP_SERVE_RATE, NTP_SERVE_BURST, NTP_SERVE_MAX_AGE,
+    NTP_SERVE_BATCH, NTP_SERVE_CLIENTS, _parse_server, _to_ntp_timestamp,
+)
+
+
+# ==================== 局域网时间服务 ====================
+
+class NTPServer:
+    """
+    局域网NTP服务器（fleet模式）
+    本机与上游同步后，为局域网内的其他电脑提供时间，避免每台电脑都去查询公网服务器而被限流
+    - 非阻塞UDP套接字直接挂在asyncio事件循环上，每次可读时批量收发多个请求
+      （Python没有recvmmsg，这是最接近的做法），不经过Transport/Protocol的逐包回调
+    - 响应的前24字节（标志、层级、根延迟、根离散度、参考标识、参考时间）预先生成，
+      每个请求只填入客户端的发送时间和本机的接收/发送时间
+    - 按客户端IP令牌桶限速，令牌耗尽时回复一次KoD RATE，之后直接丢弃，直到补充出新的令牌
+    - 本机同步过期或从未同步时以LI=3（未同步）响应，客户端会忽略本服务器
+    """
+    
+    PHI = 15e-6             # 本机时钟的频率容差（RFC 5905），根离散度随距上次同步的时间增长
+    POLL = 6                # 建议客户端的查询间隔（2的指数，秒）
+    PRECISION = -20         # 时钟精度（2的指数，秒），约1微秒
+    REFRESH = 16            # 重新生成响应模板（更新根离散度）的间隔（秒）
+    
+    def __init__(self, host='0.0.0.0', port=NTP_SERVE_PORT, rate=NTP_SERVE_RATE,
+                 burst=NTP_SERVE_BURST, max_age=NTP_SERVE_MAX_AGE, logger=None):
+        """
+        host / port: 监听地址，端口为0时随机分配
+        rate: 每个客户端每秒补充的令牌数，0表示不限速
+        burst: 每个客户端的令牌桶容量（允许的突发请求数）
+        max_age: 距上次同步超过该时间（秒）后视为未同步
+        logger: 日志对象
+        """
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.burst = burst
+        self.max_age = max_age
+        self.logger = logger or logging.getLogger(__name__)
+        self.address = None
+        self.stats = {"requests": 0, "replies": 0, "kod": 0, "limited": 0, "invalid": 0}
+        
+        self._reply = struct.Struct('!QQ')
+        self._source = None             # (上次同步时间, 层级, 根延迟, 根离散度, 参考标识)
+        self._templates = self._build_templates()
+        self._kod = self._build_kod()
+        self._clients = {}              # IP -> [令牌数, 上次请求时间, 是否已发送KoD]
+        self._sock = None
+    
+    # ---------- 响应模板 ----------
+    
+    @staticmethod
+    def _short(value):
+        """
+        秒 -> NTP 32位短格式
+        """
+        return min(max(int(value * 65536), 0), 0xFFFFFFFF)
+    
+    @staticmethod
+    def _ref_id(peer):
+        """
+        参考标识：上游服务器的IPv4地址，IPv6或无法解析时取地址MD5的前4字节（RFC 5905）
+        """
+        import socket
+        import hashlib
+        
+        host = peer.rpartition('/')[2] if '/' in peer else _parse_server(peer)[0]
+        try:
+            return socket.inet_aton(host)
+        except OSError:
+            return hashlib.md5(host.encode('utf-8')).digest()[:4]
+    
+    def update(self, estimate, samples=()):
+        """
+        本机与上游同步成功后调用（可在任意线程中调用），更新层级、根延迟等并重新生成模板
+        estimate: ClockEstimate
+        samples: 本轮的NTPSample列表，用于取上游服务器自己的根延迟和根离散度
+        """
+        peer = [sample for sample in samples if sample.server == estimate.peer]
+        upstream = min(peer, key=lambda sample: sample.delay) if peer else None
+        self._source = (
+            time.time(),
+            min(estimate.stratum + 1, 15),
+            (upstream.root_delay if upstream else 0.0) + estimate.delay,
+            (upstream.root_dispersion if upstream else 0.0) + estimate.jitter + NTP_MIN_DISPERSION,
+            self._ref_id(estimate.peer),
+        )
+        self._templates = self._build_templates()
+    
+    def _build_templates(self):
+        """
+        按客户端的协议版本（1~4）生成响应的前24字节
+        """
+        source = self._source
+        if source is None or time.time() - source[0] > self.max_age:
+            leap, stratum, root_delay, root_dispersion, ref_id, ref_time = 3, 16, 0.0, 0.0, b'INIT', 0
+        else:
+            synced_at, stratum, root_delay, root_dispersion, ref_id = source
+            leap = 0
+            root_dispersion += self.PHI * (time.time() - synced_at)
+            ref_time = _to_ntp_timestamp(int(synced_at * 1e9))
+        return [struct.pack('!BBbbII4sQ', (leap << 6) | (version << 3) | 4, stratum, self.POLL,
+                            self.PRECISION, self._short(root_delay), self._short(root_dispersion),
+                            ref_id, ref_time)
+                for version in range(8)]
+    
+    def _build_kod(self):
+        return [struct.pack('!BBbbII4sQ', (3 << 6) | (version << 3) | 4, 0, self.POLL,
+                            self.PRECISION, 0, 0, b'RATE', 0)
+                for version in range(8)]
+    
+    @property
+    def synchronized(self):
+        return self._templates[4][0] >> 6 != 3
+    
+    # ---------- 限速 ----------
+    
+    def _allow(self, host, now):
+        """
+        令牌桶限速
+        返回：True=响应，"kod"=回复KoD，False=丢弃
+        """
+        entry = self._clients.get(host)
+        if entry is None:
+            if len(self._clients) >= NTP_SERVE_CLIENTS:
+                self._expire_clients(now)
+            self._clients[host] = [self.burst - 1, now, False]
+            return True
+        
+        tokens = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+        entry[1] = now
+        if tokens >= 1:
+            entry[0] = tokens - 1
+            entry[2] = False
+            return True
+        entry[0] = tokens
+        if entry[2]:
+            return False
+        entry[2] = True
+        return "kod"
+    
+    def _expire_clients(self, now):
+        """
+        客户端过多时丢弃令牌桶已满（长时间没有请求）的记录，限制内存占用
+        """
+        idle = self.burst / self.rate
+        self._clients = {host: entry for host, entry in self._clients.items() if now - entry[1] < idle}
+        if len(self._clients) >= NTP_SERVE_CLIENTS:
+            self._clients.clear()
+    
+    # ---------- 收发 ----------
+    
+    def _on_readable(self):
+        """
+        套接字可读时批量处理请求，直到没有待处理的数据或处理满一批
+        """
+        sock = self._sock
+        buffer, view = self._buffer, self._view
+        reply = self._reply_buffer
+        pack_into = self._reply.pack_into
+        stats = self.stats
+        limited = self.rate > 0
+        
+        for _ in range(NTP_SERVE_BATCH):
+            try:
+                size, address = sock.recvfrom_into(buffer)
+            except BlockingIOError:
+                return
+            except OSError:
+                # Windows上之前的响应收到ICMP端口不可达时recvfrom会报错，忽略继续
+                continue
+            received = _to_ntp_timestamp(time.time_ns())
+            stats["requests"] += 1
+            
+            flags = buffer[0]
+            version = (flags >> 3) & 0x07
+            if size < 48 or flags & 0x07 != 3 or not 1 <= version <= 4:
+                stats["invalid"] += 1
+                continue
+            
+            templates = self._templates
+            if limited:
+                allowed = self._allow(address[0], time.monotonic())
+                if not allowed:
+                    stats["limited"] += 1
+                    continue
+                if allowed == "kod":
+                    stats["kod"] += 1
+                    templates = self._kod
+            
+            reply[0:24] = templates[version]
+            reply[24:32] = view[40:48]
+            pack_into(reply, 32, received, _to_ntp_timestamp(time.time_ns()))
+            try:
+                sock.sendto(reply, address)
+                stats["replies"] += 1
+            except OSError:
+                stats["limited"] += 1
+    
+    def _open(self):
+        import socket
+        
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((self.host, self.port))
+        sock.setblocking(False)
+        self.address = sock.getsockname()[:2]
+        self._buffer = bytearray(1024)
+        self._view = memoryview(self._buffer)
+        self._reply_buffer = bytearray(48)
+        self._sock = sock
+        return sock
+    
+    def run(self, stop, ready=None):
+        """
+        在调用线程中运行服务，直到stop（threading.Event）被置位
+        ready: 开始监听后置位的threading.Event
+        """
+        import asyncio
+        
+        # Windows默认的Proactor事件循环不支持add_reader，固定使用Selector事件循环
+        loop = asyncio.SelectorEventLoop()
+        sock = self._open()
+        loop.add_reader(sock.fileno(), self._on_readable)
+        self.logger.info(f"NTP服务已启动: {self.address[0]}:{self.address[1]}")
+        
+        def tick(count=0):
+            if stop.is_set():
+                loop.stop()
+                return
+            # 每REFRESH秒更新一次根离散度
+            if count and not count % self.REFRESH:
+                self._templates = self._build_templates()
+            loop.call_later(1, tick, count + 1)
+        
+        tick()
+        if ready is not None:
+            ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.remove_reader(sock.fileno())
+            loop.close()
+            sock.close()
+            self.logger.info(f"NTP服务已停止，请求 {self.stats['requests']} 个，"
+                             f"响应 {self.stats['replies']} 个，限速 {self.stats['limited']} 个")
+
+
+# ==================== 命令行 ====================
+
+def cmd_serve(app, args):
+    """
+    serve子命令：按自适应间隔与上游同步，同时在UDP端口上为局域网提供时间，收到SIGINT/SIGTERM时退出
+    其他电脑把config.json中的ntp_servers设为本机地址即可
+    """
+    import signal
+    
+    server = NTPServer(args.host, args.port, rate=args.rate, burst=args.burst, logger=app.logger)
+    stop = threading.Event()
+    for name in ('SIGINT', 'SIGTERM'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stop.set())
+    
+    def on_round(result, datetime_str):
+        if result == "success":
+            server.update(app.last_estimate, app.last_samples)
+    
+    app.start_auto_sync(callback=on_round)
+    try:
+        server.run(stop)
+    except OSError as e:
+        print(f"无法监听 {args.host}:{args.port}: {e}")
+        return 1
+    finally:
+        app.stop_auto_sync()
+    return 0